@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a manager to upload files to a FTP server over a pool of persistent connections.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import queue
+import threading
+import time
+from ftplib import FTP
+
+
+class FtpTransferManager:
+    """ Uploads files to a directory of a FTP server in the background.
+
+    Every one of number_of_connections worker threads keeps its own FTP connection open, so the
+    files are transferred in parallel without logging in for every file. A connection which
+    failed is opened again for one retry of the transfer.
+
+    upload only queues the files and returns immediately, so files can be passed as soon as they
+    are written (e.g. while the next files are sampled). A file is identified by its name, size
+    and modification time. It is not transferred again if the same version was transferred
+    before or is still queued, so uploading all files of an asset after passing some of them
+    earlier only waits for the remaining transfers.
+
+    The connections are created by the callable connect (without arguments), which returns a
+    logged in object with the storbinary method of ftplib.FTP in the target directory. By default
+    ftplib.FTP is used; a stand-in can be passed for tests without FTP server.
+
+    The FTP connections use a socket timeout, so a stalled server fails the transfer instead of
+    blocking a worker forever. wait and close accept a timeout as well.
+    """
+
+    def __init__(self, host, user='anonymous', passwd='anonymous@', directory='',
+                 number_of_connections=2, blocksize=1048576, timeout=30, connect=None):
+        """
+        @param str host: address of the FTP server
+        @param str user: login name
+        @param str passwd: password
+        @param str directory: directory on the server the files are uploaded to
+        @param int number_of_connections: number of parallel connections
+        @param int blocksize: number of bytes sent at once
+        @param float timeout: timeout of the FTP connections in seconds
+        @param callable connect: optional, creates a logged in connection in the target directory
+        """
+        self.host = host
+        self.user = user
+        self.passwd = passwd
+        self.directory = directory
+        self.blocksize = int(blocksize)
+        self.timeout = float(timeout)
+        self._connect = self._connect_ftp if connect is None else connect
+
+        self._transfer_queue = queue.Queue()
+        self._condition = threading.Condition()
+        # versions (size, modification time) of the queued and of the transferred files by name
+        self._pending = dict()
+        self._transferred = dict()
+        self._errors = dict()
+        # statistics, the busy time is the time with at least one running transfer
+        self._active_transfers = 0
+        self._busy_since = 0.0
+        self._busy_time = 0.0
+        self._transferred_files = 0
+        self._transferred_bytes = 0
+
+        self._workers = []
+        for index in range(max(int(number_of_connections), 1)):
+            worker = threading.Thread(target=self._transfer_loop, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def upload(self, filepaths):
+        """ Queue files for the transfer to the server.
+
+        @param list filepaths: paths of the files on the host
+
+        @return list: names of the files on the server
+        """
+        names = []
+        for filepath in filepaths:
+            name = os.path.basename(filepath)
+            names.append(name)
+            version = self._get_version(filepath)
+            with self._condition:
+                if version is None:
+                    self._transferred.pop(name, None)
+                    self._errors[name] = FileNotFoundError('No file {0}.'.format(filepath))
+                    continue
+                if self._transferred.get(name) == version or self._pending.get(name) == version:
+                    continue
+                self._transferred.pop(name, None)
+                self._errors.pop(name, None)
+                self._pending[name] = version
+            self._transfer_queue.put((filepath, name, version))
+        return names
+
+    def wait(self, names, timeout=None):
+        """ Wait until the transfers of files are finished.
+
+        @param list names: names of the files on the server
+        @param float timeout: optional, maximum time to wait in seconds
+
+        @return dict: the errors of the failed transfers by file name. The files still running
+                      after the timeout are included with a TimeoutError.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not any(name in self._pending for name in names),
+                                     timeout)
+            errors = dict()
+            for name in names:
+                if name in self._pending:
+                    errors[name] = TimeoutError('Transfer of {0} not finished.'.format(name))
+                elif name in self._errors:
+                    errors[name] = self._errors[name]
+        return errors
+
+    def forget(self, names):
+        """ Forget the transfer of files, e.g. after they were deleted on the server, so they are
+        transferred again by the next upload.
+
+        @param list names: names of the files on the server
+        """
+        with self._condition:
+            for name in names:
+                self._transferred.pop(name, None)
+        return
+
+    def get_statistics(self):
+        """ Get the statistics of all transfers.
+
+        @return dict: number of transferred 'files' and 'bytes', 'busy_time' in seconds (with at
+                      least one running transfer) and 'throughput' in bytes/s during busy time
+        """
+        with self._condition:
+            busy_time = self._busy_time
+            if self._active_transfers > 0:
+                busy_time += time.perf_counter() - self._busy_since
+            statistics = {'files': self._transferred_files,
+                          'bytes': self._transferred_bytes,
+                          'busy_time': busy_time}
+        if busy_time > 0:
+            statistics['throughput'] = statistics['bytes'] / busy_time
+        else:
+            statistics['throughput'] = 0.0
+        return statistics
+
+    def close(self, timeout=None):
+        """ Finish the queued transfers and close the connections.
+
+        @param float timeout: optional, maximum time to wait for the transfers in seconds
+
+        @return bool: True if all workers finished, False if some were left running after the
+                      timeout. These are daemon threads and stop with the interpreter.
+        """
+        for worker in self._workers:
+            self._transfer_queue.put(None)
+        if timeout is not None:
+            end_time = time.perf_counter() + timeout
+        finished = True
+        for worker in self._workers:
+            if timeout is None:
+                worker.join()
+            else:
+                worker.join(max(end_time - time.perf_counter(), 0.0))
+            finished = finished and not worker.is_alive()
+        self._workers = []
+        return finished
+
+    def _get_version(self, filepath):
+        """ Get the version of a file on the host.
+
+        @param str filepath: path of the file
+
+        @return tuple: size and modification time in ns, None if the file does not exist
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _connect_ftp(self):
+        """ Open a FTP connection to the target directory.
+
+        @return ftplib.FTP: the logged in connection
+        """
+        connection = FTP(self.host, timeout=self.timeout)
+        connection.login(user=self.user, passwd=self.passwd)
+        if self.directory:
+            connection.cwd(self.directory)
+        return connection
+
+    def _close_connection(self, connection):
+        """ Close a connection, ignoring errors of broken connections.
+
+        @param connection: the connection to close or None
+        """
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return
+
+    def _transfer_loop(self):
+        """ Transfers the queued files over one connection. Runs in a worker thread. """
+        connection = None
+        while True:
+            task = self._transfer_queue.get()
+            if task is None:
+                self._close_connection(connection)
+                return
+            filepath, name, version = task
+            with self._condition:
+                # skip versions replaced by a newer one in the meantime
+                if self._pending.get(name) != version:
+                    continue
+                if self._active_transfers == 0:
+                    self._busy_since = time.perf_counter()
+                self._active_transfers += 1
+
+            error = None
+            for attempt in range(2):
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    with open(filepath, 'rb') as upload_file:
+                        connection.storbinary('STOR ' + name, upload_file, self.blocksize)
+                    error = None
+                    break
+                except Exception as e:
+                    # open a new connection for the retry
+                    error = e
+                    self._close_connection(connection)
+                    connection = None
+
+            with self._condition:
+                self._active_transfers -= 1
+                if self._active_transfers == 0:
+                    self._busy_time += time.perf_counter() - self._busy_since
+                if self._pending.get(name) == version:
+                    del self._pending[name]
+                    if error is None:
+                        self._transferred[name] = version
+                        self._transferred_files += 1
+                        self._transferred_bytes += version[0]
+                    else:
+                        self._errors[name] = error
+                self._condition.notify_all()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains an accumulator for the histograms (time traces) of fast counters.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+
+
+def rebin(histogram, factor, out=None):
+    """ Sum up groups of neighbouring bins along the last axis of a histogram.
+
+    @param numpy.ndarray histogram: the histogram, 1D or 2D (e.g. gate, bin)
+    @param int factor: number of bins summed up into one bin. Remaining bins at the end, which do
+                       not fill a whole group, are dropped.
+    @param numpy.ndarray out: optional, uint64 array the result is written to
+
+    @return numpy.ndarray: the rebinned histogram (dtype = uint64)
+    """
+    factor = int(factor)
+    number_of_bins = histogram.shape[-1] // factor
+    # splitting the last axis gives a view, no matter if the histogram is truncated
+    grouped = histogram[..., :number_of_bins * factor].reshape(
+        histogram.shape[:-1] + (number_of_bins, factor))
+    return np.sum(grouped, axis=-1, dtype=np.uint64, out=out)
+
+
+class HistogramAccumulator:
+    """ Accumulates the histograms of a fast counter without copying them.
+
+    Fast counters accumulate the histogram in hardware, so every new trace replaces the previous
+    one. The accumulator adds an offset of uint64 counts to the newest trace, which holds
+      - merged histograms, e.g. the stashed raw data of earlier measurements, and
+      - the counts of the traces before a restart of the hardware histogram (e.g. after an
+        overflow). A restart is detected by bins decreasing from one trace to the next.
+
+    The newest trace is only referenced. Merging a histogram only references it as well (it is
+    copied when a restart has to be added to it), so merging is O(1). The full resolution sum
+    and the rebinned sum (rebin_factor neighbouring bins summed up) are computed lazily into
+    reused arrays, the rebinned offset only once per change of the offset. So analyzing the
+    rebinned histogram never adds the offset at full resolution.
+
+    The returned histograms must not be modified and are only valid until the next update.
+    """
+
+    def __init__(self, rebin_factor=1, shape=(0, )):
+        """
+        @param int rebin_factor: number of bins summed up into one bin of the rebinned histogram
+        @param tuple shape: shape of the zero histogram returned before the first trace
+        """
+        self.rebin_factor = max(int(rebin_factor), 1)
+        self._shape = tuple(shape)
+        self.reset()
+
+    def reset(self):
+        """ Forget the trace and the offset. """
+        self._trace = None
+        self._offset = None
+        # a merged histogram is used as offset until a restart has to be added
+        self._offset_is_shared = False
+        self._total = None
+        self._total_valid = False
+        self._binned = None
+        self._binned_valid = False
+        self._binned_offset = None
+        # number of detected restarts of the hardware histogram
+        self.restarts = 0
+        return
+
+    def set_rebin_factor(self, factor):
+        """ Change the number of bins summed up into one bin of the rebinned histogram.
+
+        @param int factor: the new rebin factor
+
+        @return int: the rebin factor set
+        """
+        self.rebin_factor = max(int(factor), 1)
+        self._binned = None
+        self._binned_valid = False
+        self._binned_offset = None
+        return self.rebin_factor
+
+    def merge(self, histogram):
+        """ Add a histogram to the offset, e.g. the raw data of an earlier measurement.
+
+        @param numpy.ndarray histogram: histogram of the shape of the traces. It is referenced,
+                                        not copied, and must not be modified afterwards.
+        """
+        if self._offset is None:
+            self._offset = histogram
+            self._offset_is_shared = True
+        else:
+            self._add_to_offset(histogram)
+        self._total_valid = False
+        self._binned_valid = False
+        self._binned_offset = None
+        return
+
+    def update(self, trace):
+        """ Replace the trace by a newer one of the fast counter.
+
+        @param numpy.ndarray trace: the new trace, which is referenced and must not be modified
+                                    until it is replaced by the next update
+
+        @return numpy.ndarray: the previous trace, which is not referenced anymore, or None
+        """
+        if self._offset is not None and self._offset.shape != trace.shape:
+            raise ValueError('Shape {0} of the trace does not fit the shape {1} of the '
+                             'accumulated histogram.'.format(trace.shape, self._offset.shape))
+        previous = self._trace
+        if (previous is not None and previous.shape == trace.shape
+                and np.any(trace < previous)):
+            # the hardware histogram was restarted, keep the counts acquired before
+            self._add_to_offset(previous)
+            self.restarts += 1
+        self._trace = trace
+        self._shape = trace.shape
+        self._total_valid = False
+        self._binned_valid = False
+        return previous
+
+    def get_histogram(self):
+        """ Get the accumulated histogram at full resolution.
+
+        @return numpy.ndarray: the sum of the newest trace and the offset
+        """
+        if self._trace is None:
+            if self._offset is None:
+                return np.zeros(self._shape, dtype=np.uint64)
+            return self._offset
+        if self._offset is None:
+            return self._trace
+        if not self._total_valid:
+            if self._total is None or self._total.shape != self._trace.shape:
+                self._total = np.empty(self._trace.shape, dtype=np.uint64)
+            np.add(self._offset, self._trace, out=self._total, dtype=np.uint64,
+                   casting='unsafe')
+            self._total_valid = True
+        return self._total
+
+    def get_binned_histogram(self):
+        """ Get the accumulated histogram rebinned by rebin_factor.
+
+        @return numpy.ndarray: the rebinned sum of the newest trace and the offset, the full
+                               resolution histogram for a rebin factor of 1
+        """
+        if self.rebin_factor == 1:
+            return self.get_histogram()
+        if self._trace is None:
+            return rebin(self.get_histogram(), self.rebin_factor)
+        if not self._binned_valid:
+            binned_shape = self._trace.shape[:-1] + (self._trace.shape[-1] // self.rebin_factor, )
+            if self._binned is None or self._binned.shape != binned_shape:
+                self._binned = np.empty(binned_shape, dtype=np.uint64)
+            rebin(self._trace, self.rebin_factor, out=self._binned)
+            if self._offset is not None:
+                if self._binned_offset is None:
+                    self._binned_offset = rebin(self._offset, self.rebin_factor)
+                self._binned += self._binned_offset
+            self._binned_valid = True
+        return self._binned
+
+    def _add_to_offset(self, histogram):
+        """ Add a histogram to an own uint64 offset.
+
+        @param numpy.ndarray histogram: the histogram to add
+        """
+        if self._offset is None:
+            self._offset = histogram.astype(np.uint64)
+        else:
+            if self._offset_is_shared:
+                self._offset = self._offset.astype(np.uint64)
+            np.add(self._offset, histogram, out=self._offset, dtype=np.uint64, casting='unsafe')
+        self._offset_is_shared = False
+        self._binned_offset = None
+        return
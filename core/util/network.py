@@ -29,3 +29,12 @@ def netobtain(obj):
         return rpyc.utils.classic.obtain(obj)
     else:
         return obj
+
+def is_netref(obj):
+    """ Check whether an object is only a reference to an object on a remote machine.
+
+    @param obj: the object
+
+    @return bool: True for a remote object, whose attributes are accessed via the network
+    """
+    return isinstance(obj, rpyc.core.netref.BaseNetref)
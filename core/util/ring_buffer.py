@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a ring buffer for data traces and a streaming running median.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+from bisect import bisect_left, insort
+from collections import deque
+
+
+class RingBuffer:
+    """ Trace of fixed length in a preallocated ring buffer.
+
+    Appending a value overwrites the oldest one without moving any other data. A contiguous
+    copy of the trace in chronological order (oldest value first) is only created on request
+    by get_trace and reused until the trace changes. The values can also be arrays of a fixed
+    shape, e.g. the lines of a matrix.
+    """
+    def __init__(self, length, dtype=float, initial_value=0, value_shape=()):
+        """
+        @param int length: number of values in the trace
+        @param dtype: numpy data type of the values
+        @param initial_value: value the trace is filled with initially
+        @param tuple value_shape: shape of a single value, () for scalar values
+        """
+        self._buffer = np.full((int(length), ) + tuple(value_shape), initial_value, dtype=dtype)
+        # index of the oldest value, which is overwritten next
+        self._next_index = 0
+        # incremented on every change, the cached trace is valid for one version
+        self._version = 0
+        self._trace_cache = None
+
+    @classmethod
+    def from_array(cls, trace):
+        """ Create a ring buffer containing a trace.
+
+        @param numpy.ndarray trace: the trace in chronological order along the first axis
+
+        @return RingBuffer: ring buffer with the length, data type and value shape of trace
+        """
+        trace = np.asarray(trace)
+        ring_buffer = cls(trace.shape[0], dtype=trace.dtype, value_shape=trace.shape[1:])
+        ring_buffer._buffer[:] = trace
+        ring_buffer._version += 1
+        return ring_buffer
+
+    def __len__(self):
+        return self._buffer.shape[0]
+
+    def append(self, value):
+        """ Append a value to the trace and drop the oldest one.
+
+        @param value: the new value
+        """
+        self._buffer[self._next_index] = value
+        self._next_index = (self._next_index + 1) % len(self)
+        self._version += 1
+        return
+
+    def extend(self, values):
+        """ Append several values to the trace and drop as many of the oldest ones.
+
+        @param numpy.ndarray values: the new values in chronological order along the first axis
+        """
+        values = np.asarray(values)
+        length = len(self)
+        number = values.shape[0]
+        if number >= length:
+            self._buffer[:] = values[-length:]
+            self._next_index = 0
+            self._version += 1
+            return
+        first_part = min(number, length - self._next_index)
+        self._buffer[self._next_index:self._next_index + first_part] = values[:first_part]
+        self._buffer[:number - first_part] = values[first_part:]
+        self._next_index = (self._next_index + number) % length
+        self._version += 1
+        return
+
+    def set_last(self, number, value):
+        """ Overwrite the newest values of the trace.
+
+        @param int number: number of values to overwrite
+        @param value: the value to set
+        """
+        number = min(int(number), len(self))
+        indices = (self._next_index - 1 - np.arange(number)) % len(self)
+        self._buffer[indices] = value
+        self._version += 1
+        return
+
+    def get_last(self, number):
+        """ Get a copy of the newest values of the trace in chronological order.
+
+        @param int number: number of values
+
+        @return numpy.ndarray: the newest values
+        """
+        number = min(int(number), len(self))
+        indices = (self._next_index - number + np.arange(number)) % len(self)
+        return self._buffer[indices]
+
+    def get_trace(self):
+        """ Get a contiguous copy of the whole trace in chronological order.
+
+        The copy is created once after every change of the trace, further calls return the same
+        array. Therefore it is read-only.
+
+        @return numpy.ndarray: the trace, oldest value first
+        """
+        trace_cache = self._trace_cache
+        if trace_cache is not None and trace_cache[0] == self._version:
+            return trace_cache[1]
+        # a change during the copy leaves the cache outdated, so it is only used once
+        version = self._version
+        trace = np.concatenate((self._buffer[self._next_index:],
+                                self._buffer[:self._next_index]))
+        trace.setflags(write=False)
+        self._trace_cache = (version, trace)
+        return trace
+
+
+class RunningMedian:
+    """ Median of the last window_length values of a stream of values.
+
+    The values of the window are kept sorted, so an update only needs one insertion and one
+    removal instead of sorting the whole window. The median of an even number of values is the
+    mean of the two middle values (like numpy.median).
+    """
+    def __init__(self, window_length, initial_value=0.):
+        """
+        @param int window_length: number of values the median is taken of
+        @param float initial_value: value the window is filled with initially
+        """
+        window_length = max(int(window_length), 1)
+        self._window = deque([initial_value] * window_length)
+        self._sorted_window = [initial_value] * window_length
+
+    def update(self, value):
+        """ Add a new value to the window and drop the oldest one.
+
+        @param float value: the new value. Non-finite values (e.g. NaN after a read error) are
+                            ignored, they would break the order of the sorted window.
+
+        @return float: the median of the updated window
+        """
+        if not np.isfinite(value):
+            return self.get_median()
+        oldest_value = self._window.popleft()
+        self._window.append(value)
+        del self._sorted_window[bisect_left(self._sorted_window, oldest_value)]
+        insort(self._sorted_window, value)
+        return self.get_median()
+
+    def get_median(self):
+        """ Median of the current window.
+
+        @return float: the median
+        """
+        middle = len(self._sorted_window) // 2
+        if len(self._sorted_window) % 2 == 1:
+            return self._sorted_window[middle]
+        return (self._sorted_window[middle - 1] + self._sorted_window[middle]) / 2
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a recorder to stream rows of data to an append-only binary file.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+import queue
+import struct
+import threading
+
+
+class StreamRecorder:
+    """ Records rows of numbers of arbitrary count to a .npy file with constant memory usage.
+
+    The rows are collected in chunks of chunk_length rows. Full chunks are written to the file by
+    a background thread, so appending never waits for the disk unless max_pending_chunks chunks
+    are waiting to be written. The file is a valid .npy file (2D array with one row per recorded
+    row), which can be read with numpy.load. The header is updated after every written chunk,
+    so the file contains all written rows even if the recording was never finalized (e.g. after
+    a crash). All rows are in the file as soon as finalize has been called.
+
+    append, flush, get_last_rows, get_row_count and finalize can be called from different
+    threads.
+    """
+    # Header length in bytes reserved for the .npy header. Large enough for any row count, so
+    # the header can be rewritten in place on finalize.
+    _header_length = 128
+
+    def __init__(self, filepath, number_of_columns, dtype='float64', chunk_length=4096,
+                 max_pending_chunks=16):
+        """
+        @param str filepath: path of the file to create
+        @param int number_of_columns: number of values per row
+        @param dtype: numpy data type of the values
+        @param int chunk_length: number of rows written to the file at once
+        @param int max_pending_chunks: maximum number of full chunks waiting to be written
+        """
+        self.filepath = filepath
+        self.number_of_columns = int(number_of_columns)
+        self.dtype = np.dtype(dtype)
+        self.chunk_length = int(chunk_length)
+        # number of rows passed to the writer thread
+        self.number_of_rows = 0
+        # number of rows written to the file, only used by the writer thread
+        self._written_rows = 0
+
+        self._chunk = np.empty((self.chunk_length, self.number_of_columns), dtype=self.dtype)
+        self._chunk_rows = 0
+        # protects the current chunk, which is replaced when it is passed to the writer thread
+        self._chunk_lock = threading.Lock()
+        self._file = open(self.filepath, 'wb')
+        self._file.write(self._get_header(0))
+        self._write_queue = queue.Queue(maxsize=max_pending_chunks)
+        self._write_error = None
+        self._writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer_thread.start()
+
+    def append(self, rows):
+        """ Append one or several rows.
+
+        @param numpy.ndarray rows: 1D array with one row or 2D array with one row per entry
+        """
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.number_of_columns)
+        with self._chunk_lock:
+            if self._file is None:
+                raise ValueError('Cannot append to the finalized recording {0}.'.format(
+                    self.filepath))
+            while rows.shape[0] > 0:
+                number_of_rows = min(rows.shape[0], self.chunk_length - self._chunk_rows)
+                self._chunk[self._chunk_rows:self._chunk_rows + number_of_rows] = \
+                    rows[:number_of_rows]
+                self._chunk_rows += number_of_rows
+                rows = rows[number_of_rows:]
+                if self._chunk_rows == self.chunk_length:
+                    self._flush_chunk()
+        return
+
+    def flush(self):
+        """ Pass all appended rows to the writer thread, also if the current chunk is not full.
+        """
+        with self._chunk_lock:
+            if self._file is not None and self._chunk_rows > 0:
+                self._flush_chunk()
+        return
+
+    def get_last_rows(self, number):
+        """ Get the newest rows which have not been passed to the writer thread yet.
+
+        @param int number: maximum number of rows
+
+        @return numpy.ndarray: 2D array, copy of at most number rows (less after a chunk was
+                               completed)
+        """
+        with self._chunk_lock:
+            start = max(self._chunk_rows - int(number), 0)
+            return self._chunk[start:self._chunk_rows].copy()
+
+    def get_row_count(self):
+        """ Get the number of all appended rows, including the ones not passed to the writer
+        thread yet.
+
+        @return int: number of rows
+        """
+        with self._chunk_lock:
+            return self.number_of_rows + self._chunk_rows
+
+    def finalize(self):
+        """ Write all remaining rows, complete the file header and close the file.
+
+        @return int: total number of rows in the file
+        """
+        with self._chunk_lock:
+            if self._file is None:
+                return self.number_of_rows
+            if self._chunk_rows > 0:
+                self._flush_chunk()
+            self._write_queue.put(None)
+            self._writer_thread.join()
+            self._file.seek(0)
+            self._file.write(self._get_header(self.number_of_rows))
+            self._file.close()
+            self._file = None
+        if self._write_error is not None:
+            raise self._write_error
+        return self.number_of_rows
+
+    def _flush_chunk(self):
+        """ Pass the current chunk to the writer thread and start a new one. Must be called with
+        the chunk lock held.
+        """
+        if self._write_error is not None:
+            raise self._write_error
+        self._write_queue.put(self._chunk[:self._chunk_rows])
+        self.number_of_rows += self._chunk_rows
+        self._chunk = np.empty((self.chunk_length, self.number_of_columns), dtype=self.dtype)
+        self._chunk_rows = 0
+        return
+
+    def _write_loop(self):
+        """ Writes the chunks from the queue to the file. Runs in the writer thread. """
+        while True:
+            chunk = self._write_queue.get()
+            if chunk is None:
+                return
+            try:
+                self._file.write(chunk.tobytes())
+                self._written_rows += chunk.shape[0]
+                # keep the header up to date, so the file is complete up to here
+                self._file.seek(0)
+                self._file.write(self._get_header(self._written_rows))
+                self._file.seek(0, 2)
+                self._file.flush()
+            except Exception as e:
+                self._write_error = e
+
+    def _get_header(self, number_of_rows):
+        """ Create the .npy (version 1.0) header for a given number of rows.
+
+        @param int number_of_rows: number of rows in the file
+
+        @return bytes: the header of length _header_length
+        """
+        header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1}, {2}), }}".format(
+            self.dtype.str, number_of_rows, self.number_of_columns)
+        # magic string (8 bytes) + header length (2 bytes) + header padded with spaces + newline
+        header = header.ljust(self._header_length - 10 - 1) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
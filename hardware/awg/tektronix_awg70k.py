@@ -29,6 +29,7 @@ from collections import OrderedDict
 from fnmatch import fnmatch
 
 from core.base import Base
+from core.util.ftp_transfer import FtpTransferManager
 from interface.pulser_interface import PulserInterface
 
 class AWG70K(Base, PulserInterface):
@@ -94,6 +95,21 @@ class AWG70K(Base, PulserInterface):
             self.user = config['ftp_login']
             self.passwd = config['ftp_passwd']
 
+        # number of parallel FTP connections for the upload of the waveform files
+        if 'ftp_connections' in config.keys():
+            self._ftp_connections = int(config['ftp_connections'])
+        else:
+            self._ftp_connections = 2
+
+        # timeout of the FTP connections and maximum time to wait for the upload of an asset (s)
+        if 'ftp_timeout' in config.keys():
+            self._ftp_timeout = float(config['ftp_timeout'])
+        else:
+            self._ftp_timeout = 30
+        if 'upload_timeout' in config.keys():
+            self._upload_timeout = float(config['upload_timeout'])
+        else:
+            self._upload_timeout = 600
 
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
@@ -123,6 +139,7 @@ class AWG70K(Base, PulserInterface):
         self.ftp = FTP(self.ip_address)
         self.ftp.login(user=self.user, passwd=self.passwd)
         self.ftp.cwd(self.asset_directory)
+        self._transfer_manager = self._create_transfer_manager()
 
         self.connected = True
 
@@ -156,6 +173,9 @@ class AWG70K(Base, PulserInterface):
         self.tell('\n')
         self.soc.close()
         self.ftp.close()
+        if not self._transfer_manager.close(timeout=self._ftp_timeout):
+            self.log.warning('Transfers of waveform files to the AWG70k did not finish before '
+                             'the deactivation.')
 
         self.connected = False
         pass
@@ -319,6 +339,12 @@ class AWG70K(Base, PulserInterface):
         @return int: error code (0:OK, -1:error)
 
         If nothing is passed, method will be skipped.
+
+        The upload waits at most for the configured upload_timeout (default 600 s). Files passed
+        to transfer_files earlier are not sent again. The sequence generator passes the files of
+        an ensemble only after all of them are written, so sampling a single ensemble and
+        uploading it right away does not overlap the sampling with the transfer; only the
+        ensembles of a sequence are transferred while the next ones are sampled.
         """
         # check input
         if asset_name is None:
@@ -326,10 +352,6 @@ class AWG70K(Base, PulserInterface):
                     'that!\nCommand will be ignored.')
             return -1
 
-        # at first delete all the name, which might lead to confusions in the
-        # upload procedure:
-        self.delete_asset(asset_name)
-
         filelist = self._get_filenames_on_host()
         upload_names = []
         for filename in filelist:
@@ -340,10 +362,41 @@ class AWG70K(Base, PulserInterface):
             elif is_mat:
                 upload_names.append(filename)
                 break
-        # Transfer files
-        for filename in upload_names:
-            self._send_file(filename)
+        # Transfer files in parallel. Files already transferred by transfer_files (e.g. while
+        # sampling) are not sent again.
+        start_time = time.time()
+        self.transfer_files(upload_names)
 
+        # delete all other files of the asset, which might lead to confusions in the
+        # upload procedure:
+        self.delete_asset(asset_name, keep_files=upload_names)
+
+        errors = self._transfer_manager.wait(upload_names, timeout=self._upload_timeout)
+        for filename in errors:
+            self.log.error('Upload of file "{0}" to AWG70k failed: {1}'.format(filename,
+                                                                              errors[filename]))
+        if len(errors) > 0:
+            return -1
+        statistics = self._transfer_manager.get_statistics()
+        self.log.info('Files of asset "{0}" uploaded after {1:.2f} s. FTP throughput: '
+                      '{2:.1f} MB/s ({3:d} files, {4:.1f} MB in total).'
+                      ''.format(asset_name, time.time() - start_time,
+                                statistics['throughput'] / 1e6, statistics['files'],
+                                statistics['bytes'] / 1e6))
+        return 0
+
+    def transfer_files(self, filenames):
+        """ Start the transfer of sampled files to the device without waiting for it.
+
+        @param list filenames: names of the files in the host waveform directory
+
+        @return int: error code (0:OK, -1:error)
+
+        Not part of the PulserInterface. The files of an asset can be passed as soon as they are
+        written, upload_asset then only waits for their transfers to finish.
+        """
+        self._transfer_manager.upload([os.path.join(self.host_waveform_directory, filename)
+                                       for filename in filenames])
         return 0
 
     def load_asset(self, asset_name, load_dict=None):
@@ -465,15 +518,24 @@ class AWG70K(Base, PulserInterface):
         Unused for digital pulse generators without sequence storage capability
         (PulseBlaster, FPGA).
         """
-        filepath = os.path.join(self.host_waveform_directory, filename)
-
-        with FTP(self.ip_address) as ftp:
-            ftp.login(user=self.user,passwd=self.passwd) # login as default user anonymous, passwd anonymous@
-            ftp.cwd(self.asset_directory)
-            with open(filepath, 'rb') as uploaded_file:
-                ftp.storbinary('STOR '+filename, uploaded_file)
+        self.transfer_files([filename])
+        errors = self._transfer_manager.wait([filename], timeout=self._upload_timeout)
+        if len(errors) > 0:
+            self.log.error('Upload of file "{0}" to AWG70k failed: {1}'.format(filename,
+                                                                              errors[filename]))
+            return -1
         return 0
 
+    def _create_transfer_manager(self):
+        """ Create the manager uploading the files to the asset directory on the device.
+
+        @return FtpTransferManager: the manager with its pool of FTP connections
+        """
+        return FtpTransferManager(self.ip_address, user=self.user, passwd=self.passwd,
+                                  directory=self.asset_directory,
+                                  number_of_connections=self._ftp_connections,
+                                  timeout=self._ftp_timeout)
+
     def clear_all(self):
         """ Clears the loaded waveform from the pulse generators RAM.
 
@@ -958,11 +1020,12 @@ class AWG70K(Base, PulserInterface):
                     saved_assets.append(asset_name)
         return saved_assets
 
-    def delete_asset(self, asset_name):
+    def delete_asset(self, asset_name, keep_files=None):
         """ Delete all files associated with an asset with the passed asset_name from the device memory.
 
         @param str asset_name: The name of the asset to be deleted
                                Optionally a list of asset names can be passed.
+        @param list keep_files: optional, names of files which are not deleted
 
         @return list: a list with strings of the files which were deleted.
 
@@ -979,8 +1042,11 @@ class AWG70K(Base, PulserInterface):
         # determine files to delete
         for name in asset_name:
             for filename in uploaded_files:
+                if keep_files is not None and filename in keep_files:
+                    continue
                 if fnmatch(filename, name+'_ch?.wfmx') or fnmatch(filename, name+'.mat'):
                     files_to_delete.append(filename)
+        self._transfer_manager.forget(files_to_delete)
 
         # delete files
         with FTP(self.ip_address) as ftp:
@@ -1018,6 +1084,9 @@ class AWG70K(Base, PulserInterface):
                         'Create new.'.format(dir_path))
                 ftp.mkd(dir_path)
         self.asset_directory = dir_path
+        # the connections of the transfer manager work in the asset directory
+        self._transfer_manager.close(timeout=self._ftp_timeout)
+        self._transfer_manager = self._create_transfer_manager()
         return 0
 
     def get_asset_dir_on_device(self):
@@ -343,18 +343,13 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
 
         #TODO: Change the gaussian function here to the one from fitlogic and delete the local modules to calculate
         #the gaussian functions
-        if line_path[0, 0] != line_path[0, 1]:
-            x_data,y_data = np.meshgrid(line_path[0, :], line_path[1, 0])
-            for i in range(self._num_points):
-                count_data += self.twoD_gaussian_function((x_data,y_data),
-                              *(self._points[i])) * ((self.gaussian_function(np.array(z_data),
-                              *(self._points_z[i]))))
-        else:
-            x_data,y_data = np.meshgrid(line_path[0, 0], line_path[1, 0])
-            for i in range(self._num_points):
-                count_data += self.twoD_gaussian_function((x_data,y_data),
-                              *(self._points[i])) * ((self.gaussian_function(z_data,
-                              *(self._points_z[i]))))
+        # evaluate every position of the path, so paths of several lines work as well
+        x_data = np.asarray(line_path[0, :])
+        y_data = np.asarray(line_path[1, :])
+        for i in range(self._num_points):
+            count_data += self.twoD_gaussian_function((x_data,y_data),
+                          *(self._points[i])) * ((self.gaussian_function(np.array(z_data),
+                          *(self._points_z[i]))))
 
 
         time.sleep(self._line_length*1./self._clock_frequency)
@@ -36,12 +36,28 @@ class InterfaceImplementationError(Exception):
         return repr(self.value)
 
 class FastCounterDummy(Base, FastCounterInterface):
-    """This is the Interface class to define the controls for the simple
-    microwave hardware.
+    """ Dummy fast counter, which simulates the photon counts of a pulsed
+    measurement on a NV center.
+
+    If a PulserDummy is connected (optional connector 'pulser'), the counts
+    are simulated from the laser pulses of its loaded asset while its output
+    is on. Every laser pulse gives counts with the rate 'count_rate', which
+    are reduced at the beginning of the pulse if the spin was not in the
+    bright state (contrast 'contrast', decaying with 'polarization_time').
+    The bright state population is a damped Rabi oscillation
+    ('rabi_frequency', 'coherence_time') over the dark time before the laser
+    pulse. The photons arrive 'detection_delay' after the laser and a
+    background of 'dark_count_rate' is added to all bins.
+
+    The histogram accumulates Poisson distributed counts of as many sweeps of
+    the asset as fit into the time since the last readout, so the data rate is
+    the one of a real measurement, without any waiting in the readout.
+    Without a pulser (or with choose_trace) the trace of a file is returned.
     """
     _modclass = 'fastcounterinterface'
     _modtype = 'hardware'
     # connectors
+    _in = {'pulser': 'PulserInterface'}
     _out = {'fastcounter': 'FastCounterInterface'}
 
     def __init__(self, config, **kwargs):
@@ -69,6 +85,18 @@ class FastCounterDummy(Base, FastCounterInterface):
                     'the config. The default configuration choose_trace={0} '
                     'will be taken instead.'.format(self._choose_trace))
 
+        # parameters of the simulation, rates in counts/s and times in s
+        self._simulation_parameters = {'count_rate': 100e3,
+                                       'dark_count_rate': 200.0,
+                                       'contrast': 0.3,
+                                       'polarization_time': 300e-9,
+                                       'rabi_frequency': 10e6,
+                                       'coherence_time': 2e-6,
+                                       'detection_delay': 20e-9}
+        for key in self._simulation_parameters:
+            if key in config.keys():
+                self._simulation_parameters[key] = float(config[key])
+
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
 
@@ -83,6 +111,17 @@ class FastCounterDummy(Base, FastCounterInterface):
         self.statusvar = 0
         self._binwidth = 1
         self._gate_length_bins = 8192
+        self._number_of_gates = 0
+        self._count_data = np.zeros((0, ), dtype=np.uint64)
+        try:
+            self._pulser = self.get_in_connector('pulser')
+        except TypeError:
+            self._pulser = None
+        # laser pulses the expected counts were computed for
+        self._simulated_pulses = None
+        self._expected_counts = None
+        self._sweep_length = 0.0
+        self._last_update_time = None
         return
 
     def on_deactivate(self, e):
@@ -155,6 +194,8 @@ class FastCounterDummy(Base, FastCounterInterface):
         self._gate_length_bins = int(np.rint(record_length_s / bin_width_s))
         actual_binwidth = self._binwidth * 1000 / 950e9
         actual_length = self._gate_length_bins * actual_binwidth
+        self._number_of_gates = int(number_of_gates) if self._gated else 0
+        self._simulated_pulses = None
         self.statusvar = 1
         return actual_binwidth, actual_length, number_of_gates
 
@@ -172,10 +213,18 @@ class FastCounterDummy(Base, FastCounterInterface):
         return self.statusvar
 
     def start_measure(self):
-        time.sleep(1)
+        """ Start the fast counter with an empty histogram. """
         self.statusvar = 2
 
-        if self._choose_trace:
+        if self._pulser is not None and not self._choose_trace:
+            if self._gated:
+                shape = (self._number_of_gates, self._gate_length_bins)
+            else:
+                shape = (self._gate_length_bins, )
+            self._count_data = np.zeros(shape, dtype=np.uint64)
+            self._expected_counts = None
+            self._last_update_time = time.perf_counter()
+        elif self._choose_trace:
             defaultconfigpath = os.path.join(self.get_main_dir())
 
             # choose the filename via the Qt Dialog window:
@@ -197,7 +246,8 @@ class FastCounterDummy(Base, FastCounterInterface):
             self._count_data = np.loadtxt(
                 os.path.join(self.get_main_dir(), 'tools',
                              'FastComTec_demo_timetrace.asc'))
-
+        # the timetraces of a fast counter are unsigned integers
+        self._count_data = np.rint(self._count_data).astype(np.uint64)
         return 0
 
     def pause_measure(self):
@@ -205,14 +255,15 @@ class FastCounterDummy(Base, FastCounterInterface):
 
         Fast counter must be initially in the run state to make it pause.
         """
-        time.sleep(1)
+        if self.statusvar == 2:
+            self._simulate_counts()
         self.statusvar = 3
         return 0
 
     def stop_measure(self):
         """ Stop the fast counter. """
-
-        time.sleep(1)
+        if self.statusvar == 2:
+            self._simulate_counts()
         self.statusvar = 1
         return 0
 
@@ -221,7 +272,7 @@ class FastCounterDummy(Base, FastCounterInterface):
 
         If fast counter is in pause state, then fast counter will be continued.
         """
-
+        self._last_update_time = time.perf_counter()
         self.statusvar = 2
         return 0
 
@@ -242,10 +293,14 @@ class FastCounterDummy(Base, FastCounterInterface):
         width_in_seconds = self._binwidth * 1/950e6
         return width_in_seconds
 
-    def get_data_trace(self):
+    def get_data_trace(self, buffer=None):
         """ Polls the current timetrace data from the fast counter.
 
-        Return value is a numpy array (dtype = int64).
+        @param numpy.ndarray buffer: optional, uint64 array of the shape of the
+                                     timetrace the data is written to.
+
+        Return value is a numpy array (dtype = uint64), the given buffer if it
+        could be used.
         The binning, specified by calling configure() in forehand, must be
         taken care of in this hardware class. A possible overflow of the
         histogram bins must be caught here and taken care of.
@@ -254,12 +309,84 @@ class FastCounterDummy(Base, FastCounterInterface):
         If the counter is GATED it will return a 2D-numpy-array with
             returnarray[gate_index, timebin_index]
         """
-
-        # include an artificial waiting time
-        time.sleep(0.5)
-        return self._count_data
+        if self.statusvar == 2:
+            self._simulate_counts()
+        if (buffer is None or buffer.shape != self._count_data.shape
+                or buffer.dtype != self._count_data.dtype):
+            buffer = np.empty_like(self._count_data)
+        buffer[:] = self._count_data
+        return buffer
 
     def get_frequency(self):
         freq = 950.
-        time.sleep(0.5)
         return freq
+
+    def _simulate_counts(self):
+        """ Add the counts of the sweeps since the last update to the
+        histogram, if the counts are simulated.
+        """
+        if self._pulser is None or self._choose_trace or self._last_update_time is None:
+            return
+        now = time.perf_counter()
+        elapsed = now - self._last_update_time
+        self._last_update_time = now
+        if self._pulser.get_status()[0] == 1:
+            laser_pulses = self._pulser.get_laser_pulses()
+        else:
+            laser_pulses = None
+        if laser_pulses is not self._simulated_pulses or self._expected_counts is None:
+            self._expected_counts, self._sweep_length = self._get_expected_counts(laser_pulses)
+            self._simulated_pulses = laser_pulses
+        # sums of poisson distributed counts are poisson distributed with the summed mean
+        sweeps = elapsed / self._sweep_length
+        self._count_data += np.random.poisson(self._expected_counts * sweeps).astype(np.uint64)
+        return
+
+    def _get_expected_counts(self, laser_pulses):
+        """ Compute the mean counts of one sweep of the laser pulses in every
+        bin of the histogram.
+
+        @param tuple laser_pulses: start times, lengths and the length of the
+                                   sweep (see PulserDummy.get_laser_pulses),
+                                   None if the laser is off
+
+        @return tuple(numpy.ndarray, float): the mean counts of the shape of
+                                             the histogram and the length of
+                                             one sweep in seconds
+        """
+        params = self._simulation_parameters
+        binwidth = self.get_binwidth()
+        shape = self._count_data.shape
+        expected_counts = np.full(shape, params['dark_count_rate'] * binwidth)
+        if laser_pulses is None or laser_pulses[0].size == 0:
+            sweep_length = binwidth * shape[-1] * max(self._number_of_gates, 1)
+            return expected_counts, sweep_length
+        starts, lengths, sweep_length = laser_pulses
+
+        # bright state population of the spin during each laser pulse
+        dark_times = starts - np.roll(starts + lengths, 1)
+        dark_times[0] += sweep_length
+        bright_population = 0.5 + 0.5 * np.cos(
+            2 * np.pi * params['rabi_frequency'] * dark_times) * np.exp(
+            -dark_times / params['coherence_time'])
+
+        if self._gated:
+            # every gate opens with a laser pulse
+            number_of_pulses = min(starts.size, shape[0])
+            offsets = np.zeros(number_of_pulses)
+        else:
+            number_of_pulses = starts.size
+            offsets = starts
+        times = np.arange(shape[-1]) * binwidth
+        for pulse in range(number_of_pulses):
+            pulse_start = offsets[pulse] + params['detection_delay']
+            in_pulse = slice(int(np.ceil(pulse_start / binwidth)),
+                             int(np.ceil((pulse_start + lengths[pulse]) / binwidth)))
+            rate = params['count_rate'] * (1 - params['contrast'] * (
+                1 - bright_population[pulse]) * np.exp(
+                -(times[in_pulse] - pulse_start) / params['polarization_time']))
+            if self._gated:
+                expected_counts[pulse, in_pulse] += rate * binwidth
+            else:
+                expected_counts[in_pulse] += rate * binwidth
+        return expected_counts, sweep_length
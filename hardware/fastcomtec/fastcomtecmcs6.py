@@ -303,24 +303,29 @@ class FastComtec(Base, FastCounterInterface):
         self.dll.Continue(0)
         return 0
 
-    def get_data_trace(self):
+    def get_data_trace(self, buffer=None):
         """
-        Polls the current timetrace data from the fast counter and returns it as a numpy array (dtype = int64).
+        Polls the current timetrace data from the fast counter and returns it as a numpy array (dtype = uint32).
         The binning specified by calling configure() must be taken care of in this hardware class.
         A possible overflow of the histogram bins must be caught here and taken care of.
         If the counter is UNgated it will return a 1D-numpy-array with returnarray[timebin_index]
         If the counter is gated it will return a 2D-numpy-array with returnarray[gate_index, timebin_index]
 
-          @return arrray: Time trace.
+          @param numpy.ndarray buffer: optional, uint32 array of the length of the time trace
+                                       the data is read into.
+
+          @return arrray: Time trace, the given buffer if it could be used.
         """
 
         setting = AcqSettings()
         self.dll.GetSettingData(ctypes.byref(setting), 0)
         N = setting.range
-        data = np.empty((N,), dtype=np.uint32)
-        self.dll.LVGetDat(data.ctypes.data, 0)
-
-        return np.int64(data)
+        if (buffer is None or buffer.shape != (N,) or buffer.dtype != np.uint32
+                or not buffer.flags.c_contiguous or not buffer.flags.writeable):
+            buffer = np.empty((N,), dtype=np.uint32)
+        # the DLL writes the histogram directly into the memory of the buffer
+        self.dll.LVGetDat(buffer.ctypes.data, 0)
+        return buffer
 
 
     def get_data_testfile(self):
@@ -217,19 +217,27 @@ class FastCounterFGAPiP3(Base, FastCounterInterface):
         """
         return True
 
-    def get_data_trace(self):
+    def get_data_trace(self, buffer=None):
         """ Polls the current timetrace data from the fast counter.
 
-        @return numpy.array: 2 dimensional array of dtype = int64. This counter
+        @param numpy.ndarray buffer: optional, uint64 array of the shape of the
+                                     timetrace the data is written to.
+
+        @return numpy.array: 2 dimensional array of dtype = uint64. This counter
                              is gated the the return array has the following
                              shape:
                                 returnarray[gate_index, timebin_index]
+                             It is the given buffer if it could be used.
 
         The binning, specified by calling configure() in forehand, must be taken
         care of in this hardware class. A possible overflow of the histogram
         bins must be caught here and taken care of.
         """
-        return np.array(self.pulsed.getData(), dtype='int64')
+        data = np.asarray(self.pulsed.getData())
+        if buffer is None or buffer.shape != data.shape or buffer.dtype != np.uint64:
+            return data.astype(np.uint64)
+        np.copyto(buffer, data, casting='unsafe')
+        return buffer
 
 
     def get_status(self):
@@ -21,13 +21,13 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import numpy as np
-import struct
 import os
 
 from interface.fast_counter_interface import FastCounterInterface
 from core.base import Base
 import thirdparty.opal_kelly.ok64 as ok
 from core.util.mutex import Mutex
+from core.util.histogram_accumulator import rebin
 
 
 class FastCounterFPGAQO(Base, FastCounterInterface):
@@ -106,7 +106,12 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
                                         # data, i.e. after an overflow on the
                                         # FPGA.
         self._overflown = False         # overflow indicator
-        self.count_data = None
+
+        # reusable buffer for the USB transfer and its view as 32-bit
+        # integers (little endian), see _allocate_read_buffer
+        self._read_buffer = None
+        self._read_counts = None
+        self._binned_counts = None
 
         self._internal_clock_hz = 950e6 # that is a fixed number, 950MHz
 
@@ -262,6 +267,7 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
 
         self._number_of_gates = number_of_gates
         self._histogram_size = number_of_gates * 8192
+        self._allocate_read_buffer()
 
         # reset overflow indicator
         self._overflown = False
@@ -276,7 +282,12 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
     def start_measure(self):
         """ Start the fast counter. """
         # initialize the data array
-        self.count_data = np.zeros([self._number_of_gates, self._gate_length_bins])
+        if self._read_buffer is None:
+            self._allocate_read_buffer()
+        else:
+            self._read_counts[:] = 0
+            if self._binned_counts is not None:
+                self._binned_counts[:] = 0
         # reset overflow indicator
         self._overflown = False
         # Release all reset states and start the counter.
@@ -286,30 +297,65 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
         self.statusvar = 2
         return 0
 
-    def get_data_trace(self):
+    def _allocate_read_buffer(self):
+        """ Allocate the buffer for the USB transfer of the histogram and the views of it, which
+        are reused for every readout.
+
+        The histogram is decoded by viewing the transferred bytes as little endian 32-bit
+        integers (np.frombuffer), so no copy is needed for that.
+        """
+        # one timebin of the data to read is 32 bit wide and the data is
+        # transferred in bytes.
+        self._read_buffer = bytearray(self._histogram_size*4)
+        self._read_counts = np.frombuffer(self._read_buffer, dtype='<u4')
+        if self._binwidth != 1:
+            self._binned_counts = np.zeros(self._histogram_size // self._binwidth,
+                                           dtype=np.uint64)
+        else:
+            self._binned_counts = None
+        return
+
+    def _get_count_view(self):
+        """ Get the counts of the last readout as view of the read buffers.
+
+        @return numpy.ndarray: 2D array of shape (number_of_gates, gate_length_bins)
+        """
+        if self._binned_counts is None:
+            counts = self._read_counts
+        else:
+            counts = self._binned_counts
+        return counts.reshape(self._number_of_gates, -1)[:, 0:self._gate_length_bins]
+
+    def get_data_trace(self, buffer=None):
         """ Polls the current timetrace data from the fast counter.
 
-        @return numpy.array: 2 dimensional array of dtype = int64. This counter
+        @param numpy.ndarray buffer: optional, uint64 array of shape
+                                     (number_of_gates, gate_length_bins) the
+                                     data is written to.
+
+        @return numpy.array: 2 dimensional array of dtype = uint64. This counter
                              is gated the the return array has the following
                              shape:
                                 returnarray[gate_index, timebin_index]
+                             It is the given buffer if it could be used.
 
         The binning, specified by calling configure() in forehand, must be taken
         care of in this hardware class. A possible overflow of the histogram
         bins must be caught here and taken care of.
         """
-        # initialize the read buffer for the USB transfer.
-        # one timebin of the data to read is 32 bit wide and the data is
-        # transferred in bytes.
+        shape = (self._number_of_gates, self._gate_length_bins)
+        if buffer is None or buffer.shape != shape or buffer.dtype != np.uint64:
+            buffer = np.empty(shape, dtype=np.uint64)
+
         if self.statusvar != 2:
             self.log.error('The FPGA is currently not running! The current status is: "{0}". The '
                            'running status would be 2. Start the FPGA to get the data_trace of the '
                            'device. An emtpy numpy array[{1},{2}] filled with zeros will be '
                            'returned.'.format(self.statusvar, self._number_of_gates,
                                               self._gate_length_bins))
-            return self.count_data
+            buffer[:] = 0
+            return buffer
 
-        data_buffer = bytearray(self._histogram_size*4)
         # check if the timetagger had an overflow.
         self._fpga.UpdateWireOuts()
         flags = self._fpga.GetWireOutValue(0x20)
@@ -320,8 +366,12 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
             self._fpga.SetWireInValue(0x00, self._histogram_size)
             self._fpga.UpdateWireIns()
 
-            # save latest count data into a new class variable to preserve it
-            self._old_data = self.count_data.copy()
+            # save latest count data, which is still in the read buffer, into
+            # a new class variable to preserve it
+            if self._overflown:
+                self._old_data += self._get_count_view()
+            else:
+                self._old_data = self._get_count_view().astype(np.uint64)
             self._overflown = True
 
         # trigger the data read in the FPGA
@@ -330,24 +380,23 @@ class FastCounterFPGAQO(Base, FastCounterInterface):
         self._fpga.SetWireInValue(0x00, self._histogram_size)
         self._fpga.UpdateWireIns()
 
-        # read data from the FPGA
-        read_err_code = self._fpga.ReadFromBlockPipeOut(0xA0, 1024, data_buffer)
+        # read data from the FPGA directly into the reused read buffer
+        read_err_code = self._fpga.ReadFromBlockPipeOut(0xA0, 1024, self._read_buffer)
         if read_err_code < 0:
             self.log.warning('Opal Kelly FrontPanel method ReadFromBlockPipeOut failed with error '
                              'code {0}.'.format(read_err_code))
 
-        # encode the bytearray data into 32-bit integers
-        buffer_encode = np.array(struct.unpack("<"+"L"*self._histogram_size, data_buffer))
-
         # bin the data according to the specified bin width
-        if self._binwidth != 1:
-            buffer_encode = buffer_encode[:(buffer_encode.size // self._binwidth) * self._binwidth].reshape(-1, self._binwidth).sum(axis=1)
+        if self._binned_counts is not None:
+            rebin(self._read_counts, self._binwidth, out=self._binned_counts)
 
-        # reshape the data array into the 2D output array
-        self.count_data = buffer_encode.reshape(self._number_of_gates, -1)[:, 0:self._gate_length_bins]
+        # copy the gates into the output array
+        count_data = self._get_count_view()
         if self._overflown:
-            self.count_data = np.add(self.count_data, self._old_data)
-        return self.count_data
+            np.add(count_data, self._old_data, out=buffer)
+        else:
+            buffer[:] = count_data
+        return buffer
 
     def stop_measure(self):
         """ Stop the fast counter. """
@@ -1651,20 +1651,36 @@ class NICard(Base, SlowCounterInterface, ConfocalScannerInterface, ODMRCounterIn
 
         @return float[]: the photon counts per second
         """
+        count_data = self.count_odmr_sweeps(length=length, sweeps=1)
+        if count_data[0][0] == -1:
+            return np.array([-1.])
+        return count_data[0]
+
+    def count_odmr_sweeps(self, length=100, sweeps=1):
+        """ Sweeps the microwave several times in a row and returns the counts of every sweep.
+
+        The clock gives one pulse per pixel of all sweeps (plus the starting pulse), so the
+        microwave source has to return to the first frequency after the last one.
+
+        @param int length: length of microwave sweep in pixel
+        @param int sweeps: number of sweeps
+
+        @return float[][]: the photon counts per second, one line per sweep
+        """
         if self._scanner_counter_daq_task is None:
             self.log.error(
                 'No counter is running, cannot scan an ODMR line without one.')
-            return np.array([-1.])
+            return np.array([[-1.]])
 
-        # check if length setup is correct, if not, adjust.
-        self.set_odmr_length(length)
+        # the sweeps are counted as one long line of pixels
+        self.set_odmr_length(length * sweeps)
         try:
             # start the scanner counting task that acquires counts synchroneously
             daq.DAQmxStartTask(self._scanner_counter_daq_task)
         except:
             self.log.exception(
                 'Cannot start ODMR counter.')
-            return np.array([-1.])
+            return np.array([[-1.]])
         try:
             daq.DAQmxStartTask(self._scanner_clock_daq_task)
 
@@ -1702,20 +1718,16 @@ class NICard(Base, SlowCounterInterface, ConfocalScannerInterface, ODMRCounterIn
             daq.DAQmxStopTask(self._scanner_counter_daq_task)
             daq.DAQmxStopTask(self._scanner_clock_daq_task)
 
-            # create a new array for the final data (this time of the length
-            # number of samples)
-            self._real_data = np.zeros((self._odmr_length,), dtype=np.uint32)
-
             # add upp adjoint pixels to also get the counts from the low time of
             # the clock:
             self._real_data = self._odmr_data[:-1:2]
             self._real_data += self._odmr_data[1:-1:2]
 
-            return self._real_data * self._scanner_clock_frequency
+            return np.reshape(self._real_data * self._scanner_clock_frequency, (sweeps, length))
         except:
             self.log.exception(
                 'Error while counting for ODMR.')
-            return np.array([-1.])
+            return np.array([[-1.]])
 
     def close_odmr(self):
         """ Closes the odmr and cleans up afterwards.
@@ -53,6 +53,7 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
 
         self._scanner_counter_daq_task = None
         self._odmr_length = None
+        self._odmr_signal = None
 
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
@@ -139,6 +140,19 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
 
         @return float[]: the photon counts per second
         """
+        count_data = self.count_odmr_sweeps(length=length, sweeps=1)
+        if np.ndim(count_data) != 2:
+            return -1
+        return count_data[0]
+
+    def count_odmr_sweeps(self, length=100, sweeps=1):
+        """ Sweeps the microwave several times in a row and returns the counts of every sweep.
+
+        @param int length: length of microwave sweep in pixel
+        @param int sweeps: number of sweeps
+
+        @return float[][]: the photon counts per second, one line per sweep
+        """
 
         if self.getState() == 'locked':
             self.log.error('A scan_line is already running, close this one '
@@ -147,12 +161,28 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
 
         self.lock()
 
-
         self._odmr_length = length
 
-        count_data = np.empty((self._odmr_length,), dtype=np.uint32)
+        count_data = np.random.uniform(0, 5e4, (sweeps, length))
+        count_data += self._get_odmr_signal(length)
+
+        time.sleep(sweeps*self._odmr_length*1./self._clock_frequency)
+
+        self.unlock()
+
+        return count_data
 
-        count_data = np.random.uniform(0, 5e4, length)
+    def _get_odmr_signal(self, length):
+        """ Get the simulated ODMR spectrum with two lorentzian dips.
+
+        The spectrum is only calculated again if the length of the sweep changed.
+
+        @param int length: length of microwave sweep in pixel
+
+        @return float[]: the spectrum in counts per second
+        """
+        if self._odmr_signal is not None and len(self._odmr_signal) == length:
+            return self._odmr_signal
 
         lorentians,params = self._fit_logic.make_multiplelorentzian_model(no_of_lor=2)
 
@@ -166,14 +196,8 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
         params.add('lorentz1_sigma', value=sigma)
         params.add('c', value=50000.)
 
-        count_data += lorentians.eval(x=np.arange(1, length+1, 1), params=params)
-
-        time.sleep(self._odmr_length*1./self._clock_frequency)
-
-        self.unlock()
-
-        return count_data
-
+        self._odmr_signal = lorentians.eval(x=np.arange(1, length+1, 1), params=params)
+        return self._odmr_signal
 
     def close_odmr(self):
         """ Closes the odmr and cleans up afterwards.
@@ -21,6 +21,8 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 import ctypes
 import numpy as np
+import os
+import threading
 import time
 from qtpy import QtCore
 
@@ -28,6 +30,7 @@ from core.base import Base
 from core.util.mutex import Mutex
 from interface.slow_counter_interface import SlowCounterInterface
 from interface.fast_counter_interface import FastCounterInterface
+from hardware.picoquant.tttr_histogrammer import TTTRHistogrammer, load_tttr_records
 
 # =============================================================================
 # Wrapper around the PHLib.DLL. The current file is based on the header files
@@ -88,6 +91,12 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
     This class is written according to the Programming Library Version 3.0
     STABLE AND TESTED VERSION: Alex S.
+
+    As fast counter the device runs in T3 mode. The TTTR records are read from
+    the FIFO and histogrammed by a TTTRHistogrammer in a separate thread.
+    With the config option 'replay_file' no device is used, instead the
+    records of a recorded measurement (.ptu file or plain dump of the records,
+    e.g. a .out file of the PicoHarp demos) are replayed for offline testing.
     """
     _modclass = 'PicoHarp300'
     _modtype = 'hardware'
@@ -97,8 +106,6 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
             'counter': 'SlowCounterInterface'
             }
 
-    sigReadoutPicoharp = QtCore.Signal()
-    sigAnalyzeData = QtCore.Signal(object, object)
     sigStart = QtCore.Signal()
 
     def __init__(self, config, **kwargs):
@@ -123,6 +130,36 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                         'default.')
             self._mode = 0
 
+        # fast counter settings
+        if 'gated' in config.keys():
+            self._gated = bool(config['gated'])
+        else:
+            self._gated = False
+        # marker bit (1, 2, 4 or 8) of the first gate of a gated sequence
+        if 'gate_marker' in config.keys():
+            self._gate_marker = int(config['gate_marker'])
+        else:
+            self._gate_marker = None
+
+        # replay of recorded TTTR records instead of the device
+        if 'replay_file' in config.keys():
+            self._replay_file = config['replay_file']
+        else:
+            self._replay_file = None
+        if 'replay_interval' in config.keys():
+            self._replay_interval = float(config['replay_interval'])
+        else:
+            self._replay_interval = 0.08
+        if 'replay_loop' in config.keys():
+            self._replay_loop = bool(config['replay_loop'])
+        else:
+            self._replay_loop = True
+        # dtime resolution of plain record dumps, .ptu files contain it
+        if 'replay_resolution_ps' in config.keys():
+            self._replay_resolution_ps = float(config['replay_resolution_ps'])
+        else:
+            self._replay_resolution_ps = 4.
+
         self.errorcode = self._create_errorcode()
         self._set_constants()
 
@@ -134,7 +171,10 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         # Load the picoharp library file phlib64.dll from the folder
         # <Windows>/System32/
-        self._dll = ctypes.cdll.LoadLibrary('phlib64')
+        if self._replay_file is None:
+            self._dll = ctypes.cdll.LoadLibrary('phlib64')
+        else:
+            self._dll = None
 
         # Just some default values:
         self._bin_width_ns = 3000
@@ -146,6 +186,16 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         #locking for thread safety
         self.threadlock = Mutex()
 
+        # fast counter state
+        self.statusvar = 0
+        self._bin_width_s = 1e-9
+        self._histogrammer = None
+        self._fifo_buffer = None
+        self._readout_thread = None
+        self._stop_readout = threading.Event()
+        self._replay_records = None
+        self._replay_position = 0
+
 
     def on_activate(self, fysom_e=None):
         """ Activate and establish the connection to Picohard and initialize.
@@ -158,21 +208,22 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                          of the state which should be reached after the event
                          has happen.
         """
-        self.open_connection()
-        self.initialize(self._mode)
-        self.calibrate()
-
-        #FIXME: These are default values determined from the measurement
-        # One need still to include this in the config.
-        self.set_input_CFD(1,10,7)
-
-        # the signal has one argument of type object, which should allow
-        # anything to pass through:
+        if self._replay_file is None:
+            self.open_connection()
+            self.initialize(self._mode)
+            self.calibrate()
+
+            #FIXME: These are default values determined from the measurement
+            # One need still to include this in the config.
+            self.set_input_CFD(1,10,7)
+        else:
+            self._replay_records, header = load_tttr_records(self._replay_file)
+            if 'MeasDesc_Resolution' in header:
+                self._replay_resolution_ps = header['MeasDesc_Resolution'] * 1e12
+            self.log.info('Picoharp: Replaying {0} TTTR records of "{1}" instead of reading '
+                          'the device.'.format(self._replay_records.size, self._replay_file))
 
         self.sigStart.connect(self.start_measure)
-        self.sigReadoutPicoharp.connect(self.get_fresh_data_loop, QtCore.Qt.QueuedConnection) # ,QtCore.Qt.QueuedConnection
-        self.sigAnalyzeData.connect(self.analyze_received_data, QtCore.Qt.QueuedConnection)
-        self.result = []
 
 
     def on_deactivate(self, fysom_e=None):
@@ -182,9 +233,10 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                          see in method 'activation'.
         """
 
-        self.close_connection()
-        self.sigReadoutPicoharp.disconnect()
-        self.sigAnalyzeData.disconnect()
+        self._stop_readout_thread()
+        if self._replay_file is None:
+            self.close_connection()
+        self.sigStart.disconnect()
 
     def _create_errorcode(self):
         """ Create a dictionary with the errorcode for the device.
@@ -198,7 +250,8 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         maindir = self.get_main_dir()
 
-        filename = os.path.join(maindir, 'hardware', 'PicoQuant', 'errorcodes.h')
+        filename = os.path.join(maindir, 'hardware', 'picoquant', 'errorcodes.h')
+        content = []
         try:
             with open(filename) as f:
                 content = f.readlines()
@@ -247,6 +300,9 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         self.BINSTEPSMAX = 8
         self.HISTCHAN = 65536    # number of histogram channels 2^16
         self.TTREADMAX = 131072  # 128K event records (2^17)
+        self.T3DTIMEMAX = 4096   # number of dtime values in T3 mode (12 bit)
+
+        self.FLAG_FIFOFULL = 0x0003
 
         # in Hz:
         self.COUNTFREQ = 10
@@ -580,7 +636,6 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
     def stop_device(self):
         """ Stop the measurement."""
         self.check(self._dll.PH_StopMeas(self._deviceID))
-        self.meas_run = False
 
     def _get_status(self):
         """ Check the status of the device.
@@ -758,7 +813,10 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         num_counts = self.TTREADMAX
 
-        buffer = np.zeros((num_counts,), dtype=np.uint32)
+        # the buffer is reused for every readout
+        if self._fifo_buffer is None:
+            self._fifo_buffer = np.zeros((num_counts,), dtype=np.uint32)
+        buffer = self._fifo_buffer
 
         actual_num_counts = ctypes.c_int32()
 
@@ -1060,31 +1118,61 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
     #  Functions for the FastCounter Interface
     # =========================================================================
 
-    #FIXME: The interface connection to the fast counter must be established!
+    def get_constraints(self):
+        """ Retrieve the hardware constrains from the Fast counting device.
 
-    def configure(self, bin_width_ns, record_length_ns, number_of_gates = 0):
+        @return dict: dict with keys being the constraint names as string and
+                      items are the definition for the constaints.
+
+        The bin widths are multiples of the base resolution by powers of two.
         """
-        Configuration of the fast counter.
-        bin_width_ns: Length of a single time bin in the time trace histogram
-                      in nanoseconds.
-        record_length_ns: Total length of the timetrace/each single gate in
-                          nanoseconds.
-        number_of_gates: Number of gates in the pulse sequence. Ignore for
-                         ungated counter.
+        constraints = dict()
+        resolution = self._get_base_resolution_s()
+        constraints['hardware_binwidth_list'] = [resolution * 2**k for k in range(12)]
+        return constraints
+
+    def configure(self, bin_width_s, record_length_s, number_of_gates=0):
+        """ Configuration of the fast counter.
+
+        @param float bin_width_s: Length of a single time bin in the time trace
+                                  histogram in seconds.
+        @param float record_length_s: Total length of the timetrace/each single
+                                      gate in seconds.
+        @param int number_of_gates: optional, number of gates in the pulse
+                                    sequence. Ignored if the counter is not
+                                    gated.
+
+        @return tuple(binwidth_s, gate_length_s, number_of_gates):
+                    binwidth_s: float the actual set binwidth in seconds
+                    gate_length_s: the actual set gate length in seconds
+                    number_of_gates: the number of gated, which are accepted
+
+        In T3 mode the arrival time after the sync pulse has 12 bit. The
+        device binning is chosen as fine as possible, so that the record
+        length fits into these 4096 values. The bin width is a multiple of the
+        resulting resolution.
         """
-#        self.initialize(mode=3)
-        self._bin_width_ns = bin_width_ns
-        self._record_length_ns = record_length_ns
-        self._number_of_gates = number_of_gates
-
-        #FIXME: actualle only an unsigned array will be needed. Change that later.
-#        self.data_trace = np.zeros(number_of_gates, dtype=np.int64 )
-        self.data_trace = [0]*number_of_gates
-        self.count = 0
-
-        self.result = []
-        self.initialize(2)
-        return
+        base_resolution = self._get_base_resolution_s()
+        if self._replay_file is None:
+            binning = int(np.ceil(np.log2(record_length_s / (self.T3DTIMEMAX * base_resolution))))
+            binning = min(binning, int(np.floor(np.log2(bin_width_s / base_resolution))))
+            binning = min(max(binning, 0), self.BINSTEPSMAX - 1)
+            self.initialize(self.MODE_T3)
+            self.set_binning(binning)
+            resolution = self.get_resolution() * 1e-12
+        else:
+            resolution = base_resolution
+
+        bin_factor = max(int(round(bin_width_s / resolution)), 1)
+        self._bin_width_s = bin_factor * resolution
+        number_of_bins = min(int(round(record_length_s / self._bin_width_s)),
+                             self.T3DTIMEMAX // bin_factor)
+        if not self._gated:
+            number_of_gates = 0
+        self._histogrammer = TTTRHistogrammer(number_of_bins, bin_factor, number_of_gates,
+                                              gate_marker=self._gate_marker)
+        self.statusvar = 1
+        return self._bin_width_s, number_of_bins * self._bin_width_s, number_of_gates
 
     def get_status(self):
         """
@@ -1096,115 +1184,181 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         3 = paused
         -1 = error state
         """
-        if not self.connected_to_device:
+        if self._replay_file is None and not self.connected_to_device:
             return -1
-        else:
-            returnvalue = self._get_status()
-            if returnvalue == 0:
-                return 2
-            else:
-                return 1
+        return self.statusvar
 
+    def start_measure(self):
+        """ Start the fast counter with an empty histogram.
 
-    def pause_measure(self):
+        @return int: error code (0:OK, -1:error)
         """
-        Pauses the current measurement if the fast counter is in running state.
+        if self._histogrammer is None:
+            self.log.error('Picoharp: The fast counter has to be configured before it can be '
+                           'started.')
+            return -1
+        self.lock()
+        self._histogrammer.reset()
+        self._replay_position = 0
+        self._start_readout_thread()
+        self.statusvar = 2
+        return 0
+
+    def stop_measure(self):
+        """ Stop the fast counter.
+
+        @return int: error code (0:OK, -1:error)
         """
+        self._stop_readout_thread()
+        if self.getState() == 'locked':
+            self.unlock()
+        if self.statusvar > 1:
+            self.statusvar = 1
+        return 0
 
-        self.stop_measure()
-        self.meas_run = False
+    def pause_measure(self):
+        """ Pauses the current measurement if the fast counter is in running
+        state. The histogram is kept.
 
-    def continue_measure(self):
+        @return int: error code (0:OK, -1:error)
         """
-        Continues the current measurement if the fast counter is in pause state.
+        if self.statusvar == 2:
+            self._stop_readout_thread()
+            self.statusvar = 3
+        return 0
+
+    def continue_measure(self):
+        """ Continues the current measurement if the fast counter is in pause
+        state.
+
+        @return int: error code (0:OK, -1:error)
         """
-        self.meas_run = True
-        self.start(self._record_length_ns/1e6)
+        if self.statusvar == 3:
+            # the sync counter of the device starts again
+            self._histogrammer.reset_stream()
+            self._start_readout_thread()
+            self.statusvar = 2
+        return 0
 
     def is_gated(self):
+        """ Check the gated counting possibility.
+
+        @return bool: Boolean value indicates if the fast counter is a gated
+                      counter (TRUE) or not (FALSE).
         """
-        Boolean return value indicates if the fast counter is a gated counter
-        (TRUE) or not (FALSE).
-        """
-        return False
+        return self._gated
 
     def get_binwidth(self):
+        """ Returns the width of a single timebin in the timetrace in seconds.
+
+        @return float: current length of a single bin in seconds (seconds/bin)
         """
-        returns the width of a single timebin in the timetrace in seconds
-        """
-        #FIXME: Must be implemented
-        return 2e-9
+        return self._bin_width_s
 
-    def get_data_trace(self):
+    def get_data_trace(self, buffer=None):
         """
         Polls the current timetrace data from the fast counter and returns it
-        as a numpy array (dtype = int64). The binning specified by calling
+        as a numpy array (dtype = uint64). The binning specified by calling
         configure() must be taken care of in this hardware class. A possible
         overflow of the histogram bins must be caught here and taken care of.
           - If the counter is NOT gated it will return a 1D-numpy-array with
             returnarray[timebin_index].
           - If the counter is gated it will return a 2D-numpy-array with
             returnarray[gate_index, timebin_index]
-        """
-
-
-        return self.data_trace
 
+        @param numpy.ndarray buffer: optional, uint64 array of the shape of the
+                                     timetrace the data is written to.
 
+        @return numpy.ndarray: the timetrace, the given buffer if it could be
+                               used.
+        """
+        if self._histogrammer is None:
+            return np.zeros((0, ), dtype=np.uint64)
+        return self._histogrammer.get_histogram(buffer)
 
     # =========================================================================
-    #  Test routine for continuous readout
+    #  Continuous readout of the TTTR records
     # =========================================================================
 
+    def _get_base_resolution_s(self):
+        """ Get the finest dtime resolution of the device or of the replayed
+        records.
 
-    def start_measure(self):
+        @return float: the resolution in seconds
         """
-        Starts the fast counter.
-        """
-        self.lock()
-
-        self.meas_run = True
-
-        # start the device:
-        self.start(int(self._record_length_ns/1e6))
-
-        self.sigReadoutPicoharp.emit()
-
-    def stop_measure(self):
-        """ By setting the Flag, the measurement should stop.  """
-        self.meas_run = False
-
-
-    def get_fresh_data_loop(self):
-        """ This method will be run infinitely until the measurement stops. """
+        if self._replay_file is None:
+            return self.get_base_resolution() * 1e-12
+        return self._replay_resolution_ps * 1e-12
 
-        # for testing one can also take another array:
-        buffer, actual_counts = self.tttr_read_fifo()
-#        buffer, actual_counts = [1,2,3,4,5,6,7,8,9], 9
-
-        # This analysis signel should be analyzed in a queued thread:
-        self.sigAnalyzeData.emit(buffer[0:actual_counts-1], actual_counts)
+    def _start_readout_thread(self):
+        """ Start the device and the thread reading and histogramming the TTTR
+        records.
+        """
+        if self._replay_file is None:
+            self.start(self.ACQTMAX)
+        self._stop_readout.clear()
+        self._readout_thread = threading.Thread(target=self._readout_loop, daemon=True)
+        self._readout_thread.start()
+        return
 
-        if not self.meas_run:
-            with self.threadlock:
-                self.unlock()
-                self.stop_device
-                return
+    def _stop_readout_thread(self):
+        """ Stop the readout thread and the device. """
+        if self._readout_thread is None:
+            return
+        self._stop_readout.set()
+        self._readout_thread.join()
+        self._readout_thread = None
+        if self._replay_file is None:
+            self.stop_device()
+        return
 
-        print('get new data.')
-        # get the next data:
-        self.sigReadoutPicoharp.emit()
+    def _readout_loop(self):
+        """ Reads the TTTR records until the readout is stopped. Runs in the
+        readout thread.
+        """
+        fifo_full_reported = False
+        while not self._stop_readout.is_set():
+            try:
+                if self._replay_file is None:
+                    records, actual_counts = self.tttr_read_fifo()
+                    # a full readout means that the FIFO might fill up
+                    if (actual_counts == self.TTREADMAX and not fifo_full_reported
+                            and self.get_flags() & self.FLAG_FIFOFULL):
+                        self.log.warning('Picoharp: The FIFO is full, TTTR records are lost.')
+                        fifo_full_reported = True
+                else:
+                    records, actual_counts = self._replay_read_fifo()
+                self.analyze_received_data(records, actual_counts)
+            except Exception:
+                self.log.exception('Picoharp: Reading the TTTR records failed.')
+                self._stop_readout.wait(self.TIMEOUT / 1000)
+        return
 
+    def _replay_read_fifo(self):
+        """ Read the next chunk of the replayed records like tttr_read_fifo.
 
+        @return tuple (buffer, actual_num_counts): the records and their number
+        """
+        self._stop_readout.wait(self._replay_interval)
+        if self._replay_position >= self._replay_records.size and self._replay_loop:
+            self._replay_position = 0
+            # the replayed records start with a new sync counter
+            self._histogrammer.reset_stream()
+        records = self._replay_records[
+                  self._replay_position:self._replay_position + self.TTREADMAX]
+        self._replay_position += records.size
+        return records, records.size
 
     def analyze_received_data(self, arr_data, actual_counts):
         """ Analyze the actual data obtained from the TTTR mode of the device.
 
-        @param arr_data: numpy uint32 array with length 'actual_counts'.
+        @param arr_data: numpy uint32 array with at least 'actual_counts'
+                         entries.
         @param actual_counts: int, number of read out events from the buffer.
 
-        Write the obtained arr_data to the predefined array data_trace,
-        initialized in the configure method.
+        The records are decoded and added to the histogram of the fast counter
+        by the TTTRHistogrammer, initialized in the configure method. Only the
+        T3 mode is histogrammed.
 
         The received array contains 32bit words. The bit assignment starts from
         the MSB (most significant bit), which is here displayed as the most
@@ -1257,14 +1411,15 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                             0011 = marker 3
                             0100 = marker 4
 
-                        the first bit is the overflow bit. It will be set if
-                        the sync-counter reached 65536 events:
+                        The channel code 15 (all bits ones, 1111) marks a
+                        special record. If the start-stop-time is zero, the
+                        record marks an overflow of the sync-counter, which
+                        reached 65536 events. Otherwise the lowest 4 bits of
+                        the start-stop-time are external markers.
 
-                            1000 = overflow
-
-                        Afterwards both, overflow marker and sync-counter
-                        will be reseted. This overflow should be detected and
-                        the time axis should be adjusted accordingly.
+                        After an overflow the sync-counter starts again at
+                        zero, so the overflows are counted to get the time
+                        axis of the sync pulses.
 
         start-stop-time: time between to consecutive sync pulses. Maximal time
                          between two sync pulses is therefore limited to
@@ -1276,37 +1431,6 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                       reached overflow will be set. That means all 4 bits in
                       the channel-number are set to high (i.e. 1).
         """
-
-        # at first just a simple test
-        time.sleep(0.2)
-
-        self.data_trace[self.count] = actual_counts
-        self.count += 1
-
-        if self.count > self._number_of_gates-1:
-            self.count = 0
-
-        if actual_counts == self.TTREADMAX:
-            self.log.warning('Overflow!')
-
-        print('Data analyzed.')
-
-#        self.result = []
-#        for entry in arr_data[0:actual_counts-1]:
-#
-#            # apply three bitmasks to extract the relavent numbers:
-#            overflow = entry & (2**(32-1) )
-#            marker_ch = entry & (2**(32-2)  + 2**(32-3) + 2**(32-4))
-#            time_tag = entry & (2**32 -1 - 2**(32-1) + 2**(32-2) + 2**(32-3) + 2**(32-4))
-
-
-
-
-
-
-
-
-
-
-
-
+        if self._histogrammer is not None and actual_counts > 0:
+            self._histogrammer.add_records(arr_data[:actual_counts])
+        return
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a streaming decoder and histogrammer for the time-tagged
+time-resolved (TTTR) records of the PicoHarp 300 in T3 mode.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+import os
+import struct
+
+from core.util.mutex import Mutex
+
+# record types of the TTTR result format in .ptu files
+PTU_RECORD_TYPE_PICOHARP_T2 = 0x00010203
+PTU_RECORD_TYPE_PICOHARP_T3 = 0x00010303
+
+# tag types of the .ptu file header
+_PTU_TAG_EMPTY = 0xFFFF0008
+_PTU_TAG_FLOAT = 0x20000008
+_PTU_TAG_DATETIME = 0x21000008
+_PTU_TAG_FLOAT_ARRAY = 0x2001FFFF
+_PTU_TAG_ANSI_STRING = 0x4001FFFF
+_PTU_TAG_WIDE_STRING = 0x4002FFFF
+_PTU_TAG_BINARY_BLOB = 0xFFFFFFFF
+
+
+def read_ptu_header(ptu_file):
+    """ Read the tagged header of a PicoQuant unified TTTR (.ptu) file.
+
+    @param file ptu_file: file opened in binary mode, positioned at the start
+
+    @return dict: the tag values by tag name (with '(index)' appended for indexed tags). After
+                  the call the file is positioned at the first record.
+    """
+    magic = ptu_file.read(8)
+    if not magic.startswith(b'PQTTTR'):
+        raise ValueError('Not a PicoQuant unified TTTR file.')
+    # version string
+    ptu_file.read(8)
+    header = dict()
+    while True:
+        ident, index, tag_type = struct.unpack('<32siI', ptu_file.read(40))
+        name = ident.split(b'\0', 1)[0].decode('ascii')
+        if index > -1:
+            name = '{0}({1})'.format(name, index)
+        if tag_type in (_PTU_TAG_FLOAT, _PTU_TAG_DATETIME):
+            value = struct.unpack('<d', ptu_file.read(8))[0]
+        elif tag_type in (_PTU_TAG_FLOAT_ARRAY, _PTU_TAG_ANSI_STRING, _PTU_TAG_WIDE_STRING,
+                          _PTU_TAG_BINARY_BLOB):
+            length = struct.unpack('<q', ptu_file.read(8))[0]
+            value = ptu_file.read(length)
+            if tag_type == _PTU_TAG_ANSI_STRING:
+                value = value.split(b'\0', 1)[0].decode('latin1')
+            elif tag_type == _PTU_TAG_WIDE_STRING:
+                value = value.decode('utf-16-le').split('\0', 1)[0]
+        else:
+            # empty, bool, integer, bit set and color tags are 8 byte integers
+            value = struct.unpack('<q', ptu_file.read(8))[0]
+        if name == 'Header_End':
+            return header
+        header[name] = value
+
+
+def load_tttr_records(filepath):
+    """ Load the records of a recorded TTTR measurement.
+
+    @param str filepath: path of a .ptu file or of a plain dump of the 32 bit records (e.g. the
+                         .out files of the PicoHarp demo programs)
+
+    @return tuple(numpy.ndarray, dict): the uint32 records and the header, which is empty for
+                                        plain dumps
+    """
+    with open(filepath, 'rb') as tttr_file:
+        if os.path.splitext(filepath)[1].lower() == '.ptu':
+            header = read_ptu_header(tttr_file)
+            record_type = header.get('TTResultFormat_TTTRRecType')
+            if record_type != PTU_RECORD_TYPE_PICOHARP_T3:
+                raise ValueError('Only PicoHarp T3 records can be histogrammed, but the file '
+                                 'contains records of type 0x{0:08X}.'.format(record_type))
+        else:
+            header = dict()
+        records = np.fromfile(tttr_file, dtype='<u4')
+    if 'TTResult_NumberOfRecords' in header:
+        records = records[:header['TTResult_NumberOfRecords']]
+    return records, header
+
+
+def decode_t3_records(records):
+    """ Split PicoHarp T3 records into their bit fields.
+
+    @param numpy.ndarray records: uint32 records
+
+    @return tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray): channel (4 bit), dtime (12 bit)
+                                                                 and nsync (16 bit) of every
+                                                                 record
+
+    Channel 15 marks special records. They are overflows of the sync counter if dtime is zero,
+    otherwise the lowest 4 bits of dtime are the external markers.
+    """
+    records = np.asarray(records, dtype=np.uint32)
+    channel = records >> 28
+    dtime = (records >> 16) & 0xFFF
+    nsync = records & 0xFFFF
+    return channel, dtime, nsync
+
+
+class TTTRHistogrammer:
+    """ Decodes a stream of PicoHarp T3 records and histograms the photon arrival times.
+
+    The arrival time of a photon is its time after the last sync pulse (dtime, in units of the
+    resolution of the device). bin_factor of these units are summed up into one bin. For a gated
+    histogram every sync pulse starts a new gate. The gates are counted from the last record
+    carrying gate_marker (the first gate of the sequence), or from the start of the stream if
+    no gate marker is used. Photons outside of the histogram are counted as dropped.
+
+    The records of a readout are decoded at once with numpy. The sync overflows and the last
+    gate marker are carried over to the next readout. Only adding the counts to the histogram
+    is done with the lock held, so the histogram can be read from another thread while the
+    records are decoded.
+    """
+    T3_WRAPAROUND = 65536
+    SPECIAL_CHANNEL = 15
+
+    def __init__(self, number_of_bins, bin_factor=1, number_of_gates=0, channels=(1, 2, 3, 4),
+                 gate_marker=None):
+        """
+        @param int number_of_bins: number of bins of the histogram (of each gate)
+        @param int bin_factor: number of dtime units per bin
+        @param int number_of_gates: number of gates, 0 for an ungated histogram
+        @param tuple channels: photon channels to histogram
+        @param int gate_marker: marker bit mask (1, 2, 4 or 8) of the first gate, None to count
+                                the gates from the start of the stream
+        """
+        self.number_of_bins = int(number_of_bins)
+        self.bin_factor = max(int(bin_factor), 1)
+        self.number_of_gates = int(number_of_gates)
+        self.channels = tuple(channels)
+        # lookup table of the histogrammed channels
+        self._is_photon_channel = np.zeros(16, dtype=bool)
+        self._is_photon_channel[list(self.channels)] = True
+        self.gate_marker = gate_marker
+        if self.number_of_gates > 0:
+            self._shape = (self.number_of_gates, self.number_of_bins)
+        else:
+            self._shape = (self.number_of_bins, )
+        self._histogram = np.zeros(self._shape, dtype=np.uint64)
+        self._lock = Mutex()
+        self.reset()
+
+    def reset(self):
+        """ Clear the histogram and the statistics and start a new stream. """
+        with self._lock:
+            self._histogram[...] = 0
+        self.photons = 0
+        self.dropped_photons = 0
+        self.overflows = 0
+        self.markers = 0
+        self.reset_stream()
+        return
+
+    def reset_stream(self):
+        """ Start a new stream of records (e.g. after the device was restarted), keeping the
+        histogram.
+        """
+        self._sync_overflows = 0
+        self._first_gate_sync = -1
+        return
+
+    def add_records(self, records):
+        """ Decode records and add their photons to the histogram.
+
+        @param numpy.ndarray records: uint32 records in the order they were recorded
+
+        @return int: number of photons added to the histogram
+        """
+        records = np.asarray(records, dtype=np.uint32)
+        if records.size == 0:
+            return 0
+        channel, dtime, nsync = decode_t3_records(records)
+        special = channel == self.SPECIAL_CHANNEL
+        overflow = special & (dtime == 0)
+        marker = special & (dtime != 0)
+
+        # absolute sync number of every record
+        sync_overflows = self._sync_overflows + np.cumsum(overflow, dtype=np.int64)
+        self._sync_overflows = int(sync_overflows[-1])
+        sync = sync_overflows * self.T3_WRAPAROUND + nsync
+
+        photon = self._is_photon_channel[channel]
+        bins = dtime // self.bin_factor
+        in_histogram = photon & (bins < self.number_of_bins)
+        if self.number_of_gates > 0:
+            if self.gate_marker is None:
+                gate = sync % self.number_of_gates
+            else:
+                # sync number of the last first gate, carried over from the previous records
+                first_gate_sync = np.where(marker & ((dtime & self.gate_marker) != 0), sync, -1)
+                first_gate_sync[0] = max(first_gate_sync[0], self._first_gate_sync)
+                np.maximum.accumulate(first_gate_sync, out=first_gate_sync)
+                self._first_gate_sync = int(first_gate_sync[-1])
+                gate = sync - first_gate_sync
+                in_histogram &= (first_gate_sync >= 0) & (gate < self.number_of_gates)
+            index = gate[in_histogram] * self.number_of_bins + bins[in_histogram]
+        else:
+            index = bins[in_histogram]
+        counts = np.bincount(index, minlength=self._histogram.size)
+
+        with self._lock:
+            np.add(self._histogram.reshape(-1), counts, out=self._histogram.reshape(-1),
+                   casting='unsafe')
+        number_of_photons = int(np.count_nonzero(photon))
+        self.photons += number_of_photons
+        self.dropped_photons += number_of_photons - index.size
+        self.overflows += int(np.count_nonzero(overflow))
+        self.markers += int(np.count_nonzero(marker))
+        return index.size
+
+    def get_histogram(self, buffer=None):
+        """ Get a copy of the histogram.
+
+        @param numpy.ndarray buffer: optional, uint64 array of the shape of the histogram the
+                                     histogram is copied to
+
+        @return numpy.ndarray: the histogram, the given buffer if it could be used
+        """
+        if buffer is None or buffer.shape != self._shape or buffer.dtype != np.uint64:
+            buffer = np.empty(self._shape, dtype=np.uint64)
+        with self._lock:
+            buffer[...] = self._histogram
+        return buffer
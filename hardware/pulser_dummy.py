@@ -20,7 +20,9 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import numpy as np
 import os
+import re
 from collections import OrderedDict
 from fnmatch import fnmatch
 
@@ -34,6 +36,11 @@ class PulserDummy(Base, PulserInterface):
     Be careful in adjusting the method names in that class, since some of them
     are also connected to the mwsourceinterface (to give the AWG the possibility
     to act like a microwave source).
+
+    When an asset is loaded, the samples of the laser channel (config option
+    'laser_channel', default 'd_ch1') are decoded from the sampled files into
+    the timing of the laser pulses. A FastCounterDummy connected to this
+    pulser simulates its photon counts from them (see get_laser_pulses).
     """
     _modclass = 'PulserDummy'
     _modtype = 'hardware'
@@ -110,6 +117,14 @@ class PulserDummy(Base, PulserInterface):
 
         self.current_status = 0    # that means off, not running.
 
+        if 'laser_channel' in config.keys():
+            self.laser_channel = config['laser_channel']
+        else:
+            self.laser_channel = 'd_ch1'
+
+        # laser pulses of the loaded asset, decoded in load_asset
+        self._laser_pulses = None
+
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
 
@@ -343,6 +358,12 @@ class PulserDummy(Base, PulserInterface):
             load_dict = {}
         if asset_name in self.uploaded_assets_list:
             self.current_loaded_asset = asset_name
+            try:
+                self._laser_pulses = self._decode_laser_pulses(asset_name)
+            except Exception:
+                self.log.exception('PulserDummy: Decoding the laser channel {0} of asset "{1}" '
+                                   'failed.'.format(self.laser_channel, asset_name))
+                self._laser_pulses = None
         return 0
 
     def get_loaded_asset(self):
@@ -353,6 +374,19 @@ class PulserDummy(Base, PulserInterface):
         """
         return self.current_loaded_asset
 
+    def get_laser_pulses(self):
+        """ Retrieve the timing of the laser pulses of the loaded asset.
+
+        @return tuple(numpy.ndarray, numpy.ndarray, float): start times and
+                    lengths of the laser pulses in seconds and the length of
+                    the whole asset in seconds. None if no asset is loaded or
+                    its laser channel could not be decoded.
+
+        Not part of the PulserInterface, used by the FastCounterDummy to
+        simulate the measured photon counts.
+        """
+        return self._laser_pulses
+
     def clear_all(self):
         """ Clears all loaded waveform from the pulse generators RAM.
 
@@ -362,6 +396,7 @@ class PulserDummy(Base, PulserInterface):
         (PulseBlaster, FPGA).
         """
         self.current_loaded_asset = None
+        self._laser_pulses = None
         return
 
     def get_status(self):
@@ -846,6 +881,132 @@ class PulserDummy(Base, PulserInterface):
         filename_list = [f for f in os.listdir(self.host_waveform_directory) if (f.endswith('.wfmx') or f.endswith('.mat') or f.endswith('.wfm') or f.endswith('.seq') or f.endswith('.seqx'))]
         return filename_list
 
+    def _decode_laser_pulses(self, asset_name):
+        """ Decode the laser pulses from the sampled files of an asset.
+
+        @param str asset_name: name of the uploaded asset
+
+        @return tuple: see get_laser_pulses, None if the laser channel was not
+                       sampled
+        """
+        file_list = self._get_filenames_on_host()
+        laser_number = int(self.laser_channel.split('ch')[-1])
+        if asset_name + '.seq' in file_list:
+            return self._decode_seq_laser_pulses(asset_name + '.seq', laser_number)
+        if asset_name + '.fpga' in file_list:
+            laser_samples = self._read_fpga_laser_samples(asset_name + '.fpga', laser_number)
+            sample_rate = self.sample_rate
+        else:
+            # the markers of an analog channel are the digital channels 2n-1 and 2n
+            filename = '{0}_ch{1:d}.wfm'.format(asset_name, (laser_number + 1) // 2)
+            if filename not in file_list:
+                self.log.warning('PulserDummy: The laser channel {0} was not sampled for asset '
+                                 '"{1}".'.format(self.laser_channel, asset_name))
+                return None
+            laser_samples, sample_rate = self._read_wfm_laser_samples(filename, laser_number)
+        rising, falling = self._get_edges(laser_samples)
+        return (rising / sample_rate, (falling - rising) / sample_rate,
+                laser_samples.size / sample_rate)
+
+    def _decode_seq_laser_pulses(self, filename, laser_number):
+        """ Decode the laser pulses of a seq-file from its waveforms. Every
+        line is repeated as often as given (once for infinite repetitions).
+
+        @param str filename: name of the seq-file
+        @param int laser_number: number of the digital laser channel
+
+        @return tuple: see get_laser_pulses
+        """
+        with open(os.path.join(self.host_waveform_directory, filename), 'r') as seq_file:
+            lines = seq_file.read().splitlines()
+        wfm_suffix = '_ch{0:d}.wfm'.format((laser_number + 1) // 2)
+        starts = []
+        lengths = []
+        decoded_waveforms = dict()
+        sequence_length = 0.0
+        for line in lines:
+            names = re.findall(r'"([^"]*)"', line)
+            if not names:
+                continue
+            repetitions = max(int(line.rsplit('"', 1)[1].split(',')[1]), 1)
+            laser_names = [name for name in names if name.endswith(wfm_suffix)]
+            if not laser_names:
+                self.log.warning('PulserDummy: The laser channel {0} was not sampled for '
+                                 'sequence "{1}".'.format(self.laser_channel, filename))
+                return None
+            if laser_names[0] not in decoded_waveforms:
+                laser_samples, sample_rate = self._read_wfm_laser_samples(laser_names[0],
+                                                                          laser_number)
+                rising, falling = self._get_edges(laser_samples)
+                decoded_waveforms[laser_names[0]] = (rising / sample_rate,
+                                                     (falling - rising) / sample_rate,
+                                                     laser_samples.size / sample_rate)
+            waveform_starts, waveform_lengths, waveform_length = decoded_waveforms[laser_names[0]]
+            for repetition in range(repetitions):
+                starts.append(waveform_starts + sequence_length)
+                lengths.append(waveform_lengths)
+                sequence_length += waveform_length
+        if not starts:
+            return None
+        return np.concatenate(starts), np.concatenate(lengths), sequence_length
+
+    def _read_wfm_laser_samples(self, filename, laser_number):
+        """ Read the samples of a marker from a wfm-file.
+
+        @param str filename: name of the wfm-file
+        @param int laser_number: number of the digital channel of the marker
+
+        @return tuple(numpy.ndarray, float): bool samples of the marker and the
+                                             sample rate of the file
+        """
+        filepath = os.path.join(self.host_waveform_directory, filename)
+        with open(filepath, 'rb') as wfm_file:
+            # header: 'MAGIC 1000\r\n#' + number of digits + number of bytes
+            header = wfm_file.read(32)
+            header_start = header.index(b'#') + 1
+            number_of_digits = int(header[header_start:header_start + 1])
+            number_of_bytes = int(header[header_start + 1:header_start + 1 + number_of_digits])
+            wfm_file.seek(-32, 2)
+            footer = wfm_file.read()
+        clock = re.search(rb'CLOCK\s+(\S+)', footer)
+        sample_rate = float(clock.group(1)) if clock is not None else self.sample_rate
+        samples = np.memmap(filepath, dtype='float32, uint8', mode='r',
+                            offset=header_start + 1 + number_of_digits,
+                            shape=(number_of_bytes // 5, ))
+        # marker 1 (odd digital channel) is bit 6, marker 2 is bit 7
+        marker_bit = 6 if laser_number % 2 == 1 else 7
+        laser_samples = (samples['f1'] & (1 << marker_bit)) != 0
+        del samples
+        return laser_samples, sample_rate
+
+    def _read_fpga_laser_samples(self, filename, laser_number):
+        """ Read the samples of a digital channel from a fpga-file.
+
+        @param str filename: name of the fpga-file
+        @param int laser_number: number of the digital channel
+
+        @return numpy.ndarray: bool samples of the channel
+        """
+        samples = np.fromfile(os.path.join(self.host_waveform_directory, filename),
+                              dtype=np.uint8)
+        return (samples & (1 << (laser_number - 1))) != 0
+
+    def _get_edges(self, samples):
+        """ Find the rising and falling edges of a digital channel.
+
+        @param numpy.ndarray samples: bool samples of the channel
+
+        @return tuple(numpy.ndarray, numpy.ndarray): indices of the first high
+                    sample and of the first low sample after each pulse. A
+                    pulse still high at the end ends at the last sample.
+        """
+        edges = np.flatnonzero(samples[1:] != samples[:-1]) + 1
+        if samples.size > 0 and samples[0]:
+            edges = np.concatenate(([0], edges))
+        if edges.size % 2 == 1:
+            edges = np.concatenate((edges, [samples.size]))
+        return edges[0::2], edges[1::2]
+
     def _get_num_a_ch(self):
         """ Retrieve the number of available analog channels.
 
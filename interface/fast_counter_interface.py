@@ -150,10 +150,17 @@ class FastCounterInterface(metaclass=InterfaceMetaclass):
         pass
 
     @abc.abstractmethod
-    def get_data_trace(self):
+    def get_data_trace(self, buffer=None):
         """ Polls the current timetrace data from the fast counter.
 
-        Return value is a numpy array (dtype = int64).
+        @param numpy.ndarray buffer: optional, array the timetrace is written to, usually the
+                                     array returned by the previous call. It is only used if it
+                                     has the shape and the data type of the timetrace, otherwise
+                                     a new array is returned.
+
+        @return numpy.ndarray: the timetrace, an unsigned integer array (dtype = uint32 or
+                               uint64). This is the given buffer if it could be used.
+
         The binning, specified by calling configure() in forehand, must be
         taken care of in this hardware class. A possible overflow of the
         histogram bins must be caught here and taken care of.
@@ -161,5 +168,9 @@ class FastCounterInterface(metaclass=InterfaceMetaclass):
             returnarray[timebin_index]
         If the counter is GATED it will return a 2D-numpy-array with
             returnarray[gate_index, timebin_index]
+
+        The returned array belongs to the caller, who may modify it or pass it back as buffer.
+        So the hardware module must not keep a reference to it, and filling the buffer should
+        not need any temporary arrays of the size of the timetrace.
         """
         pass
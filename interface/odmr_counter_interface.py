@@ -80,6 +80,21 @@ class ODMRCounterInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    @abc.abstractmethod
+    def count_odmr_sweeps(self, length=100, sweeps=1):
+        """ Sweeps the microwave several times in a row and returns the counts of every sweep.
+
+        The sweeps are acquired hardware timed without interruption, so the microwave source
+        has to return to the first frequency after the last one (like in the usual list and
+        sweep modes with external trigger).
+
+        @param int length: length of microwave sweep in pixel
+        @param int sweeps: number of sweeps
+
+        @return float[][]: the photon counts per second, one line per sweep
+        """
+        pass
+
     @abc.abstractmethod
     def close_odmr(self):
         """ Close the odmr and clean up afterwards.
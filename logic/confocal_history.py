@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains the history store of the confocal logic.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import logging
+import os
+import queue
+import threading
+import uuid
+
+from core import config
+from core.util.mutex import Mutex
+
+logger = logging.getLogger(__name__)
+
+
+class ConfocalHistory:
+    """ History of confocal scan states with lazily compressed and incrementally saved entries.
+
+    The images of the entries are shared with the confocal logic copy-on-write (see
+    ConfocalImage.copy), so neither adding nor activating an entry copies image data. The images
+    of all entries except the active one are compressed by a background thread. If a history
+    directory is given, every entry is saved to its own file by the background thread right after
+    it was added. Closing the history then only has to wait for the pending files, and the status
+    variables of the logic only contain the ids of the entries.
+    """
+    _image_attributes = ('xy_image', 'depth_image')
+    _file_prefix = 'history_'
+    _file_extension = '.cfg'
+
+    def __init__(self, max_length=10, history_dir=None, compression_level=1):
+        """
+        @param int max_length: maximum number of entries, the oldest entries are dropped
+        @param str history_dir: directory for the entry files, None to keep the entries in
+                                memory only
+        @param int compression_level: zlib compression level of inactive images, 0 disables
+                                      the compression
+        """
+        self.max_length = max(int(max_length), 1)
+        self.history_dir = history_dir
+        self.compression_level = int(compression_level)
+        # index of the active entry
+        self.index = -1
+
+        self._entries = []
+        self._entry_ids = []
+        self._lock = Mutex()
+        self._jobs = queue.Queue()
+        self._worker_thread = threading.Thread(target=self._work_loop, daemon=True)
+        self._worker_thread.start()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry_ids(self):
+        """ Get the ids of the entries in chronological order.
+
+        @return list: the ids, which are also the names of the entry files
+        """
+        with self._lock:
+            return list(self._entry_ids)
+
+    def get_entries(self):
+        """ Get the entries in chronological order.
+
+        @return list: the entries, inactive entries may contain compressed images
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def append(self, entry):
+        """ Add a new entry, which becomes the active entry. The entry must not be modified
+        afterwards.
+
+        @param ConfocalHistoryEntry entry: the new entry
+        """
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries.append(entry)
+            self._entry_ids.append(entry_id)
+            self._drop_old_entries()
+            self.index = len(self._entries) - 1
+        if self.history_dir is not None:
+            self._jobs.put(('save', entry, entry_id))
+        self._compress_inactive_entries()
+        return
+
+    def activate(self, index):
+        """ Make an entry the active entry.
+
+        @param int index: index of the entry
+
+        @return ConfocalHistoryEntry: the entry with decompressed images
+        """
+        with self._lock:
+            entry = self._entries[index]
+            self.index = index
+            for name in self._image_attributes:
+                image = getattr(entry, name, None)
+                if image is not None and image.is_compressed:
+                    setattr(entry, name, image.decompressed())
+        self._compress_inactive_entries()
+        return entry
+
+    def load(self, entry_ids, create_entry):
+        """ Load saved entries from the history directory. The last entry becomes the active
+        entry. Entry files which do not belong to the given ids are removed.
+
+        @param list entry_ids: ids of the entries in chronological order
+        @param function create_entry: function without arguments returning a new entry
+
+        @return list: ids of the entries which could not be loaded
+        """
+        failed_ids = []
+        if self.history_dir is None:
+            return list(entry_ids)
+        for entry_id in entry_ids:
+            try:
+                entry = create_entry()
+                entry.deserialize(config.load(self._get_entry_path(entry_id)))
+            except Exception:
+                failed_ids.append(entry_id)
+                continue
+            with self._lock:
+                self._entries.append(entry)
+                self._entry_ids.append(entry_id)
+                self._drop_old_entries()
+                self.index = len(self._entries) - 1
+        self._jobs.put(('clean', None, None))
+        self._compress_inactive_entries()
+        return failed_ids
+
+    def close(self):
+        """ Wait until all entries are saved and stop the background thread.
+
+        @return list: the ids of the entries in chronological order
+        """
+        self._jobs.put(None)
+        self._worker_thread.join()
+        return self.get_entry_ids()
+
+    def _drop_old_entries(self):
+        """ Remove the oldest entries exceeding max_length. Has to be called with the lock
+        held.
+        """
+        while len(self._entries) > self.max_length:
+            self._entries.pop(0)
+            entry_id = self._entry_ids.pop(0)
+            if self.history_dir is not None:
+                self._jobs.put(('remove', None, entry_id))
+        return
+
+    def _compress_inactive_entries(self):
+        """ Queue the compression of the entries which are not active. """
+        if self.compression_level <= 0:
+            return
+        with self._lock:
+            entries = [entry for index, entry in enumerate(self._entries) if index != self.index]
+        for entry in entries:
+            self._jobs.put(('compress', entry, None))
+        return
+
+    def _is_inactive_entry(self, entry):
+        """ Check whether an entry is part of the history but not the active one. Has to be
+        called with the lock held.
+
+        @param ConfocalHistoryEntry entry: the entry
+
+        @return bool: True if the entry may be compressed
+        """
+        for index, history_entry in enumerate(self._entries):
+            if history_entry is entry:
+                return index != self.index
+        return False
+
+    def _compress_entry(self, entry):
+        """ Compress the images of an inactive entry. Runs in the background thread.
+
+        The compression itself is done without holding the lock, the compressed images are only
+        set if the entry is still inactive afterwards.
+
+        @param ConfocalHistoryEntry entry: the entry
+        """
+        with self._lock:
+            if not self._is_inactive_entry(entry):
+                return
+            images = dict()
+            for name in self._image_attributes:
+                image = getattr(entry, name, None)
+                if image is not None and not image.is_compressed:
+                    images[name] = image
+        compressed_images = dict()
+        for name, image in images.items():
+            compressed_images[name] = image.compressed(self.compression_level)
+        with self._lock:
+            if not self._is_inactive_entry(entry):
+                return
+            for name, compressed_image in compressed_images.items():
+                if getattr(entry, name) is images[name]:
+                    setattr(entry, name, compressed_image)
+        return
+
+    def _save_entry(self, entry, entry_id):
+        """ Save an entry to its file. Runs in the background thread.
+
+        @param ConfocalHistoryEntry entry: the entry
+        @param str entry_id: id of the entry
+        """
+        with self._lock:
+            if entry_id not in self._entry_ids:
+                return
+        filepath = self._get_entry_path(entry_id)
+        # write to a temporary file first, so an interrupted write never leaves a broken entry
+        config.save(filepath + '.tmp', entry.serialize())
+        os.replace(filepath + '.tmp', filepath)
+        return
+
+    def _remove_entry_file(self, entry_id):
+        """ Remove the file of an entry. Runs in the background thread.
+
+        @param str entry_id: id of the entry
+        """
+        filepath = self._get_entry_path(entry_id)
+        if os.path.isfile(filepath):
+            os.remove(filepath)
+        return
+
+    def _remove_unused_files(self):
+        """ Remove entry files which do not belong to the history. Runs in the background
+        thread.
+        """
+        with self._lock:
+            used_files = set(self._file_prefix + entry_id + self._file_extension
+                             for entry_id in self._entry_ids)
+        for filename in os.listdir(self.history_dir):
+            if (filename.startswith(self._file_prefix) and filename not in used_files
+                    and (filename.endswith(self._file_extension)
+                         or filename.endswith(self._file_extension + '.tmp'))):
+                os.remove(os.path.join(self.history_dir, filename))
+        return
+
+    def _get_entry_path(self, entry_id):
+        """ Get the path of the file of an entry.
+
+        @param str entry_id: id of the entry
+
+        @return str: the file path
+        """
+        return os.path.join(self.history_dir, self._file_prefix + entry_id + self._file_extension)
+
+    def _work_loop(self):
+        """ Executes the queued jobs. Runs in the background thread. """
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            action, entry, entry_id = job
+            try:
+                if action == 'save':
+                    self._save_entry(entry, entry_id)
+                elif action == 'remove':
+                    self._remove_entry_file(entry_id)
+                elif action == 'clean':
+                    self._remove_unused_files()
+                elif action == 'compress':
+                    self._compress_entry(entry)
+            except Exception:
+                logger.exception('Confocal history job "{0}" failed.'.format(action))
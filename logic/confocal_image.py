@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains the compact image model of confocal scans.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+import zlib
+
+
+class ConfocalImage:
+    """ Image of a confocal scan stored as axis vectors and a single plane of counts.
+
+    The image consists of lines (rows) of pixels (columns). The pixel positions along a line are
+    given by horizontal_axis and the line positions by vertical_axis. The third scanner axis has
+    one position per line (line_positions), e.g. the z position at which a line of a xy scan was
+    taken. The names of the horizontal and the vertical axis are given by axes, e.g. 'xy', 'xz' or
+    'yz'.
+
+    For compatibility the image can be read like the former arrays of shape (lines, pixels, 4)
+    containing [x, y, z, counts] for every pixel, e.g. image[:, :, 3] is the counts plane and
+    image[line, :, 0] are the x positions of a line. The position planes are not stored but
+    computed on the fly as read-only views.
+
+    Copies share their data (copy-on-write): the shared arrays are made read-only and
+    make_writable has to be called before an image is modified. The counts of images that are
+    not used for a while can be kept zlib compressed (see compressed and decompressed).
+    """
+    _axis_names = 'xyz'
+
+    def __init__(self, horizontal_axis, vertical_axis, line_positions=0., axes='xy',
+                 dtype='float32'):
+        """
+        @param numpy.ndarray horizontal_axis: positions of the pixels along a line
+        @param numpy.ndarray vertical_axis: positions of the lines
+        @param line_positions: position of every line along the third axis, a single value for
+                               all lines or an array with one value per line
+        @param str axes: names of the horizontal and the vertical axis, e.g. 'xy'
+        @param dtype: numpy data type of the counts, e.g. 'float32' or 'uint32'
+        """
+        if len(axes) != 2 or axes[0] == axes[1] or not set(axes) <= set(self._axis_names):
+            raise ValueError('Invalid image axes "{0}".'.format(axes))
+        self.axes = axes
+        self.horizontal_axis = np.array(horizontal_axis, dtype=float)
+        self.vertical_axis = np.array(vertical_axis, dtype=float)
+        self.line_positions = np.empty(self.vertical_axis.size, dtype=float)
+        self.line_positions[:] = line_positions
+        self.counts = np.zeros((self.vertical_axis.size, self.horizontal_axis.size), dtype=dtype)
+        # zlib compressed counts with their data type and shape while counts is None
+        self._compressed_counts = None
+
+    @classmethod
+    def from_array(cls, image, axes='xy', dtype='float32'):
+        """ Create an image from an array of [x, y, z, counts] pixels.
+
+        @param numpy.ndarray image: array of shape (lines, pixels, 4)
+        @param str axes: names of the horizontal and the vertical axis of the image
+        @param dtype: numpy data type of the counts
+
+        @return ConfocalImage: the image
+        """
+        image = np.asarray(image)
+        horizontal_index = cls._axis_names.index(axes[0])
+        vertical_index = cls._axis_names.index(axes[1])
+        line_index = 3 - horizontal_index - vertical_index
+        new_image = cls(image[0, :, horizontal_index], image[:, 0, vertical_index],
+                        image[:, 0, line_index], axes=axes, dtype=dtype)
+        new_image.counts[:] = image[:, :, 3]
+        return new_image
+
+    @classmethod
+    def deserialize(cls, serialized):
+        """ Create an image from the dict created by serialize.
+
+        @param dict serialized: the serialized image
+
+        @return ConfocalImage: the image
+        """
+        counts = np.asarray(serialized['counts'])
+        image = cls(serialized['horizontal_axis'], serialized['vertical_axis'],
+                    serialized['line_positions'], axes=serialized['axes'], dtype=counts.dtype)
+        image.counts[:] = counts
+        return image
+
+    def serialize(self):
+        """ Give out a dictionary that can be saved via the usual means.
+
+        @return dict: the axes, the positions and the counts of the image
+        """
+        serialized = dict()
+        serialized['axes'] = self.axes
+        serialized['horizontal_axis'] = self.horizontal_axis
+        serialized['vertical_axis'] = self.vertical_axis
+        serialized['line_positions'] = self.line_positions
+        serialized['counts'] = self.get_plane(3)
+        return serialized
+
+    def copy(self):
+        """ Create a copy of the image, which shares the data with this image until one of both
+        is modified.
+
+        @return ConfocalImage: the copy
+        """
+        new_image = ConfocalImage.__new__(ConfocalImage)
+        new_image.__dict__.update(self.__dict__)
+        for array in (self.counts, self.line_positions):
+            if array is not None:
+                array.flags.writeable = False
+        return new_image
+
+    def make_writable(self):
+        """ Get own writable copies of the counts and the line positions if they are shared with
+        other images. Has to be called before the image is modified.
+        """
+        if self.is_compressed:
+            self.counts = self._decompress_counts()
+            self._compressed_counts = None
+        elif not self.counts.flags.writeable:
+            self.counts = self.counts.copy()
+        if not self.line_positions.flags.writeable:
+            self.line_positions = self.line_positions.copy()
+        return
+
+    @property
+    def is_compressed(self):
+        """ True if the counts are only kept compressed. """
+        return self.counts is None
+
+    def compressed(self, level=1):
+        """ Create a copy of the image keeping the counts zlib compressed.
+
+        @param int level: zlib compression level from 1 (fastest) to 9 (smallest)
+
+        @return ConfocalImage: the compressed copy, which has to be decompressed before the
+                               counts can be accessed
+        """
+        new_image = self.copy()
+        if not self.is_compressed:
+            new_image.counts = None
+            new_image._compressed_counts = (
+                zlib.compress(np.ascontiguousarray(self.counts).tobytes(), level),
+                self.counts.dtype, self.counts.shape)
+        return new_image
+
+    def decompressed(self):
+        """ Create a copy of the image with accessible counts.
+
+        @return ConfocalImage: the decompressed copy or a shared copy of an uncompressed image
+        """
+        new_image = self.copy()
+        if self.is_compressed:
+            new_image.counts = self._decompress_counts()
+            new_image.counts.flags.writeable = False
+            new_image._compressed_counts = None
+        return new_image
+
+    def _decompress_counts(self):
+        """ Restore the counts array from its compressed form.
+
+        @return numpy.ndarray: writable array of the counts
+        """
+        data, dtype, shape = self._compressed_counts
+        return np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape).copy()
+
+    @property
+    def shape(self):
+        """ Shape of the equivalent array of [x, y, z, counts] pixels. """
+        return (self.vertical_axis.size, self.horizontal_axis.size, 4)
+
+    @property
+    def dtype(self):
+        """ Data type of the counts. """
+        if self.is_compressed:
+            return self._compressed_counts[1]
+        return self.counts.dtype
+
+    @property
+    def nbytes(self):
+        """ Memory used by the image data in bytes. """
+        if self.is_compressed:
+            counts_nbytes = len(self._compressed_counts[0])
+        else:
+            counts_nbytes = self.counts.nbytes
+        return (counts_nbytes + self.horizontal_axis.nbytes + self.vertical_axis.nbytes
+                + self.line_positions.nbytes)
+
+    def __len__(self):
+        return self.vertical_axis.size
+
+    def get_plane(self, index):
+        """ Get a plane of the equivalent array of [x, y, z, counts] pixels.
+
+        @param int index: 0, 1 or 2 for the x, y or z positions, 3 for the counts
+
+        @return numpy.ndarray: the plane of shape (lines, pixels). The position planes are
+                               read-only views.
+        """
+        if index == 3:
+            if self.is_compressed:
+                return self._decompress_counts()
+            return self.counts
+        axis_name = self._axis_names[index]
+        plane_shape = self.shape[:2]
+        if axis_name == self.axes[0]:
+            return np.broadcast_to(self.horizontal_axis[np.newaxis, :], plane_shape)
+        if axis_name == self.axes[1]:
+            return np.broadcast_to(self.vertical_axis[:, np.newaxis], plane_shape)
+        return np.broadcast_to(self.line_positions[:, np.newaxis], plane_shape)
+
+    def get_line_path(self, line):
+        """ Get the scanner positions of the pixels of a line.
+
+        @param int line: the number of the line
+
+        @return numpy.ndarray: the x, y and z positions, shape (3, pixels)
+        """
+        path = np.empty((3, self.horizontal_axis.size))
+        for index in range(3):
+            path[index] = self.get_plane(index)[line]
+        return path
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, )
+        key = key + (slice(None), ) * (3 - len(key))
+        if len(key) != 3:
+            raise IndexError('Too many indices for a confocal image.')
+        planes = np.arange(4)[key[2]]
+        if np.ndim(planes) == 0:
+            return self.get_plane(int(planes))[key[:2]]
+        return np.stack([self.get_plane(int(index))[key[:2]] for index in planes], axis=-1)
@@ -27,8 +27,12 @@ import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from io import BytesIO
+import os
+import time
 
 from logic.generic_logic import GenericLogic
+from logic.confocal_history import ConfocalHistory
+from logic.confocal_image import ConfocalImage
 from core.util.mutex import Mutex
 
 
@@ -127,17 +131,17 @@ class ConfocalHistoryEntry(QtCore.QObject):
         confocal.initialize_image()
         try:
             if confocal.xy_image.shape == self.xy_image.shape:
-                confocal.xy_image = np.copy(self.xy_image)
+                confocal.xy_image = self.xy_image.copy()
         except AttributeError:
-            self.xy_image = np.copy(confocal.xy_image)
+            self.xy_image = confocal.xy_image.copy()
 
         confocal._zscan = True
         confocal.initialize_image()
         try:
             if confocal.depth_image.shape == self.depth_image.shape:
-                confocal.depth_image = np.copy(self.depth_image)
+                confocal.depth_image = self.depth_image.copy()
         except AttributeError:
-            self.depth_image = np.copy(confocal.depth_image)
+            self.depth_image = confocal.depth_image.copy()
         confocal._zscan = False
 
     def snapshot(self, confocal):
@@ -163,8 +167,8 @@ class ConfocalHistoryEntry(QtCore.QObject):
         self.tilt_reference_y = confocal._tiltreference_y
         self.tilt_slope_x = confocal._tilt_variable_ax
         self.tilt_slope_y = confocal._tilt_variable_ay
-        self.xy_image = np.copy(confocal.xy_image)
-        self.depth_image = np.copy(confocal.depth_image)
+        self.xy_image = confocal.xy_image.copy()
+        self.depth_image = confocal.depth_image.copy()
 
     def serialize(self):
         """ Give out a dictionary that can be saved via the usual means """
@@ -185,8 +189,8 @@ class ConfocalHistoryEntry(QtCore.QObject):
         serialized['tilt_point3'] = self.point3
         serialized['tilt_reference'] = [self.tilt_reference_x, self.tilt_reference_y]
         serialized['tilt_slope'] = [self.tilt_slope_x, self.tilt_slope_y]
-        serialized['xy_image'] = self.xy_image
-        serialized['depth_image'] = self.depth_image
+        serialized['xy_image'] = self.xy_image.serialize()
+        serialized['depth_image'] = self.depth_image.serialize()
         return serialized
 
     def deserialize(self, serialized):
@@ -221,23 +225,36 @@ class ConfocalHistoryEntry(QtCore.QObject):
         if 'tilt_point3' in serialized and len(serialized['tilt_point3'] ) == 3:
             self.point3 = np.array(serialized['tilt_point3'])
         if 'xy_image' in serialized:
-            if isinstance(serialized['xy_image'], np.ndarray):
-                self.xy_image = serialized['xy_image']
-            else:
-                try:
-                    self.xy_image = numpy_from_b(
-                            eval(serialized['xy_image']))['image']
-                except:
-                    raise OldConfigFileError()
+            self.xy_image = self._deserialize_image(serialized['xy_image'], depth=False)
         if 'depth_image' in serialized:
-            if isinstance(serialized['depth_image'], np.ndarray):
-                self.depth_image = serialized['depth_image'].copy()
-            else:
-                try:
-                    self.depth_image = numpy_from_b(
-                            eval(serialized['depth_image']))['image']
-                except:
-                    raise OldConfigFileError()
+            self.depth_image = self._deserialize_image(serialized['depth_image'], depth=True)
+
+    @staticmethod
+    def _deserialize_image(serialized_image, depth):
+        """ Restore a confocal image from its serialized form or from an array of
+        [x, y, z, counts] pixels saved by older versions.
+
+        @param serialized_image: dict created by ConfocalImage.serialize, numpy array or bytes
+                                 string of a compressed numpy array
+        @param bool depth: True for a depth image, False for a xy image
+
+        @return ConfocalImage: the image
+        """
+        if isinstance(serialized_image, dict):
+            return ConfocalImage.deserialize(serialized_image)
+        if not isinstance(serialized_image, np.ndarray):
+            try:
+                serialized_image = numpy_from_b(eval(serialized_image))['image']
+            except:
+                raise OldConfigFileError()
+        if not depth:
+            axes = 'xy'
+        elif np.ptp(serialized_image[0, :, 0]) == 0 and np.ptp(serialized_image[0, :, 1]) > 0:
+            # the lines of the depth scan are along y
+            axes = 'yz'
+        else:
+            axes = 'xz'
+        return ConfocalImage.from_array(serialized_image, axes=axes)
 
 
 class ConfocalLogic(GenericLogic):
@@ -286,6 +303,37 @@ class ConfocalLogic(GenericLogic):
         self.depth_scan_dir_is_xz = True
         self.permanent_scan = False
 
+        # number of image lines (forward and retrace) passed to the scanner as one path
+        if 'scan_lines_per_batch' in config.keys():
+            self.scan_lines_per_batch = max(int(config['scan_lines_per_batch']), 1)
+        else:
+            self.scan_lines_per_batch = 1
+
+        # maximum rate of image update signals in Hz, 0 means an update after every scan line
+        if 'image_update_rate' in config.keys():
+            self.image_update_rate = float(config['image_update_rate'])
+        else:
+            self.image_update_rate = 20.
+        self._last_image_update = 0.
+
+        # data type of the counts in the scan images
+        if 'image_dtype' in config.keys():
+            self.image_dtype = np.dtype(config['image_dtype'])
+        else:
+            self.image_dtype = np.dtype('float32')
+
+        # directory of the history entry files, by default a folder in the app status directory
+        if 'history_dir' in config.keys():
+            self.history_dir = config['history_dir']
+        else:
+            self.history_dir = None
+
+        # zlib compression level of the images of inactive history entries, 0 disables it
+        if 'history_compression_level' in config.keys():
+            self.history_compression_level = int(config['history_compression_level'])
+        else:
+            self.history_compression_level = 1
+
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
 
@@ -313,33 +361,25 @@ class ConfocalLogic(GenericLogic):
         self.z_range = self._scanning_device.get_position_range()[2]
 
         # restore here ...
-        self.history = []
         if 'max_history_length' in self._statusVariables:
-                self.max_history_length = self._statusVariables['max_history_length']
-                for i in reversed(range(1, self.max_history_length)):
-                    try:
-                        new_history_item = ConfocalHistoryEntry(self)
-                        new_history_item.deserialize(
-                            self._statusVariables['history_{0}'.format(i)])
-                        self.history.append(new_history_item)
-                    except KeyError:
-                        pass
-                    except OldConfigFileError:
-                        self.log.warning(
-                            'Old style config file detected. History {0} ignored.'.format(i))
-                    except:
-                        self.log.warning(
-                                'Restoring history {0} failed.'.format(i))
+            self.max_history_length = self._statusVariables['max_history_length']
         else:
             self.max_history_length = 10
+        self.history = ConfocalHistory(max_length=self.max_history_length,
+                                       history_dir=self._get_history_dir(),
+                                       compression_level=self.history_compression_level)
+        if 'history_entries' in self._statusVariables:
+            failed_ids = self.history.load(self._statusVariables['history_entries'],
+                                           lambda: ConfocalHistoryEntry(self))
+            for entry_id in failed_ids:
+                self.log.warning('Restoring history entry {0} failed.'.format(entry_id))
+        else:
+            self._load_status_variable_history()
         try:
-            new_state = ConfocalHistoryEntry(self)
-            new_state.deserialize(self._statusVariables['history_0'])
-            new_state.restore(self)
+            self.history.activate(len(self.history) - 1).restore(self)
         except:
             new_state = ConfocalHistoryEntry(self)
             new_state.restore(self)
-        finally:
             self.history.append(new_state)
 
         self.history_index = len(self.history) - 1
@@ -364,12 +404,59 @@ class ConfocalLogic(GenericLogic):
         closing_state = ConfocalHistoryEntry(self)
         closing_state.snapshot(self)
         self.history.append(closing_state)
-        histindex = 0
-        for state in reversed(self.history):
-            self._statusVariables['history_{0}'.format(histindex)] = state.serialize()
-            histindex += 1
+        # only the entries added since the activation are written, the others are saved already
+        entry_ids = self.history.close()
+        for key in list(self._statusVariables.keys()):
+            if key.startswith('history_'):
+                del self._statusVariables[key]
+        if self.history.history_dir is not None:
+            self._statusVariables['history_entries'] = entry_ids
+        else:
+            histindex = 0
+            for state in reversed(self.history.get_entries()):
+                self._statusVariables['history_{0}'.format(histindex)] = state.serialize()
+                histindex += 1
         return 0
 
+    def _get_history_dir(self):
+        """ Get the directory of the history entry files, create it if necessary.
+
+        @return str: path of the directory, None if the history can not be saved to files
+        """
+        if self.history_dir is not None:
+            history_dir = self.history_dir
+        elif self._manager is not None:
+            history_dir = os.path.join(self._manager.getStatusDir(),
+                                       'confocal_history_{0}'.format(self._name))
+        else:
+            return None
+        try:
+            if not os.path.isdir(history_dir):
+                os.makedirs(history_dir)
+        except OSError:
+            self.log.warning('The history directory {0} could not be created. The history is '
+                             'saved in the status variables instead.'.format(history_dir))
+            return None
+        return history_dir
+
+    def _load_status_variable_history(self):
+        """ Load the history entries saved as status variables 'history_0' (newest) to
+        'history_<max_history_length - 1>' by older versions or without history directory.
+        """
+        for i in reversed(range(self.max_history_length)):
+            if 'history_{0}'.format(i) not in self._statusVariables:
+                continue
+            try:
+                new_history_item = ConfocalHistoryEntry(self)
+                new_history_item.deserialize(self._statusVariables['history_{0}'.format(i)])
+                self.history.append(new_history_item)
+            except OldConfigFileError:
+                self.log.warning(
+                    'Old style config file detected. History {0} ignored.'.format(i))
+            except:
+                self.log.warning('Restoring history {0} failed.'.format(i))
+        return
+
     def switch_hardware(self, to_on=False):
         """ Switches the Hardware off or on.
 
@@ -498,32 +585,23 @@ class ConfocalLogic(GenericLogic):
         if self._zscan:
             if self.depth_scan_dir_is_xz:
                 self._image_vert_axis = self._Z
-                # creates an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((len(self._image_vert_axis), len(self._X), 4))
-                self.depth_image[:, : ,0] = np.full((len(self._image_vert_axis), len(self._X)), self._XL)
-                self.depth_image[:, :, 1] = self._current_y * np.ones((len(self._image_vert_axis), len(self._X)))
-                z_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                # creates an image of the lines along x at the current y position
+                self.depth_image = ConfocalImage(self._XL, self._image_vert_axis, self._current_y,
+                                                 axes='xz', dtype=self.image_dtype)
             else: # depth scan is yz instead of xz
                 self._image_vert_axis = self._Z
-                # creats an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((len(self._image_vert_axis), len(self._Y), 4))
-                self.depth_image[:, :, 0] = self._current_x * np.ones((len(self._image_vert_axis), len(self._Y)))
-                self.depth_image[:, :, 1] = np.full((len(self._image_vert_axis), len(self._Y)), self._YL)
-                z_value_matrix = np.full((len(self._Y), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                # creates an image of the lines along y at the current x position
+                self.depth_image = ConfocalImage(self._YL, self._image_vert_axis, self._current_x,
+                                                 axes='yz', dtype=self.image_dtype)
                 # now we are scanning along the y-axis, so we need a new return line along Y:
                 self._return_YL = np.linspace(self._YL[-1], self._YL[0], self.return_slowness)
                 self._return_AL = np.zeros(self._return_YL.shape)
             self.sigImageDepthInitialized.emit()
         else:
             self._image_vert_axis = self._Y
-            # creats an image where each pixel will be [x,y,z,counts]
-            self.xy_image = np.zeros((len(self._image_vert_axis), len(self._X), 4))
-            self.xy_image[:, :, 0] = np.full((len(self._image_vert_axis), len(self._X)), self._XL)
-            y_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Y)
-            self.xy_image[:, :, 1] = y_value_matrix.transpose()
-            self.xy_image[:, :, 2] = self._current_z * np.ones((len(self._image_vert_axis), len(self._X)))
+            # creates an image of the lines along x at the current z position
+            self.xy_image = ConfocalImage(self._XL, self._image_vert_axis, self._current_z,
+                                          axes='xy', dtype=self.image_dtype)
             self.sigImageXYInitialized.emit()
         return 0
 
@@ -667,85 +745,29 @@ class ConfocalLogic(GenericLogic):
                 new_history = ConfocalHistoryEntry(self)
                 new_history.snapshot(self)
                 self.history.append(new_history)
-                if len(self.history) > self.max_history_length:
-                    self.history.pop(0)
                 self.history_index = len(self.history) - 1
                 return
 
         image = self.depth_image if self._zscan else self.xy_image
+        # the image may share its data with history entries
+        image.make_writable()
 
         try:
-            if self._scan_counter == 0:
-                # make a line from the current cursor position to 
-                # the starting position of the first scan line of the scan
-                start_line = np.vstack((
-                    np.linspace(self._current_x, image[self._scan_counter, 0, 0], self.return_slowness),
-                    np.linspace(self._current_y, image[self._scan_counter, 0, 1], self.return_slowness),
-                    np.linspace(self._current_z, image[self._scan_counter, 0, 2], self.return_slowness),
-                    np.linspace(self._current_a, 0, self.return_slowness)
-                    ))
-                # move to the start position of the scan, counts are thrown away
-                start_line_counts = self._scanning_device.scan_line(start_line)
-                if start_line_counts[0] == -1:
-                    self.stopRequested = True
-                    self.signal_scan_lines_next.emit()
-                    return
-
-            # adjust z of line in image to current z before building the line
-            if not self._zscan:
-                image[self._scan_counter, :, 2] = self._current_z * np.ones(image[self._scan_counter, :, 2].shape)
-
-            # make a line in the scan, _scan_counter says which one it is
-            line = np.vstack((image[self._scan_counter, :, 0],
-                              image[self._scan_counter, :, 1],
-                              image[self._scan_counter, :, 2],
-                              image[self._scan_counter, :, 3]))
-            # scan the line in the scan
-            line_counts = self._scanning_device.scan_line(line)
-            if line_counts[0] == -1:
-                self.stopRequested = True
-                self.signal_scan_lines_next.emit()
-                return
-
-            # make a line to go to the starting position of the next scan line
-            if self.depth_scan_dir_is_xz:
-                return_line = np.vstack((
-                    self._return_XL,
-                    image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                    image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape),
-                    self._return_AL
-                    ))
+            if self.scan_lines_per_batch > 1:
+                scanned_lines = self._scan_line_batch(image)
             else:
-                return_line = np.vstack((
-                    image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
-                    self._return_YL,
-                    image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape),
-                    self._return_AL
-                    ))
-
-            # return the scanner to the start of next line, counts are thrown away
-            return_line_counts = self._scanning_device.scan_line(return_line)
-            if return_line_counts[0] == -1:
+                scanned_lines = self._scan_single_line(image)
+            if scanned_lines < 1:
                 self.stopRequested = True
                 self.signal_scan_lines_next.emit()
                 return
 
-            # update image with counts from the line we just scanned
-            if self._zscan:
-                if self.depth_scan_dir_is_xz:
-                    self.depth_image[self._scan_counter, :, 3] = line_counts
-                else:
-                    self.depth_image[self._scan_counter, :, 3] = line_counts
-                self.signal_depth_image_updated.emit()
-            else:
-                self.xy_image[self._scan_counter, :, 3] = line_counts
-                self.signal_xy_image_updated.emit()
-
             # next line in scan
-            self._scan_counter += 1
+            self._scan_counter += scanned_lines
 
             # stop scanning when last line scan was performed and makes scan not continuable
             if self._scan_counter >= np.size(self._image_vert_axis):
+                self._emit_image_updated(force=True)
                 if not self.permanent_scan:
                     self.stop_scanning()
                     if self._zscan:
@@ -754,6 +776,8 @@ class ConfocalLogic(GenericLogic):
                         self._xyscan_continuable = False
                 else:
                     self._scan_counter = 0
+            else:
+                self._emit_image_updated()
 
             self.signal_scan_lines_next.emit()
 
@@ -762,6 +786,159 @@ class ConfocalLogic(GenericLogic):
             self.stop_scanning()
             self.signal_scan_lines_next.emit()
 
+    def _scan_single_line(self, image):
+        """ Scan the image line _scan_counter with separate scanner calls for the line and the
+        retrace.
+
+        @param ConfocalImage image: the image to scan
+
+        @return int: number of scanned lines, 0 if the scanner failed
+        """
+        if self._scan_counter == 0:
+            # move to the start position of the scan, counts are thrown away
+            start_line_counts = self._scanning_device.scan_line(self._get_start_line(image))
+            if start_line_counts[0] == -1:
+                return 0
+
+        # adjust z of line in image to current z before building the line
+        if not self._zscan:
+            image.line_positions[self._scan_counter] = self._current_z
+
+        # scan the line in the scan
+        line_counts = self._scanning_device.scan_line(self._get_scan_line(image, self._scan_counter))
+        if line_counts[0] == -1:
+            return 0
+
+        # return the scanner to the start of next line, counts are thrown away
+        return_line_counts = self._scanning_device.scan_line(
+            self._get_return_line(image, self._scan_counter))
+        if return_line_counts[0] == -1:
+            return 0
+
+        # update image with counts from the line we just scanned
+        image.counts[self._scan_counter] = line_counts
+        return 1
+
+    def _scan_line_batch(self, image):
+        """ Scan up to scan_lines_per_batch image lines starting with line _scan_counter.
+
+        The lines and their retraces are concatenated to one path, which is scanned with a single
+        scanner call. The counts of the retraces are thrown away.
+
+        @param ConfocalImage image: the image to scan
+
+        @return int: number of scanned lines, 0 if the scanner failed
+        """
+        first_line = self._scan_counter
+        last_line = min(first_line + self.scan_lines_per_batch, np.size(self._image_vert_axis))
+
+        paths = []
+        if first_line == 0:
+            # move to the start position of the scan, counts are thrown away
+            paths.append(self._get_start_line(image))
+        for line in range(first_line, last_line):
+            # adjust z of line in image to current z before building the line
+            if not self._zscan:
+                image.line_positions[line] = self._current_z
+            paths.append(self._get_scan_line(image, line))
+            paths.append(self._get_return_line(image, line))
+        path = np.hstack(paths)
+
+        counts = self._scanning_device.scan_line(path)
+        if counts[0] == -1:
+            return 0
+        if np.size(counts) != path.shape[1]:
+            self.log.error('The scanner returned {0} values for a path of {1} '
+                           'positions.'.format(np.size(counts), path.shape[1]))
+            return 0
+
+        # split the counts into lines and throw away the start line and the retraces
+        start_length = paths[0].shape[1] if first_line == 0 else 0
+        line_length = image.shape[1]
+        batch_counts = np.reshape(counts[start_length:], (last_line - first_line, -1))
+        image.counts[first_line:last_line] = batch_counts[:, :line_length]
+        return last_line - first_line
+
+    def _get_start_line(self, image):
+        """ Make a line from the current cursor position to the starting position of the first
+        scan line of the scan.
+
+        @param ConfocalImage image: the image to scan
+
+        @return numpy.ndarray: the path, shape (4, return_slowness)
+        """
+        return np.vstack((
+            np.linspace(self._current_x, image[self._scan_counter, 0, 0], self.return_slowness),
+            np.linspace(self._current_y, image[self._scan_counter, 0, 1], self.return_slowness),
+            np.linspace(self._current_z, image[self._scan_counter, 0, 2], self.return_slowness),
+            np.linspace(self._current_a, 0, self.return_slowness)
+            ))
+
+    def _get_scan_line(self, image, line):
+        """ Make the path of a line in the scan.
+
+        @param ConfocalImage image: the image to scan
+        @param int line: the number of the line in the image
+
+        @return numpy.ndarray: the path, shape (4, pixels per line)
+        """
+        return np.vstack((image.get_line_path(line), np.zeros(image.shape[1])))
+
+    def _get_return_line(self, image, line):
+        """ Make a line to go from the end of a scan line to the starting position of the next
+        scan line.
+
+        @param ConfocalImage image: the image to scan
+        @param int line: the number of the scanned line in the image
+
+        @return numpy.ndarray: the path, shape (4, return_slowness)
+        """
+        if self.depth_scan_dir_is_xz:
+            return np.vstack((
+                self._return_XL,
+                image[line, 0, 1] * np.ones(self._return_XL.shape),
+                image[line, 0, 2] * np.ones(self._return_XL.shape),
+                self._return_AL
+                ))
+        else:
+            return np.vstack((
+                image[line, 0, 1] * np.ones(self._return_YL.shape),
+                self._return_YL,
+                image[line, 0, 2] * np.ones(self._return_YL.shape),
+                self._return_AL
+                ))
+
+    def _emit_image_updated(self, force=False):
+        """ Emit the update signal of the scanned image at most image_update_rate times per
+        second.
+
+        @param bool force: emit the signal in any case
+        """
+        now = time.time()
+        if (not force and self.image_update_rate > 0
+                and now - self._last_image_update < 1 / self.image_update_rate):
+            return
+        self._last_image_update = now
+        if self._zscan:
+            self.signal_depth_image_updated.emit()
+        else:
+            self.signal_xy_image_updated.emit()
+        return
+
+    def set_scan_lines_per_batch(self, scan_lines_per_batch):
+        """ Set the number of image lines scanned with a single scanner call.
+
+        With more than one line per batch, the lines and their retraces are passed to the
+        scanner as one path, which saves the overhead of the separate calls. A requested stop
+        is handled after the current batch.
+
+        @param int scan_lines_per_batch: number of lines, 1 for separate calls for every line
+
+        @return int: the number of lines per batch which is set
+        """
+        self.scan_lines_per_batch = max(int(scan_lines_per_batch), 1)
+        return self.scan_lines_per_batch
+
     def save_xy_data(self, colorscale_range=None, percentile_range=None):
         """ Save the current confocal xy data to file.
 
@@ -815,40 +992,32 @@ class ConfocalLogic(GenericLogic):
         axes = ['X', 'Y']
         crosshair_pos = [self.get_position()[0], self.get_position()[1]]
 
-        fig = self.draw_figure(data=figure_data,
-                               image_extent=image_extent,
-                               scan_axis=axes,
-                               cbar_range=colorscale_range,
-                               percentile_range=percentile_range,
-                               crosshair_pos=crosshair_pos
-                               )
+        plotfig_kwargs = dict()
+        plotfig_kwargs['data'] = figure_data
+        plotfig_kwargs['image_extent'] = image_extent
+        plotfig_kwargs['scan_axis'] = axes
+        plotfig_kwargs['cbar_range'] = colorscale_range
+        plotfig_kwargs['percentile_range'] = percentile_range
+        plotfig_kwargs['crosshair_pos'] = crosshair_pos
 
         # Save the image data and figure
         filelabel = 'confocal_xy_image'
-        self._save_logic.save_data(image_data,
-                                   filepath,
-                                   parameters=parameters,
-                                   filelabel=filelabel,
-                                   as_text=True,
-                                   timestamp=save_time,
-                                   plotfig=fig
-                                   )
-        #, as_xml=False, precision=None, delimiter=None)
-        plt.close(fig)
+        # the files and the figure are written in the background
+        self._save_logic.save_data_async(image_data,
+                                         filepath,
+                                         parameters=parameters,
+                                         filelabel=filelabel,
+                                         timestamp=save_time,
+                                         plotfig_function=self.draw_figure,
+                                         plotfig_kwargs=plotfig_kwargs
+                                         )
 
         # prepare the full raw data in an OrderedDict:
         data = OrderedDict()
-        x_data = []
-        y_data = []
-        z_data = []
-        counts_data = []
-
-        for row in self.xy_image:
-            for entry in row:
-                x_data.append(entry[0])
-                y_data.append(entry[1])
-                z_data.append(entry[2])
-                counts_data.append(entry[3])
+        x_data = self.xy_image[:, :, 0].flatten()
+        y_data = self.xy_image[:, :, 1].flatten()
+        z_data = self.xy_image[:, :, 2].flatten()
+        counts_data = self.xy_image[:, :, 3].flatten()
 
         data['x values (micron)'] = x_data
         data['y values (micron)'] = y_data
@@ -857,14 +1026,12 @@ class ConfocalLogic(GenericLogic):
 
         # Save the raw data to file
         filelabel = 'confocal_xy_data'
-        self._save_logic.save_data(data,
-                                   filepath,
-                                   parameters=parameters,
-                                   filelabel=filelabel,
-                                   as_text=True,
-                                   timestamp=save_time
-                                   )
-        #, as_xml=False, precision=None, delimiter=None)
+        self._save_logic.save_data_async(data,
+                                         filepath,
+                                         parameters=parameters,
+                                         filelabel=filelabel,
+                                         timestamp=save_time
+                                         )
 
         self.log.debug('Confocal Image saved to:\n{0}'.format(filepath))
 
@@ -925,40 +1092,32 @@ class ConfocalLogic(GenericLogic):
                         self.image_z_range[1]
                         ]
 
-        fig = self.draw_figure(data=figure_data,
-                               image_extent=image_extent,
-                               scan_axis=axes,
-                               cbar_range=colorscale_range,
-                               percentile_range=percentile_range,
-                               crosshair_pos=crosshair_pos
-                               )
+        plotfig_kwargs = dict()
+        plotfig_kwargs['data'] = figure_data
+        plotfig_kwargs['image_extent'] = image_extent
+        plotfig_kwargs['scan_axis'] = axes
+        plotfig_kwargs['cbar_range'] = colorscale_range
+        plotfig_kwargs['percentile_range'] = percentile_range
+        plotfig_kwargs['crosshair_pos'] = crosshair_pos
 
         # Save the image data and figure
         filelabel = 'confocal_xy_image'
-        self._save_logic.save_data(image_data,
-                                   filepath,
-                                   parameters=parameters,
-                                   filelabel=filelabel,
-                                   as_text=True,
-                                   timestamp=save_time,
-                                   plotfig=fig
-                                   )
-        #, as_xml=False, precision=None, delimiter=None)
-        plt.close(fig)
+        # the files and the figure are written in the background
+        self._save_logic.save_data_async(image_data,
+                                         filepath,
+                                         parameters=parameters,
+                                         filelabel=filelabel,
+                                         timestamp=save_time,
+                                         plotfig_function=self.draw_figure,
+                                         plotfig_kwargs=plotfig_kwargs
+                                         )
 
         # prepare the full raw data in an OrderedDict:
         data = OrderedDict()
-        x_data = []
-        y_data = []
-        z_data = []
-        counts_data = []
-
-        for row in self.depth_image:
-            for entry in row:
-                x_data.append(entry[0])
-                y_data.append(entry[1])
-                z_data.append(entry[2])
-                counts_data.append(entry[3])
+        x_data = self.depth_image[:, :, 0].flatten()
+        y_data = self.depth_image[:, :, 1].flatten()
+        z_data = self.depth_image[:, :, 2].flatten()
+        counts_data = self.depth_image[:, :, 3].flatten()
 
         data['x values (micros)'] = x_data
         data['y values (micros)'] = y_data
@@ -967,14 +1126,12 @@ class ConfocalLogic(GenericLogic):
 
         # Save the raw data to file
         filelabel = 'confocal_depth_data'
-        self._save_logic.save_data(data,
-                                   filepath,
-                                   parameters=parameters,
-                                   filelabel=filelabel,
-                                   as_text=True,
-                                   timestamp=save_time
-                                   )
-        #, as_xml=False, precision=None, delimiter=None)
+        self._save_logic.save_data_async(data,
+                                         filepath,
+                                         parameters=parameters,
+                                         filelabel=filelabel,
+                                         timestamp=save_time
+                                         )
 
         self.log.debug('Confocal Image saved to:\n{0}'.format(filepath))
 
@@ -1128,7 +1285,7 @@ class ConfocalLogic(GenericLogic):
     def history_forward(self):
         if self.history_index < len(self.history) - 1:
             self.history_index += 1
-            self.history[self.history_index].restore(self)
+            self.history.activate(self.history_index).restore(self)
             self.signal_xy_image_updated.emit()
             self.signal_depth_image_updated.emit()
             self._change_position('history')
@@ -1138,7 +1295,7 @@ class ConfocalLogic(GenericLogic):
     def history_back(self):
         if self.history_index > 0:
             self.history_index -= 1
-            self.history[self.history_index].restore(self)
+            self.history.activate(self.history_index).restore(self)
             self.signal_xy_image_updated.emit()
             self.signal_depth_image_updated.emit()
             self._change_position('history')
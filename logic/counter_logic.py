@@ -22,11 +22,15 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 from qtpy import QtCore
 from collections import OrderedDict
 import numpy as np
+import os
 import time
 import matplotlib.pyplot as plt
 
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
+from core.util.ring_buffer import RingBuffer
+from core.util.ring_buffer import RunningMedian
+from core.util.stream_recorder import StreamRecorder
 
 
 class CounterLogic(GenericLogic):
@@ -79,6 +83,22 @@ class CounterLogic(GenericLogic):
 
         self._counting_mode = 'continuous'
 
+        # If stream saving is enabled, the data to save is not kept in memory but streamed to a
+        # binary file (.npy) in chunks of save_chunk_length samples by a background thread.
+        # save_data then only finalizes this file. Modules reading _data_to_save during the
+        # measurement (e.g. the wavemeter logger) need stream saving to be disabled.
+        if 'stream_saving' in config.keys():
+            self._stream_saving = bool(config['stream_saving'])
+        else:
+            self._stream_saving = False
+        if 'save_chunk_length' in config.keys():
+            self._save_chunk_length = int(config['save_chunk_length'])
+        else:
+            self._save_chunk_length = 4096
+        self._save_recorder = None
+        # number of the last started recording, part of its file name
+        self._save_recorder_number = 0
+
 
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
@@ -91,10 +111,10 @@ class CounterLogic(GenericLogic):
                          of the state which should be reached after the event
                          has happen.
         """
-        self.countdata = np.zeros((self._count_length,))
-        self.countdata_smoothed = np.zeros((self._count_length,))
-        self.countdata2 = np.zeros((self._count_length,))
-        self.countdata_smoothed2 = np.zeros((self._count_length,))
+        # The count traces are kept in ring buffers. The attributes countdata, countdata_smoothed,
+        # countdata2 and countdata_smoothed2 return their contents in chronological order. The
+        # contiguous copy is made once per update and is read-only.
+        self._init_count_traces()
         self.rawdata = np.zeros([2, self._counting_samples])
 
         self.running = False
@@ -128,6 +148,77 @@ class CounterLogic(GenericLogic):
                 break
             QtCore.QCoreApplication.processEvents()
             time.sleep(0.1)
+        # complete the file of an unfinished recording, so the data can still be read
+        with self.threadlock:
+            if self._save_recorder is not None:
+                self._save_recorder.finalize()
+                self._save_recorder = None
+        return
+
+    @property
+    def countdata(self):
+        """ Count trace of the first channel in chronological order. """
+        return self._countdata_buffer.get_trace()
+
+    @countdata.setter
+    def countdata(self, trace):
+        self._countdata_buffer = RingBuffer.from_array(trace)
+
+    @property
+    def countdata_smoothed(self):
+        """ Smoothed count trace of the first channel in chronological order. """
+        return self._countdata_smoothed_buffer.get_trace()
+
+    @countdata_smoothed.setter
+    def countdata_smoothed(self, trace):
+        self._countdata_smoothed_buffer = RingBuffer.from_array(trace)
+
+    @property
+    def countdata2(self):
+        """ Count trace of the second channel in chronological order. """
+        return self._countdata2_buffer.get_trace()
+
+    @countdata2.setter
+    def countdata2(self, trace):
+        self._countdata2_buffer = RingBuffer.from_array(trace)
+
+    @property
+    def countdata_smoothed2(self):
+        """ Smoothed count trace of the second channel in chronological order. """
+        return self._countdata_smoothed2_buffer.get_trace()
+
+    @countdata_smoothed2.setter
+    def countdata_smoothed2(self, trace):
+        self._countdata_smoothed2_buffer = RingBuffer.from_array(trace)
+
+    def _init_count_traces(self):
+        """ Create empty (zero) count traces of length count_length for both channels and reset
+        the running medians used for smoothing.
+        """
+        self._countdata_buffer = RingBuffer(self._count_length)
+        self._countdata_smoothed_buffer = RingBuffer(self._count_length)
+        self._countdata2_buffer = RingBuffer(self._count_length)
+        self._countdata_smoothed2_buffer = RingBuffer(self._count_length)
+        median_window = min(self._smooth_window_length, self._count_length)
+        self._running_median = RunningMedian(median_window)
+        self._running_median2 = RunningMedian(median_window)
+        return
+
+    def _append_count_value(self, value, trace, smoothed_trace, running_median):
+        """ Append a new value to a count trace and update the smoothed trace.
+
+        @param float value: the new count value
+        @param RingBuffer trace: the count trace
+        @param RingBuffer smoothed_trace: the smoothed count trace
+        @param RunningMedian running_median: running median of the count trace
+
+        The newest (smooth_window_length/2 + 1) values of the smoothed trace are set to the
+        median of the last smooth_window_length count values.
+        """
+        trace.append(value)
+        smoothed_trace.append(0)
+        smoothed_trace.set_last(int(self._smooth_window_length / 2) + 1,
+                                running_median.update(value))
         return
 
     def set_counting_samples(self, samples = 1):
@@ -249,6 +340,10 @@ class CounterLogic(GenericLogic):
         if not resume:
             self._data_to_save = []
             self._saving_start_time = time.time()
+            if self._stream_saving:
+                self._start_save_recorder()
+        elif self._stream_saving and self._save_recorder is None:
+            self._start_save_recorder()
         self._saving = True
 
         # If the counter is not running, then it should start running so there is data to save
@@ -268,6 +363,11 @@ class CounterLogic(GenericLogic):
         self._saving = False
         self._saving_stop_time = time.time()
 
+        with self.threadlock:
+            stream_saving = self._save_recorder is not None
+        if stream_saving:
+            return self._save_recorded_data(to_file, postfix)
+
         # write the parameters:
         parameters = OrderedDict()
         parameters['Start counting time (s)'] = time.strftime('%d.%m.%Y %Hh:%Mmin:%Ss', time.localtime(self._saving_start_time))
@@ -306,6 +406,111 @@ class CounterLogic(GenericLogic):
 
         return self._data_to_save, parameters
 
+    def _start_save_recorder(self):
+        """ Start streaming the data to save to a new binary file in the counter data directory.
+        """
+        # only continuous counting records the second channel
+        if (self._counting_mode == 'continuous' and
+                hasattr(self._counting_device, '_photon_source2') and
+                self._counting_device._photon_source2 is not None):
+            number_of_columns = 3
+        else:
+            number_of_columns = 2
+        # The number makes the file name unique, the file of a recording started in the same
+        # second is removed below.
+        self._save_recorder_number += 1
+        filepath = os.path.join(self._save_logic.get_path_for_module(module_name='Counter'),
+                                '{0}_{1:d}_count_trace_recording.tmp'.format(
+                                    time.strftime('%Y%m%d-%H%M-%S'), self._save_recorder_number))
+        recorder = StreamRecorder(filepath, number_of_columns,
+                                  chunk_length=self._save_chunk_length)
+        # the counting loop appends to the recorder in the logic thread
+        with self.threadlock:
+            old_recorder = self._save_recorder
+            self._save_recorder = recorder
+            if old_recorder is not None:
+                old_recorder.finalize()
+        if old_recorder is not None:
+            os.remove(old_recorder.filepath)
+        return
+
+    def _store_data_to_save(self, rows):
+        """ Store rows of (time, counts[, counts 2]) to save, either in memory or in the file of
+        the stream recorder.
+
+        @param list rows: list of 1D numpy arrays, one per sample
+        """
+        # the recorder is replaced and finalized by save_data, called from other threads
+        with self.threadlock:
+            if self._save_recorder is not None:
+                self._save_recorder.append(rows)
+            else:
+                self._data_to_save.extend(rows)
+        return
+
+    def _save_recorded_data(self, to_file, postfix):
+        """ Finalize the stream recorder file and save it as counter trace.
+
+        @param bool to_file: indicate, whether data have to be saved to file
+        @param str postfix: an additional tag, which will be added to the filename upon save
+
+        @return np.array([X][2 or 3]), OrderedDict: the recorded data (memory mapped if saved to
+                                                    file) and the parameters
+
+        The data is saved as binary .npy file (one row per sample with the columns time in s,
+        counts/s of the first and second channel). The parameters are saved in a text file of the
+        same name.
+        """
+        with self.threadlock:
+            recorder = self._save_recorder
+            self._save_recorder = None
+            recorder.finalize()
+
+        parameters = OrderedDict()
+        parameters['Start counting time (s)'] = time.strftime('%d.%m.%Y %Hh:%Mmin:%Ss', time.localtime(self._saving_start_time))
+        parameters['Stop counting time (s)'] = time.strftime('%d.%m.%Y %Hh:%Mmin:%Ss', time.localtime(self._saving_stop_time))
+        parameters['Count frequency (Hz)'] = self._count_frequency
+        parameters['Oversampling (Samples)'] = self._counting_samples
+        parameters['Smooth Window Length (# of events)'] = self._smooth_window_length
+
+        if not to_file:
+            data = np.load(recorder.filepath)
+            os.remove(recorder.filepath)
+            return data, parameters
+
+        if postfix == '':
+            filelabel = 'count_trace'
+        else:
+            filelabel = 'count_trace_' + postfix
+        filepath = self._save_logic.get_path_for_module(module_name='Counter')
+        filename = time.strftime('%Y%m%d-%H%M-%S') + '_' + filelabel
+        data_filepath = os.path.join(filepath, filename + '.npy')
+        os.replace(recorder.filepath, data_filepath)
+        data = np.load(data_filepath, mmap_mode='r')
+
+        if recorder.number_of_columns == 3:
+            parameters['Columns'] = 'Time (s), Signal 1 (counts/s), Signal 2 (counts/s)'
+        else:
+            parameters['Columns'] = 'Time (s), Signal (counts/s)'
+        parameters['Number of samples'] = recorder.number_of_rows
+        parameters['Data file'] = filename + '.npy'
+
+        # plot at most about 100000 points to keep saving fast
+        fig = None
+        if recorder.number_of_rows > 0:
+            fig = self.draw_figure(data=np.asarray(
+                data[::max(recorder.number_of_rows // 100000, 1)]))
+        self._save_logic.save_data({'Data file': [filename + '.npy']},
+                                   filepath,
+                                   parameters=parameters,
+                                   filename=filename + '.dat',
+                                   as_text=True,
+                                   plotfig=fig)
+        if fig is not None:
+            plt.close(fig)
+        self.log.debug('Counter Trace saved to:\n{0}'.format(data_filepath))
+        return data, parameters
+
     def draw_figure(self, data):
         """ Draw figure to save with data file.
 
@@ -395,15 +600,12 @@ class CounterLogic(GenericLogic):
 
         # initialising the data arrays
         self.rawdata = np.zeros([2, self._counting_samples])
-        self.countdata = np.zeros((self._count_length,))
-        self.countdata_smoothed = np.zeros((self._count_length,))
+        self._init_count_traces()
         self._sampling_data = np.empty((self._counting_samples, 2))
 
         # It is robust to check whether the photon_source2 even exists first.
         if hasattr(self._counting_device, '_photon_source2'):
             if self._counting_device._photon_source2 is not None:
-                self.countdata2 = np.zeros((self._count_length,))
-                self.countdata_smoothed2 = np.zeros((self._count_length,))
                 self._sampling_data2 = np.empty((self._counting_samples, 2))
 
         self.sigCountContinuousNext.emit()
@@ -447,7 +649,7 @@ class CounterLogic(GenericLogic):
         # in rawdata the 'fresh counts' are read in
         self.rawdata = np.zeros([2, self._counting_samples])
         # countdata contains the appended data, that is the total displayed counttrace
-        self.countdata = np.zeros((self._count_length,))
+        self._init_count_traces()
         # do not use a smoothed count trace
         # self.countdata_smoothed = np.zeros((self._count_length,)) # contains the smoothed data
         # for now, there will be no oversampling mode.
@@ -495,25 +697,17 @@ class CounterLogic(GenericLogic):
             self.sigCountContinuousNext.emit()
             raise e
 
-        # remember the new count data in circular array
-        self.countdata[0] = np.average(self.rawdata[0])
-        # move the array to the left to make space for the new data
-        self.countdata = np.roll(self.countdata, -1)
-        # also move the smoothing array
-        self.countdata_smoothed = np.roll(self.countdata_smoothed, -1)
-        # calculate the median and save it
-        self.countdata_smoothed[-int(self._smooth_window_length/2)-1:]=np.median(self.countdata[-self._smooth_window_length:])
+        # remember the new count data in the circular buffer and update the smoothed trace
+        count_value = np.average(self.rawdata[0])
+        self._append_count_value(count_value, self._countdata_buffer,
+                                 self._countdata_smoothed_buffer, self._running_median)
 
         # It is robust to check whether the photon_source2 even exists first.
         if hasattr(self._counting_device, '_photon_source2'):
             if self._counting_device._photon_source2 is not None:
-                self.countdata2[0] = np.average(self.rawdata[1])
-                # move the array to the left to make space for the new data
-                self.countdata2 = np.roll(self.countdata2, -1)
-                # also move the smoothing array
-                self.countdata_smoothed2 = np.roll(self.countdata_smoothed2, -1)
-                # calculate the median and save it
-                self.countdata_smoothed2[-int(self._smooth_window_length/2)-1:] = np.median(self.countdata2[-self._smooth_window_length:])
+                count_value2 = np.average(self.rawdata[1])
+                self._append_count_value(count_value2, self._countdata2_buffer,
+                                         self._countdata_smoothed2_buffer, self._running_median2)
 
         # save the data if necessary
         if self._saving:
@@ -529,22 +723,22 @@ class CounterLogic(GenericLogic):
                     self._sampling_data[:, 0] = time.time() - self._saving_start_time
                     self._sampling_data[:, 1] = self.rawdata[0]
 
-                self._data_to_save.extend(list(self._sampling_data))
+                self._store_data_to_save(list(self._sampling_data))
             # if we don't want to use oversampling
             else:
                 # append tuple to data stream (timestamp, average counts)
                 if self._counting_device._photon_source2 is not None:
-                    self._data_to_save.append(np.array(
+                    self._store_data_to_save([np.array(
                                                        (time.time() - self._saving_start_time,
-                                                        self.countdata[-1],
-                                                        self.countdata2[-1])
-                                                        ))
+                                                        count_value,
+                                                        count_value2)
+                                                        )])
                 else:
-                    self._data_to_save.append(
+                    self._store_data_to_save([
                         np.array(
                             (time.time() - self._saving_start_time,
-                             self.countdata[-1]
-                             )))
+                             count_value
+                             ))])
         # call this again from event loop
         self.sigCounterUpdated.emit()
         self.sigCountContinuousNext.emit()
@@ -587,14 +781,10 @@ class CounterLogic(GenericLogic):
             self.sigCountContinuousNext.emit()
             raise e
 
-        # remember the new count data in circular array
-        self.countdata[0] = np.average(self.rawdata[0])
-        # move the array to the left to make space for the new data
-        self.countdata=np.roll(self.countdata, -1)
-        # also move the smoothing array
-        self.countdata_smoothed = np.roll(self.countdata_smoothed, -1)
-        # calculate the median and save it
-        self.countdata_smoothed[-int(self._smooth_window_length/2)-1:]=np.median(self.countdata[-self._smooth_window_length:])
+        # remember the new count data in the circular buffer and update the smoothed trace
+        count_value = np.average(self.rawdata[0])
+        self._append_count_value(count_value, self._countdata_buffer,
+                                 self._countdata_smoothed_buffer, self._running_median)
 
         # save the data if necessary
         if self._saving:
@@ -603,11 +793,11 @@ class CounterLogic(GenericLogic):
                 self._sampling_data=np.empty((self._counting_samples,2))
                 self._sampling_data[:, 0] = time.time()-self._saving_start_time
                 self._sampling_data[:, 1] = self.rawdata[0]
-                self._data_to_save.extend(list(self._sampling_data))
+                self._store_data_to_save(list(self._sampling_data))
             # if we don't want to use oversampling
             else:
                 # append tuple to data stream (timestamp, average counts)
-                self._data_to_save.append(np.array((time.time()-self._saving_start_time, self.countdata[-1])))
+                self._store_data_to_save([np.array((time.time()-self._saving_start_time, count_value))])
         # call this again from event loop
         self.sigCounterUpdated.emit()
         self.sigCountGatedNext.emit()
@@ -653,11 +843,11 @@ class CounterLogic(GenericLogic):
             raise e
 
 
-        if self._already_counted_samples+len(self.rawdata[0]) >= len(self.countdata):
+        if self._already_counted_samples+len(self.rawdata[0]) >= len(self._countdata_buffer):
 
-            needed_counts = len(self.countdata) - self._already_counted_samples
-            self.countdata[0:needed_counts] = self.rawdata[0][0:needed_counts]
-            self.countdata=np.roll(self.countdata, -needed_counts)
+            needed_counts = len(self._countdata_buffer) - self._already_counted_samples
+            # append the needed part of the new data to the trace:
+            self._countdata_buffer.extend(self.rawdata[0][0:needed_counts])
 
             self._already_counted_samples = 0
             self.stopRequested = True
@@ -666,10 +856,8 @@ class CounterLogic(GenericLogic):
             #self.log.debug(('len(self.rawdata[0]):', len(self.rawdata[0])))
             #self.log.debug(('self._already_counted_samples', self._already_counted_samples))
 
-            # replace the first part of the array with the new data:
-            self.countdata[0:len(self.rawdata[0])] = self.rawdata[0]
-            # roll the array by the amount of data it had been inserted:
-            self.countdata=np.roll(self.countdata, -len(self.rawdata[0]))
+            # append the new data to the trace:
+            self._countdata_buffer.extend(self.rawdata[0])
             # increment the index counter:
             self._already_counted_samples += len(self.rawdata[0])
             # self.log.debug(('already_counted_samples:',self._already_counted_samples))
@@ -23,6 +23,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 from qtpy import QtCore
 from collections import OrderedDict
 import numpy as np
+import os
 import time
 import datetime
 import matplotlib.pyplot as plt
@@ -30,6 +31,42 @@ import lmfit
 
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
+from core.util.ring_buffer import RingBuffer
+from core.util.stream_recorder import StreamRecorder
+
+
+class ODMRLiveFit(QtCore.QObject):
+
+    """ Helper class fitting the averaged ODMR spectrum in a separate thread. Every fit starts
+    from the best values of the previous fit, so only a few iterations are needed as long as the
+    resonances drift slowly.
+    """
+    sigLiveFitFinished = QtCore.Signal(object)
+
+    def __init__(self, parentclass):
+        super().__init__()
+
+        # remember the reference to the parent class to access the fit models
+        self._parentclass = parentclass
+
+    def fit(self, fit_function, x_data, y_data, params):
+        """ Threaded method fitting a spectrum, emits sigLiveFitFinished with a tuple of
+        (fit_function, x_data, y_data, result). The result is None if the fit failed.
+
+        @param str fit_function: name of the fit function
+        @param numpy.ndarray x_data: the frequencies
+        @param numpy.ndarray y_data: the averaged counts
+        @param lmfit.Parameters params: the start parameters
+        """
+        model = self._parentclass.fit_models[fit_function][0]
+        try:
+            result = model.fit(y_data, x=x_data, params=params)
+            if not np.all(np.isfinite([param.value for param in result.params.values()])):
+                result = None
+        except Exception:
+            result = None
+        self.sigLiveFitFinished.emit((fit_function, x_data, y_data, result))
+        return
 
 
 class ODMRLogic(GenericLogic):
@@ -57,6 +94,8 @@ class ODMRLogic(GenericLogic):
     sigODMRMatrixAxesChanged = QtCore.Signal()
     sigMicrowaveCWModeChanged = QtCore.Signal(bool)
     sigMicrowaveListModeChanged = QtCore.Signal(bool)
+    sigLiveFitUpdated = QtCore.Signal()
+    sigDoLiveFit = QtCore.Signal(str, object, object, object)
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -73,6 +112,12 @@ class ODMRLogic(GenericLogic):
         self.stopRequested = False
         self._clear_odmr_plots = False
 
+        # recorders of the raw data (counts and timestamps of every sweep) while saveRawData
+        self._raw_counts_recorder = None
+        self._raw_timestamps_recorder = None
+        # set by save_ODMR_Data to write the current chunks in the scan loop
+        self._flush_raw_data_requested = False
+
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
 
@@ -98,6 +143,31 @@ class ODMRLogic(GenericLogic):
         else:
             self.scanmode = 'LIST'
 
+        # number of sweeps acquired by the ODMR counter with a single call
+        if 'sweeps_per_call' in config:
+            self.sweeps_per_call = max(int(config['sweeps_per_call']), 1)
+        else:
+            self.sweeps_per_call = 1
+
+        # number of sweeps kept in memory before the raw data is written to the file
+        if 'raw_data_chunk_length' in config:
+            self.raw_data_chunk_length = max(int(config['raw_data_chunk_length']), 1)
+        else:
+            self.raw_data_chunk_length = 16
+
+        # number of sweeps between two live fits
+        if 'live_fit_sweeps' in config:
+            self.live_fit_sweeps = max(int(config['live_fit_sweeps']), 1)
+        else:
+            self.live_fit_sweeps = 10
+
+        # a live fit is skipped as long as the averaged spectrum changed by less than this
+        # factor times the rms residual of the last fit
+        if 'live_fit_change_threshold' in config:
+            self.live_fit_change_threshold = float(config['live_fit_change_threshold'])
+        else:
+            self.live_fit_change_threshold = 1.
+
         # FIXME: that is not a general default parameter!!!
         # default parameters for NV ODMR
         self.MW_trigger_source = 'EXT'
@@ -161,6 +231,18 @@ class ODMRLogic(GenericLogic):
 
         self.sigNextLine.connect(self._scan_ODMR_line, QtCore.Qt.QueuedConnection)
 
+        # create an independent thread for the live fit
+        self.live_fit_function = None
+        self._live_fit_busy = False
+        self._reset_live_fit()
+        self.live_fit_thread = QtCore.QThread()
+        self._live_fit = ODMRLiveFit(self)
+        self._live_fit.moveToThread(self.live_fit_thread)
+        self.sigDoLiveFit.connect(self._live_fit.fit, QtCore.Qt.QueuedConnection)
+        self._live_fit.sigLiveFitFinished.connect(self._live_fit_finished,
+                                                  QtCore.Qt.QueuedConnection)
+        self.live_fit_thread.start()
+
         # Initalize the ODMR plot and matrix image
         self._mw_frequency_list = np.arange(self.mw_start, self.mw_stop + self.mw_step, self.mw_step)
         self.ODMR_fit_x = np.arange(self.mw_start, self.mw_stop + self.mw_step, self.mw_step / 10.)
@@ -188,6 +270,20 @@ class ODMRLogic(GenericLogic):
         self._statusVariables['mw_step'] = self.mw_step
         self._statusVariables['run_time'] = self.run_time
         self._statusVariables['saveRawData'] = self.saveRawData
+        # stop a running scan first, so it does not record into the closed raw data files
+        self.stop_odmr_scan()
+        for i in range(20):
+            if self.getState() == 'idle':
+                break
+            QtCore.QCoreApplication.processEvents()
+            time.sleep(0.1)
+        self._stop_raw_data_recording()
+
+        self.live_fit_function = None
+        self.sigDoLiveFit.disconnect()
+        self._live_fit.sigLiveFitFinished.disconnect()
+        self.live_fit_thread.quit()
+        self.live_fit_thread.wait()
 
     def set_clock_frequency(self, clock_frequency):
         """Sets the frequency of the clock
@@ -249,19 +345,13 @@ class ODMRLogic(GenericLogic):
         self.ODMR_fit_x = np.arange(self.mw_start, self.mw_stop + self.mw_step, self.mw_step / 10.)
         self._fit_param = dict()
         self._fit_result = None
+        self._reset_live_fit()
 
         if self.saveRawData:
-            # All that is necesarry fo saving of raw data:
-            # length of req list
-            self._mw_frequency_list_length = int(self._mw_frequency_list.shape[0])
-            # time for one line
-            self._ODMR_line_time = self._mw_frequency_list_length / self._clock_frequency
-            # amout of lines done during run_time
-            self._ODMR_line_count = self.run_time / self._ODMR_line_time
-            # list used to store the raw data, is saved in seperate file for post prossesing initiallized with -1
-            self.ODMR_raw_data = np.full((self._mw_frequency_list_length, self._ODMR_line_count), -1)
+            self._start_raw_data_recording()
             self.log.info('Raw data saving...')
         else:
+            self._stop_raw_data_recording()
             self.log.info('Raw data NOT saved.')
 
         odmr_status = self.start_odmr()
@@ -346,9 +436,35 @@ class ODMRLogic(GenericLogic):
 
     def _initialize_ODMR_matrix(self):
         """ Initializing the ODMR matrix plot. """
-        self.ODMR_plot_xy = np.zeros((self.number_of_lines, len(self._mw_frequency_list)))
+        self._odmr_matrix = RingBuffer(self.number_of_lines,
+                                       value_shape=(len(self._mw_frequency_list), ))
         self.sigODMRMatrixAxesChanged.emit()
 
+    @property
+    def ODMR_plot_xy(self):
+        """ The ODMR matrix with the newest line first.
+
+        The lines are kept in a ring buffer, so adding a line does not move the others. The
+        matrix in display order is only created on request.
+
+        @return numpy.ndarray: the matrix, shape (number of lines, number of frequencies)
+        """
+        return self._odmr_matrix.get_trace()[::-1]
+
+    def set_sweeps_per_call(self, sweeps_per_call):
+        """ Set the number of sweeps the ODMR counter acquires with a single call.
+
+        With several sweeps per call, the sweeps are acquired hardware timed without a reset of
+        the microwave list in between, which saves the overhead of the separate calls. A
+        requested stop and the run time are checked after all sweeps of a call.
+
+        @param int sweeps_per_call: number of sweeps per call, at least 1
+
+        @return int: the number of sweeps per call
+        """
+        self.sweeps_per_call = max(int(sweeps_per_call), 1)
+        return self.sweeps_per_call
+
     def clear_odmr_plots(self):
         """¨Set the option to clear the curret ODMR plot.
 
@@ -367,6 +483,11 @@ class ODMRLogic(GenericLogic):
                 self.kill_odmr()
                 self.stopRequested = False
                 self.unlock()
+                # write the recorded raw data, so the files are complete while the scan is stopped
+                if self._raw_counts_recorder is not None:
+                    self._raw_counts_recorder.flush()
+                    self._raw_timestamps_recorder.flush()
+                self._flush_raw_data_requested = False
                 self.sigOdmrPlotUpdated.emit()
                 self.sigOdmrMatrixUpdated.emit()
 
@@ -380,11 +501,18 @@ class ODMRLogic(GenericLogic):
             self._mw_device.reset_sweep()
         else:
             self._mw_device.reset_listpos()
-        new_counts = self._odmr_counter.count_odmr(length=len(self._mw_frequency_list))
-        if new_counts[0] == -1:
+        if self.sweeps_per_call > 1:
+            new_counts = self._odmr_counter.count_odmr_sweeps(
+                length=len(self._mw_frequency_list), sweeps=self.sweeps_per_call)
+        else:
+            new_counts = self._odmr_counter.count_odmr(length=len(self._mw_frequency_list))
+        sweeps_end_time = time.time()
+        if np.ndim(new_counts) == 0 or np.ravel(new_counts)[0] == -1:
             self.stopRequested = True
             self.sigNextLine.emit()
             return
+        new_counts = np.reshape(new_counts, (-1, len(self._mw_frequency_list)))
+        number_of_sweeps = new_counts.shape[0]
 
         # if during the scan a clearing of the ODMR plots is needed:
         if self._clear_odmr_plots:
@@ -392,42 +520,45 @@ class ODMRLogic(GenericLogic):
             self._initialize_ODMR_plot()
             self._initialize_ODMR_matrix()
             self._clear_odmr_plots = False
+            self._live_fit_params = None
 
-        self.ODMR_plot_y = (self._odmrscan_counter * self.ODMR_plot_y + new_counts) / (self._odmrscan_counter + 1)
+        self.ODMR_plot_y = ((self._odmrscan_counter * self.ODMR_plot_y + new_counts.sum(axis=0))
+                            / (self._odmrscan_counter + number_of_sweeps))
 
         # React on the case, when the number of matrix lines have changed during
-        # the scan. Essentially, there are three cases which can happen:
-        curr_num_lines = np.shape(self.ODMR_plot_xy)[0]
-        if curr_num_lines > self.number_of_lines:
-
-            self.ODMR_plot_xy = np.vstack((new_counts, self.ODMR_plot_xy[:self.number_of_lines - 1, :]))
+        # the scan. The newest lines are kept.
+        if len(self._odmr_matrix) != self.number_of_lines:
+            old_matrix = self._odmr_matrix
+            self._odmr_matrix = RingBuffer(self.number_of_lines,
+                                           value_shape=(len(self._mw_frequency_list), ))
+            self._odmr_matrix.extend(old_matrix.get_last(self.number_of_lines))
+            self._odmr_matrix.extend(new_counts)
 
             # It is very necessary that the matrix will be updated BEFORE the
             # axes are adjusted, otherwise, there the display will not fit with
             # the data!
             self.sigOdmrMatrixUpdated.emit()
             self.sigODMRMatrixAxesChanged.emit()
-
-        elif np.shape(self.ODMR_plot_xy)[0] < self.number_of_lines:
-            new_matrix = np.zeros((self.number_of_lines, len(self._mw_frequency_list)))
-            new_matrix[1:curr_num_lines + 1, :] = self.ODMR_plot_xy
-            new_matrix[0, :] = new_counts
-            self.ODMR_plot_xy = new_matrix
-
-            # It is very necessary that the matrix will be updated BEFORE the
-            # axes are adjusted, otherwise, there the display will not fit with
-            # the data!
-            self.sigOdmrMatrixUpdated.emit()
-            self.sigODMRMatrixAxesChanged.emit()
-
         else:
-            self.ODMR_plot_xy = np.vstack((new_counts, self.ODMR_plot_xy[:-1, :]))
+            self._odmr_matrix.extend(new_counts)
             self.sigOdmrMatrixUpdated.emit()
 
-        if self.saveRawData:
-            self.ODMR_raw_data[:, self._odmrscan_counter] = new_counts  # adds the ne odmr line to the overall np.array
-
-        self._odmrscan_counter += 1
+        # the recorders are replaced and closed by other threads under the threadlock
+        with self.threadlock:
+            if self._raw_counts_recorder is not None:
+                self._record_raw_data(new_counts, sweeps_end_time)
+                # requested by save_ODMR_Data, which is called from other threads
+                if self._flush_raw_data_requested:
+                    self._flush_raw_data_requested = False
+                    self._raw_counts_recorder.flush()
+                    self._raw_timestamps_recorder.flush()
+
+        if self.live_fit_function is not None:
+            self._live_fit_sweep_counter += number_of_sweeps
+            if self._live_fit_sweep_counter >= self.live_fit_sweeps:
+                self._request_live_fit(sweeps_end_time)
+
+        self._odmrscan_counter += number_of_sweeps
         self.elapsed_time = time.time() - self._startTime
         self.sigOdmrElapsedTimeChanged.emit()
         if self.elapsed_time >= self.run_time:
@@ -437,6 +568,183 @@ class ODMRLogic(GenericLogic):
         self.sigOdmrPlotUpdated.emit()
         self.sigNextLine.emit()
 
+    def _start_raw_data_recording(self):
+        """ Start recording the raw data of every sweep to binary files in the ODMR data
+        directory.
+
+        The counts per pixel (uint32, one line per sweep) and the time at the end of every sweep
+        (float64, s since the epoch) are written in chunks of raw_data_chunk_length sweeps to
+        two .npy files. The files are complete up to the last written chunk at any time, so the
+        data also survives a crash.
+        """
+        self._stop_raw_data_recording()
+        filepath = self._save_logic.get_path_for_module(module_name='ODMR')
+        filename = time.strftime('%Y%m%d-%H%M-%S') + '_ODMR_data_raw'
+        raw_counts_recorder = StreamRecorder(
+            os.path.join(filepath, filename + '_counts.npy'),
+            len(self._mw_frequency_list),
+            dtype='uint32',
+            chunk_length=self.raw_data_chunk_length)
+        raw_timestamps_recorder = StreamRecorder(
+            os.path.join(filepath, filename + '_timestamps.npy'),
+            1,
+            dtype='float64',
+            chunk_length=self.raw_data_chunk_length)
+        with self.threadlock:
+            self._raw_counts_recorder = raw_counts_recorder
+            self._raw_timestamps_recorder = raw_timestamps_recorder
+            self._flush_raw_data_requested = False
+        return
+
+    def _record_raw_data(self, new_counts, sweeps_end_time):
+        """ Append the counts of new sweeps to the raw data files. Must be called with the
+        threadlock held.
+
+        @param numpy.ndarray new_counts: counts per second, one line per sweep
+        @param float sweeps_end_time: time at the end of the last sweep in s since the epoch
+        """
+        line_time = len(self._mw_frequency_list) / self._clock_frequency
+        number_of_sweeps = new_counts.shape[0]
+        timestamps = sweeps_end_time - line_time * np.arange(number_of_sweeps - 1, -1, -1)
+        counts = np.rint(new_counts / self._clock_frequency)
+        self._raw_counts_recorder.append(np.clip(counts, 0, np.iinfo(np.uint32).max))
+        self._raw_timestamps_recorder.append(timestamps)
+        return
+
+    def _stop_raw_data_recording(self):
+        """ Write all recorded raw data and close the raw data files. """
+        with self.threadlock:
+            raw_counts_recorder = self._raw_counts_recorder
+            raw_timestamps_recorder = self._raw_timestamps_recorder
+            self._raw_counts_recorder = None
+            self._raw_timestamps_recorder = None
+        if raw_counts_recorder is not None:
+            raw_counts_recorder.finalize()
+            raw_timestamps_recorder.finalize()
+        return
+
+    def start_live_fit(self, fit_function=None):
+        """ Start fitting the averaged spectrum every live_fit_sweeps sweeps during the scan.
+
+        The first fit is a full fit (see do_fit), all further fits run in a separate thread and
+        start from the best values of the previous fit. A fit is skipped if the spectrum changed
+        by less than live_fit_change_threshold times the rms residual of the last fit. The
+        center frequencies of every fit are published as time series, see get_live_fit_trace.
+
+        @param str fit_function: name of the fit function, by default the current one
+
+        @return int: error code (0:OK, -1:error)
+        """
+        if fit_function is None:
+            fit_function = self.current_fit_function
+        if fit_function not in self.fit_models:
+            self.log.error('Live fit with the fit function "{0}" is not possible.'
+                           ''.format(fit_function))
+            return -1
+        self._reset_live_fit()
+        self.live_fit_function = fit_function
+        return 0
+
+    def stop_live_fit(self):
+        """ Stop the live fit. The time series of the center frequencies is kept.
+
+        @return int: error code (0:OK, -1:error)
+        """
+        self.live_fit_function = None
+        return 0
+
+    def get_live_fit_trace(self):
+        """ Get the center frequencies of all live fits since the live fit or the scan was
+        started.
+
+        @return tuple(numpy.ndarray, numpy.ndarray): the times of the fitted data in s since the
+                                                     epoch and the center frequencies in Hz,
+                                                     one line per fit
+        """
+        # a fit result might be appended in the meantime
+        number_of_fits = min(len(self._live_fit_timestamps), len(self._live_fit_frequencies))
+        if number_of_fits == 0:
+            return np.empty((0,)), np.empty((0, 0))
+        return (np.array(self._live_fit_timestamps[:number_of_fits]),
+                np.array(self._live_fit_frequencies[:number_of_fits]).reshape(number_of_fits, -1))
+
+    def _reset_live_fit(self):
+        """ Forget the parameters and the time series of the live fit. """
+        self._live_fit_params = None
+        self._live_fit_data = None
+        self._live_fit_noise = 0.
+        self._live_fit_sweep_counter = 0
+        self._live_fit_timestamps = []
+        self._live_fit_frequencies = []
+        return
+
+    def _request_live_fit(self, timestamp):
+        """ Fit the averaged spectrum if it changed noticeably since the last fit.
+
+        @param float timestamp: time of the spectrum in s since the epoch
+        """
+        if self._live_fit_busy:
+            return
+        self._live_fit_sweep_counter = 0
+        x_data = self._mw_frequency_list
+        y_data = np.copy(self.ODMR_plot_y)
+        self._live_fit_timestamp = timestamp
+
+        if (self._live_fit_params is None or self._live_fit_data is None
+                or len(self._live_fit_data) != len(y_data)):
+            # full fit with parameter estimation
+            self.do_fit(fit_function=self.live_fit_function)
+            if self._fit_result is None:
+                return
+            self._live_fit_finished((self.live_fit_function, x_data, y_data, self._fit_result))
+            return
+
+        change = np.sqrt(np.mean((y_data - self._live_fit_data)**2))
+        if change < self.live_fit_change_threshold * self._live_fit_noise:
+            return
+        self._live_fit_busy = True
+        self.sigDoLiveFit.emit(self.live_fit_function, x_data, y_data, self._live_fit_params)
+        return
+
+    def _live_fit_finished(self, fit):
+        """ Publish the result of a live fit.
+
+        @param tuple fit: fit function, frequencies, averaged counts and the lmfit result
+        """
+        fit_function, x_data, y_data, result = fit
+        self._live_fit_busy = False
+        if fit_function != self.live_fit_function:
+            return
+        if result is None:
+            # start again with a full fit
+            self._live_fit_params = None
+            self.log.warning('Live fit failed, the next fit estimates the parameters anew.')
+            return
+
+        self._live_fit_params = result.params
+        self._live_fit_data = y_data
+        self._live_fit_noise = np.sqrt(np.mean(result.residual**2))
+
+        center_names = [name for name in result.params
+                        if name == 'center' or name.endswith('_center')]
+        center_frequencies = [result.params[name].value for name in center_names]
+        self._live_fit_timestamps.append(self._live_fit_timestamp)
+        self._live_fit_frequencies.append(center_frequencies)
+
+        if result is not self._fit_result:
+            model = self.fit_models[fit_function][0]
+            self.ODMR_fit_y = model.eval(x=self.ODMR_fit_x, params=result.params)
+            self._fit_result = result
+            for index, name in enumerate(center_names):
+                key = 'Frequency' if name == 'center' else 'Freq. {0}'.format(index)
+                if key in self._fit_param:
+                    self._fit_param[key] = {'value': result.params[name].value,
+                                            'error': result.params[name].stderr,
+                                            'unit': 'Hz'}
+            self.sigOdmrFitUpdated.emit()
+        self.sigLiveFitUpdated.emit()
+        return
+
     def set_power(self, power=None):
         """ Forwarding the desired new power from the GUI to the MW source.
 
@@ -956,46 +1264,71 @@ class ODMRLogic(GenericLogic):
                 name = '{0}_{1}'.format(param, entry)
                 parameters[name] = self._fit_param[param][entry]
 
-        fig = self.draw_figure(cbar_range=colorscale_range,
-                               percentile_range=percentile_range
-                               )
+        plotfig_kwargs = dict()
+        plotfig_kwargs['cbar_range'] = colorscale_range
+        plotfig_kwargs['percentile_range'] = percentile_range
+        plotfig_kwargs['figure_data'] = self.get_figure_data()
 
-        self._save_logic.save_data(
+        # the files and the figure are written in the background
+        self._save_logic.save_data_async(
             data,
             filepath,
             parameters=parameters,
             filelabel=filelabel,
             timestamp=timestamp,
-            plotfig=fig,
-            as_text=True)
-        plt.close(fig)
+            plotfig_function=self.draw_figure,
+            plotfig_kwargs=plotfig_kwargs)
 
-        self._save_logic.save_data(
+        self._save_logic.save_data_async(
             data2,
             filepath2,
             parameters=parameters,
             filelabel=filelabel2,
-            timestamp=timestamp,
-            as_text=True)
+            timestamp=timestamp)
 
-        self.log.info('ODMR data saved to:\n{0}'.format(filepath))
+        self.log.info('ODMR data is saved to:\n{0}'.format(filepath))
 
-        if self.saveRawData:
-            raw_data = self.ODMR_raw_data  # array cotaining ALL messured data
-            data3['count data'] = raw_data  # saves the raw data, ALL of it so keep an eye on performance
-            self._save_logic.save_data(
+        with self.threadlock:
+            raw_counts_recorder = self._raw_counts_recorder
+            raw_timestamps_recorder = self._raw_timestamps_recorder
+            # the recorders are only flushed in the thread appending to them. The rows of the
+            # current chunk are written after the next sweeps or when the scan is stopped.
+            self._flush_raw_data_requested = raw_counts_recorder is not None
+        if raw_counts_recorder is not None:
+            # the raw data is already in its files, only the description is saved here
+            data3['raw data files'] = [
+                os.path.basename(raw_counts_recorder.filepath),
+                os.path.basename(raw_timestamps_recorder.filepath)]
+            parameters3 = OrderedDict(parameters)
+            parameters3['Number of sweeps (#)'] = raw_counts_recorder.get_row_count()
+            parameters3['Raw counts'] = 'counts per pixel (uint32), one line per sweep'
+            parameters3['Raw timestamps'] = 'end of every sweep in s since the epoch (float64)'
+            self._save_logic.save_data_async(
                 data3,
                 filepath3,
-                parameters=parameters,
+                parameters=parameters3,
                 filelabel=filelabel3,
-                timestamp=timestamp,
-                as_text=True)
+                timestamp=timestamp)
 
-            self.log.info('Raw data succesfully saved.')
+            self.log.info('Raw data is saved.')
         else:
             self.log.info('Raw data is NOT saved')
 
-    def draw_figure(self, cbar_range=None, percentile_range=None):
+    def get_figure_data(self):
+        """ Get the current data shown in the summary figure.
+
+        @return: dict figure_data: the data to pass to draw_figure.
+        """
+        figure_data = dict()
+        figure_data['freq_data'] = self.ODMR_plot_x
+        figure_data['count_data'] = self.ODMR_plot_y
+        figure_data['fit_freq_vals'] = self.ODMR_fit_x
+        figure_data['fit_count_vals'] = self.ODMR_fit_y
+        figure_data['matrix_data'] = self.ODMR_plot_xy
+        figure_data['number_of_lines'] = self.number_of_lines
+        return figure_data
+
+    def draw_figure(self, cbar_range=None, percentile_range=None, figure_data=None):
         """ Draw the summary figure to save with the data.
 
         @param: list cbar_range: (optional) [color_scale_min, color_scale_max].
@@ -1004,13 +1337,18 @@ class ODMRLogic(GenericLogic):
 
         @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
 
+        @param: dict figure_data: (optional) the data to draw, see get_figure_data. If not
+                                  supplied then the current data will be used.
+
         @return: fig fig: a matplotlib figure object to be saved to file.
         """
-        freq_data = self.ODMR_plot_x
-        count_data = self.ODMR_plot_y
-        fit_freq_vals = self.ODMR_fit_x
-        fit_count_vals = self.ODMR_fit_y
-        matrix_data = self.ODMR_plot_xy
+        if figure_data is None:
+            figure_data = self.get_figure_data()
+        freq_data = figure_data['freq_data']
+        count_data = figure_data['count_data']
+        fit_freq_vals = figure_data['fit_freq_vals']
+        fit_count_vals = figure_data['fit_count_vals']
+        matrix_data = figure_data['matrix_data']
 
         # If no colorbar range was given, take full range of data
         if cbar_range is None:
@@ -1073,7 +1411,7 @@ class ODMRLogic(GenericLogic):
                                       extent=[np.min(freq_data),
                                               np.max(freq_data),
                                               0,
-                                              self.number_of_lines
+                                              figure_data['number_of_lines']
                                               ],
                                       aspect='auto',
                                       interpolation='nearest')
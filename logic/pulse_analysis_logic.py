@@ -73,37 +73,26 @@ class PulseAnalysisLogic(GenericLogic):
         @param int signal_end_bin: Bin where the signal stops
 
         @return: float array signal_data: Array with the computed signal
-        @return: float array laser_data: Array with the laser data
-        @return: float array raw_data: Array with the raw data
+        @return: float array measuring_error: Array with the computed measuring error
+
+        All lasers are analyzed at once by reductions along the time axis. The window sums are
+        accumulated in float64 directly from laser_data, so integer (e.g. uint32) or float32
+        count data is neither copied nor upcast.
         """
-        num_of_lasers = laser_data.shape[0]
-
-        # Initialize the signal and normalization mean data arrays
-        reference_mean = np.zeros(num_of_lasers, dtype=float)
-        signal_mean = np.zeros(num_of_lasers, dtype=float)
-        signal_area = np.zeros(num_of_lasers, dtype=float)
-        reference_area = np.zeros(num_of_lasers, dtype=float)
-        measuring_error = np.zeros(num_of_lasers, dtype=float)
-        # initialize data arrays
-        signal_data = np.empty(num_of_lasers, dtype=float)
-
-        # loop over all laser pulses and analyze them
-        for ii in range(num_of_lasers):
-            # calculate the mean of the data in the normalization window
-            reference_mean[ii] = laser_data[ii][norm_start_bin:norm_end_bin].mean()
-            # calculate the mean of the data in the signal window
-            signal_mean[ii] = (laser_data[ii][signal_start_bin:signal_end_bin] - reference_mean[ii]).mean()
-            # update the signal plot y-data
-            signal_data[ii] = 1. + (signal_mean[ii]/reference_mean[ii])
+        reference_window = laser_data[:, norm_start_bin:norm_end_bin]
+        signal_window = laser_data[:, signal_start_bin:signal_end_bin]
 
-        # Compute the measuring error
-        for jj in range(num_of_lasers):
-            signal_area[jj] = laser_data[jj][signal_start_bin:signal_end_bin].sum()
-            reference_area[jj] = laser_data[jj][norm_start_bin:norm_end_bin].sum()
+        # calculate the sum and the mean of the data in the normalization and signal window
+        reference_area = np.sum(reference_window, axis=1, dtype=np.float64)
+        signal_area = np.sum(signal_window, axis=1, dtype=np.float64)
+        reference_mean = reference_area / reference_window.shape[1]
+        signal_mean = signal_area / signal_window.shape[1] - reference_mean
+
+        # compute the signal plot y-data
+        signal_data = 1. + (signal_mean / reference_mean)
 
-            measuring_error[jj] = self.calculate_measuring_error(signal_area[jj],
-                                                                 reference_area[jj],
-                                                                 signal_data[jj])
+        # Compute the measuring error
+        measuring_error = self.calculate_measuring_error(signal_area, reference_area, signal_data)
         return signal_data, measuring_error
 
     def calculate_measuring_error(self, signal_area, reference_area, signal_data):
@@ -111,14 +100,21 @@ class PulseAnalysisLogic(GenericLogic):
 
         @param float signal_area: Numerical integral over the photon count in the signal area
         @param float reference_area: Numerical integral over the photon count in the reference area
+        @param float signal_data: The computed signal
 
         @return: float measuring_error: Computed error
+
+        All parameters can also be arrays (one entry per laser pulse). The error is then computed
+        for all laser pulses at once and returned as an array.
         """
-        if reference_area == 0.:
-            measuring_error = 0.
-        elif signal_area == 0.:
-            measuring_error = 0.
-        else:
-            # with respect to gaußian error 'evolution'
+        signal_area = np.asarray(signal_area, dtype=float)
+        reference_area = np.asarray(reference_area, dtype=float)
+        # with respect to gaußian error 'evolution'
+        with np.errstate(divide='ignore', invalid='ignore'):
             measuring_error = signal_data * np.sqrt(1 / signal_area + 1 / reference_area)
+        # the error is set to zero if there are no counts in one of the windows
+        measuring_error = np.where((signal_area == 0.) | (reference_area == 0.), 0.,
+                                   measuring_error)
+        if measuring_error.ndim == 0:
+            return float(measuring_error)
         return measuring_error
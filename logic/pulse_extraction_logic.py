@@ -21,6 +21,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 import numpy as np
 from scipy import ndimage
+from collections import OrderedDict
 from logic.generic_logic import GenericLogic
 
 
@@ -41,6 +42,13 @@ class PulseExtractionLogic(GenericLogic):
         for key in config.keys():
             self.log.info('{0}: {1}'.format(key, config[key]))
 
+        # The available methods to extract the laser pulses from the timetrace of an ungated
+        # fast counter. All methods take the arguments (count_data, conv_std_dev, num_of_lasers).
+        # If you want to define a new method, add the reference to this dictionary.
+        self.ungated_extraction_methods = OrderedDict()
+        self.ungated_extraction_methods['conv_deriv'] = self.ungated_extraction
+        self.ungated_extraction_methods['edge_detection'] = self.ungated_extraction_edge_detection
+
     def on_activate(self, e):
         """ Initialisation performed during activation of the module.
 
@@ -249,6 +257,116 @@ class PulseExtractionLogic(GenericLogic):
                 laser_arr[i] = count_data[rising_ind[i]:rising_ind[i]+laser_length]
         return laser_arr.astype(int)
 
+    def ungated_extraction_edge_detection(self, count_data, conv_std_dev, num_of_lasers):
+        """ Detects the laser pulses in the ungated timetrace data in a single pass and extracts
+            them.
+
+        @param numpy.ndarray count_data: 1D array the raw timetrace data from an
+                                         ungated fast counter
+        @param float conv_std_dev: standard deviation of the gaussian filter to be
+                              applied for smoothing
+        @param int num_of_lasers: The total number of laser pulses inside the
+                                  pulse sequence
+
+        @return 2D numpy.ndarray: 2D array, the extracted laser pulses of the
+                                  timetrace, dimensions:
+                                        0: laser number,
+                                        1: time bin
+
+        Returns the same laser array as ungated_extraction, but the effort only scales with the
+        length of the timetrace and not additionally with the number of lasers.
+
+        Procedure:
+            The square root of the timetrace (Anscombe transform) is taken, so the poissonian
+            noise is the same for weak and strong laser pulses. It is smoothed with a gaussian
+            filter and derived once (see _convolve_derive). The noise of the derivative is
+            estimated robustly from its median absolute deviation, which is hardly affected by
+            the few bins at the edges. All regions where the derivative exceeds 3 times the noise
+            are rising edges, all regions where it falls below -3 times the noise are falling
+            edges, so weak laser pulses are found next to strong ones. Regions closer than 2*conv_std_dev are merged, so noise
+            around the threshold does not split an edge. The edge position is the extremum of the
+            derivative in each region. If more edges are found than there are lasers, the most
+            pronounced ones are used.
+        """
+        stabilized_data = 2 * np.sqrt(np.maximum(count_data, 0) + 3 / 8)
+        conv_deriv = self._convolve_derive(stabilized_data, conv_std_dev)
+        min_distance = max(int(2 * conv_std_dev), 1)
+
+        # 1.4826 scales the median absolute deviation to the standard deviation of gaussian
+        # noise. Without noise a small fraction of the strongest edge is used.
+        noise = 1.4826 * np.median(np.abs(conv_deriv - np.median(conv_deriv)))
+        threshold = max(3 * noise, 1e-3 * np.max(np.abs(conv_deriv)))
+
+        rising_ind = self._find_edges(conv_deriv, num_of_lasers, min_distance, threshold)
+        falling_ind = self._find_edges(-conv_deriv, num_of_lasers, min_distance, threshold)
+        if rising_ind.size < num_of_lasers or falling_ind.size < num_of_lasers:
+            self.log.warning('Edge detection found only {0} rising and {1} falling edges for {2} '
+                             'laser pulses. Missing laser pulses are set to zero.'
+                             ''.format(rising_ind.size, falling_ind.size, num_of_lasers))
+        number_of_edges = min(rising_ind.size, falling_ind.size)
+        if number_of_edges == 0:
+            return np.zeros([num_of_lasers, 0], int)
+        rising_ind = rising_ind[:number_of_edges]
+        falling_ind = falling_ind[:number_of_edges]
+
+        # find the maximum laser length to use as size for the laser array
+        laser_length = max(int(np.max(falling_ind - rising_ind)), 0)
+
+        # slice all detected laser pulses of the timetrace at once according to the found rising
+        # edges. Bins beyond the end of the timetrace are set to zero.
+        laser_arr = np.zeros([num_of_lasers, laser_length], int)
+        bin_ind = rising_ind[:, np.newaxis] + np.arange(laser_length)
+        in_trace = bin_ind < count_data.size
+        laser_arr[:number_of_edges] = np.where(in_trace,
+                                               count_data[np.minimum(bin_ind, count_data.size - 1)],
+                                               0)
+        return laser_arr
+
+    def _find_edges(self, conv_deriv, num_of_edges, min_distance, threshold):
+        """ Find the positions of the most pronounced maxima of a derived timetrace in one pass.
+
+        @param numpy.ndarray conv_deriv: 1D array, the smoothed and derived timetrace
+        @param int num_of_edges: maximum number of edges to return
+        @param int min_distance: regions above threshold closer than this number of bins belong
+                                 to the same edge
+        @param float threshold: minimum value of the derivative at an edge
+
+        @return numpy.ndarray: sorted indices of the (at most num_of_edges) found edges
+        """
+        above_threshold = conv_deriv > threshold
+        # start and stop indices of all contiguous regions above threshold
+        region_bounds = np.flatnonzero(np.diff(above_threshold.astype(np.int8)))
+        region_starts = region_bounds[above_threshold[region_bounds + 1]] + 1
+        region_stops = region_bounds[~above_threshold[region_bounds + 1]] + 1
+        if above_threshold[0]:
+            region_starts = np.insert(region_starts, 0, 0)
+        if above_threshold[-1]:
+            region_stops = np.append(region_stops, above_threshold.size)
+        if region_starts.size == 0:
+            return np.array([], int)
+
+        # merge regions separated by less than min_distance bins
+        is_new_edge = np.ones(region_starts.size, bool)
+        is_new_edge[1:] = (region_starts[1:] - region_stops[:-1]) >= min_distance
+        region_stops = region_stops[np.append(is_new_edge[1:], True)]
+        region_starts = region_starts[is_new_edge]
+
+        # position of the maximum within each region
+        region_max = np.maximum.reduceat(conv_deriv, region_starts)
+        region_lengths = region_stops - region_starts
+        region_ind = np.repeat(np.arange(region_starts.size), region_lengths)
+        bin_ind = np.repeat(region_starts - np.cumsum(region_lengths) + region_lengths,
+                            region_lengths) + np.arange(region_ind.size)
+        is_max = conv_deriv[bin_ind] == region_max[region_ind]
+        dummy, first_max = np.unique(region_ind[is_max], return_index=True)
+        edge_ind = bin_ind[is_max][first_max]
+
+        # keep the most pronounced edges
+        if edge_ind.size > num_of_edges:
+            keep = np.argpartition(-region_max, num_of_edges - 1)[:num_of_edges]
+            edge_ind = edge_ind[keep]
+        return np.sort(edge_ind)
+
     def _convolve_derive(self, data, std_dev):
         """ Smooth the input data by applying a gaussian filter.
 
@@ -45,6 +45,7 @@ class PulsedMasterLogic(GenericLogic):
     sigMeasurementSequenceSettingsChanged = QtCore.Signal(np.ndarray, int, float, list, bool, float)
     sigPulseGeneratorSettingsChanged = QtCore.Signal(float, str, dict, bool)
     sigUploadAsset = QtCore.Signal(str)
+    sigTransferFiles = QtCore.Signal(list)
     sigLoadAsset = QtCore.Signal(str, dict)
     sigClearPulseGenerator = QtCore.Signal()
     sigExtMicrowaveSettingsChanged = QtCore.Signal(float, float, bool)
@@ -163,6 +164,8 @@ class PulsedMasterLogic(GenericLogic):
                                             QtCore.Qt.QueuedConnection)
         self.sigUploadAsset.connect(self._measurement_logic.upload_asset,
                                     QtCore.Qt.QueuedConnection)
+        self.sigTransferFiles.connect(self._measurement_logic.transfer_files,
+                                      QtCore.Qt.QueuedConnection)
         self.sigLoadAsset.connect(self._measurement_logic.load_asset, QtCore.Qt.QueuedConnection)
         self.sigLaserToShowChanged.connect(self._measurement_logic.set_laser_to_show,
                                            QtCore.Qt.QueuedConnection)
@@ -245,6 +248,8 @@ class PulsedMasterLogic(GenericLogic):
                                                                 QtCore.Qt.QueuedConnection)
         self._generator_logic.sigSampleSequenceComplete.connect(self.sample_sequence_finished,
                                                                 QtCore.Qt.QueuedConnection)
+        self._generator_logic.sigSampledFilesWritten.connect(self.sampled_files_written,
+                                                             QtCore.Qt.QueuedConnection)
         self._generator_logic.sigCurrentBlockUpdated.connect(self.current_pulse_block_updated,
                                                              QtCore.Qt.QueuedConnection)
         self._generator_logic.sigCurrentEnsembleUpdated.connect(self.current_block_ensemble_updated,
@@ -294,6 +299,7 @@ class PulsedMasterLogic(GenericLogic):
         self.sigStopPulser.disconnect()
         self.sigClearPulseGenerator.disconnect()
         self.sigUploadAsset.disconnect()
+        self.sigTransferFiles.disconnect()
         self.sigLoadAsset.disconnect()
         self.sigLaserToShowChanged.disconnect()
         self.sigAnalysisMethodChanged.disconnect()
@@ -336,6 +342,7 @@ class PulsedMasterLogic(GenericLogic):
         self._generator_logic.sigSequenceDictUpdated.disconnect()
         self._generator_logic.sigSampleEnsembleComplete.disconnect()
         self._generator_logic.sigSampleSequenceComplete.disconnect()
+        self._generator_logic.sigSampledFilesWritten.disconnect()
         self._generator_logic.sigCurrentBlockUpdated.disconnect()
         self._generator_logic.sigCurrentEnsembleUpdated.disconnect()
         self._generator_logic.sigCurrentSequenceUpdated.disconnect()
@@ -1053,6 +1060,16 @@ class PulsedMasterLogic(GenericLogic):
         self.sigBlockEnsembleSampled.emit(ensemble_name)
         return
 
+    def sampled_files_written(self, filenames):
+        """ Start the transfer of sampled files to the pulse generator while sampling goes on,
+        if they are sampled to be uploaded.
+
+        @param list filenames: names of the complete files
+        """
+        if self.status_dict['sauplo_busy']:
+            self.sigTransferFiles.emit(filenames)
+        return
+
     def sample_sequence_finished(self, sequence_name):
         """
 
@@ -21,16 +21,54 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 from qtpy import QtCore
 from collections import OrderedDict
+from collections import deque
 import numpy as np
 import time
 import datetime
 import matplotlib.pyplot as plt
 
+from core.util.histogram_accumulator import HistogramAccumulator
 from core.util.mutex import Mutex
-from core.util.network import netobtain
+from core.util.network import netobtain, is_netref
 from logic.generic_logic import GenericLogic
 
 
+class FastCounterPull(QtCore.QObject):
+
+    """ Helper class for polling the fast counter in a separate thread. The acquired raw traces
+    are stored in the bounded trace ring of the parent class, from which the analysis takes the
+    newest one.
+    """
+
+    def __init__(self, parentclass):
+        super().__init__()
+
+        # remember the reference to the parent class to access functions ad settings
+        self._parentclass = parentclass
+        self.timer = None
+
+    def handle_timer(self, state_change):
+        """ Threaded method that can be called by a signal from outside to start the timer.
+
+        @param bool state_change: (True) starts timer, (False) stops it.
+        """
+        if state_change:
+            if self.timer is None:
+                self.timer = QtCore.QTimer()
+                self.timer.setSingleShot(False)
+                self.timer.timeout.connect(self._pull_trace)
+            self.timer.start(int(1000. * self._parentclass.fast_counter_poll_interval))
+        elif self.timer is not None:
+            self.timer.stop()
+        return
+
+    def _pull_trace(self):
+        """ Gets the current raw trace from the fast counter and puts it into the trace ring. """
+        fc_data = self._parentclass._read_fast_counter_trace()
+        self._parentclass._push_trace(fc_data, time.time())
+        return
+
+
 class PulsedMeasurementLogic(GenericLogic):
     """
     This is the Logic class for the control of pulsed measurements.
@@ -67,6 +105,9 @@ class PulsedMeasurementLogic(GenericLogic):
     sigTimerIntervalUpdated = QtCore.Signal(float)
     sigAnalysisWindowsUpdated = QtCore.Signal(int, int, int, int)
     sigAnalysisMethodUpdated = QtCore.Signal(float)
+    sigExtractionMethodUpdated = QtCore.Signal(str)
+    sigAcquisitionStatisticsUpdated = QtCore.Signal(dict)
+    sigHandleTracePull = QtCore.Signal(bool)
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -122,10 +163,39 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # pulse extraction parameters
         self.conv_std_dev = 10
+        # method to extract the laser pulses of an ungated fast counter (see
+        # PulseExtractionLogic.ungated_extraction_methods)
+        self.extraction_method = 'conv_deriv'
 
         # threading
         self.threadlock = Mutex()
 
+        # Streaming acquisition: If fast_counter_poll_interval (in seconds) is > 0, the fast
+        # counter is polled in a separate thread and the raw traces are put into a ring holding
+        # the last trace_ring_size traces. The analysis always takes the newest trace, all older
+        # ones are dropped. So a slow analysis never stalls the acquisition.
+        if 'fast_counter_poll_interval' in config.keys():
+            self.fast_counter_poll_interval = float(config['fast_counter_poll_interval'])
+        else:
+            self.fast_counter_poll_interval = 0
+        if 'trace_ring_size' in config.keys():
+            self.trace_ring_size = int(config['trace_ring_size'])
+        else:
+            self.trace_ring_size = 4
+        self._trace_ring = deque(maxlen=self.trace_ring_size)
+        self._trace_lock = Mutex()
+        # The fast counter writes the raw traces into reused buffers. A buffer is free again
+        # when its trace has been dropped or replaced by a newer analyzed trace.
+        self._free_trace_buffers = deque(maxlen=self.trace_ring_size + 2)
+        self._trace_pull = None
+        self.trace_pull_thread = None
+        # acquisition statistics
+        self.traces_acquired = 0
+        self.traces_analyzed = 0
+        self.dropped_traces = 0
+        self.trace_latency = 0.0
+        self._trace_latency_sum = 0.0
+
         # plot data
         self.signal_plot_x = None
         self.signal_plot_y = None
@@ -138,7 +208,10 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # raw data
         self.laser_data = np.zeros((10, 20))
-        self.raw_data = np.zeros((10, 20))
+        # The raw traces are accumulated together with recalled raw data and the data before
+        # restarts of the fast counter histogram. The laser pulses are extracted from the
+        # accumulated histogram rebinned by the analysis rebin factor.
+        self._histogram = HistogramAccumulator(shape=(10, 20))
         self.show_raw_data = False
         self.show_laser_index = 0
         self.saved_raw_data = OrderedDict()  # temporary saved raw data
@@ -182,6 +255,10 @@ class PulsedMeasurementLogic(GenericLogic):
             self.number_of_lasers = self._statusVariables['number_of_lasers']
         if 'conv_std_dev' in self._statusVariables:
             self.conv_std_dev = self._statusVariables['conv_std_dev']
+        if 'extraction_method' in self._statusVariables:
+            self.extraction_method = self._statusVariables['extraction_method']
+        if self.extraction_method not in self._pulse_extraction_logic.ungated_extraction_methods:
+            self.extraction_method = 'conv_deriv'
         if 'laser_trigger_delay_s' in self._statusVariables:
             self.laser_trigger_delay_s = self._statusVariables['laser_trigger_delay_s']
         if 'fast_counter_record_length' in self._statusVariables:
@@ -214,6 +291,8 @@ class PulsedMeasurementLogic(GenericLogic):
             self.show_raw_data = self._statusVariables['show_raw_data']
         if 'show_laser_index' in self._statusVariables:
             self.show_laser_index = self._statusVariables['show_laser_index']
+        if 'analysis_rebin_factor' in self._statusVariables:
+            self._histogram.set_rebin_factor(self._statusVariables['analysis_rebin_factor'])
 
         # Check and configure pulse generator
         self.pulse_generator_off()
@@ -251,6 +330,16 @@ class PulsedMeasurementLogic(GenericLogic):
         # recalled saved raw data
         self.recalled_raw_data = None
 
+        # create an independent thread for polling the fast counter if streaming is enabled
+        if self.fast_counter_poll_interval > 0:
+            self.trace_pull_thread = QtCore.QThread()
+            self._trace_pull = FastCounterPull(self)
+            self._trace_pull.moveToThread(self.trace_pull_thread)
+            # blocking, so no trace is pulled anymore after the polling has been stopped
+            self.sigHandleTracePull.connect(self._trace_pull.handle_timer,
+                                            QtCore.Qt.BlockingQueuedConnection)
+            self.trace_pull_thread.start()
+
 
     def on_deactivate(self, e):
         """ Deactivate the module properly.
@@ -262,12 +351,20 @@ class PulsedMeasurementLogic(GenericLogic):
         if self.getState() != 'idle' and self.getState() != 'deactivated':
             self.stop_pulsed_measurement()
 
+        if self.trace_pull_thread is not None:
+            self.sigHandleTracePull.disconnect()
+            self.trace_pull_thread.quit()
+            self.trace_pull_thread.wait()
+            self.trace_pull_thread = None
+            self._trace_pull = None
+
         self._statusVariables['signal_start_bin'] = self.signal_start_bin
         self._statusVariables['signal_width_bin'] = self.signal_width_bin
         self._statusVariables['norm_start_bin'] = self.norm_start_bin
         self._statusVariables['norm_width_bin'] = self.norm_width_bin
         self._statusVariables['number_of_lasers'] = self.number_of_lasers
         self._statusVariables['conv_std_dev'] = self.conv_std_dev
+        self._statusVariables['extraction_method'] = self.extraction_method
         self._statusVariables['laser_trigger_delay_s'] = self.laser_trigger_delay_s
         self._statusVariables['fast_counter_record_length'] = self.fast_counter_record_length
         self._statusVariables['sequence_length_s'] = self.sequence_length_s
@@ -284,6 +381,7 @@ class PulsedMeasurementLogic(GenericLogic):
         self._statusVariables['alternating'] = self.alternating
         self._statusVariables['show_raw_data'] = self.show_raw_data
         self._statusVariables['show_laser_index'] = self.show_laser_index
+        self._statusVariables['analysis_rebin_factor'] = self._histogram.rebin_factor
 
     def request_init_values(self):
         """
@@ -574,6 +672,16 @@ class PulsedMeasurementLogic(GenericLogic):
         self.sigUploadedAssetsUpdated.emit(uploaded_assets)
         return err
 
+    def transfer_files(self, filenames):
+        """ Start the transfer of sampled files to the device without waiting for it, if the pulse
+        generator supports it. upload_asset then only waits for the transfers to finish.
+
+        @param list filenames: names of the sampled files
+        """
+        if hasattr(self._pulse_generator_device, 'transfer_files'):
+            self._pulse_generator_device.transfer_files(filenames)
+        return
+
     def upload_sequence(self, seq_name):
         """ Upload a sequence and all its related files
 
@@ -674,6 +782,7 @@ class PulsedMeasurementLogic(GenericLogic):
                 self._initialize_plots()
 
                 # recall stashed raw data
+                self._histogram.reset()
                 if stashed_raw_data_tag is None:
                     self.recalled_raw_data = None
                 elif stashed_raw_data_tag in self.saved_raw_data:
@@ -687,10 +796,16 @@ class PulsedMeasurementLogic(GenericLogic):
                 if self.use_ext_microwave:
                     self.microwave_on_off(True)
 
+                # reset the trace ring and the acquisition statistics
+                self._reset_trace_ring()
+
                 # start fast counter
                 self.fast_counter_on()
                 # start pulse generator
                 self.pulse_generator_on()
+                # start polling the fast counter if streaming is enabled
+                if self._trace_pull is not None:
+                    self.sigHandleTracePull.emit(True)
 
                 # set analysis_timer
                 self.analysis_timer = QtCore.QTimer()
@@ -708,35 +823,50 @@ class PulsedMeasurementLogic(GenericLogic):
         """
         with self.threadlock:
             if self.getState() == 'locked':
-                # calculate analysis windows
-                sig_start = self.signal_start_bin
-                sig_end = self.signal_start_bin + self.signal_width_bin
-                norm_start = self.norm_start_bin
-                norm_end = self.norm_start_bin + self.norm_width_bin
-
-                # get raw data from fast counter
-                fc_data = netobtain(self._fast_counter_device.get_data_trace())
+                # get the newest raw data from the fast counter
+                fc_data, acquisition_time = self._get_newest_trace()
+            else:
+                fc_data = None
+
+            # only analyze if a new trace has been acquired since the last analysis
+            if fc_data is not None:
+                # calculate analysis windows in bins of the rebinned histogram
+                rebin_factor = self._histogram.rebin_factor
+                sig_start = self.signal_start_bin // rebin_factor
+                sig_end = -(-(self.signal_start_bin + self.signal_width_bin) // rebin_factor)
+                norm_start = self.norm_start_bin // rebin_factor
+                norm_end = -(-(self.norm_start_bin + self.norm_width_bin) // rebin_factor)
+
                 if np.sum(fc_data) < 1.0:
                     self.log.warning('Only zeros received from fast counter!')
 
-                # add old raw data from previous measurements if necessary
+                # merge old raw data from previous measurements once. It is not added to every
+                # trace, but kept as offset of the accumulated histogram.
                 if self.recalled_raw_data is not None:
                     self.log.info('Found old saved raw data. Sum of timebins: {0}'
                                   ''.format(np.sum(self.recalled_raw_data)))
                     if self.recalled_raw_data.shape == fc_data.shape:
                         self.log.info('Raw data has same shape as current data.')
-                        self.raw_data = self.recalled_raw_data + fc_data
-                else:
-                    self.raw_data = fc_data
+                        self._histogram.merge(self.recalled_raw_data)
+                    else:
+                        self.log.warning('Raw data has a different shape than the current data '
+                                         'and is not added.')
+                    self.recalled_raw_data = None
+                # the trace is referenced by the histogram, the previous one can be reused for
+                # reading out the fast counter
+                self._release_trace_buffer(self._histogram.update(fc_data))
 
-                # extract laser pulses from raw data
+                # extract laser pulses from the rebinned histogram
+                binned_data = self._histogram.get_binned_histogram()
                 if self.fast_counter_gated:
-                    self.laser_data = self._pulse_extraction_logic.gated_extraction(self.raw_data,
-                                                                                    self.conv_std_dev)
+                    self.laser_data = self._pulse_extraction_logic.gated_extraction(
+                        binned_data, self.conv_std_dev / rebin_factor)
                 else:
-                    self.laser_data = self._pulse_extraction_logic.ungated_extraction(self.raw_data,
-                                                                                      self.conv_std_dev,
-                                                                                      self.number_of_lasers)
+                    extraction_method = self._pulse_extraction_logic.ungated_extraction_methods[
+                        self.extraction_method]
+                    self.laser_data = extraction_method(binned_data,
+                                                        self.conv_std_dev / rebin_factor,
+                                                        self.number_of_lasers)
                 # analyze pulses and get data points for signal plot
                 tmp_signal, tmp_error = self._pulse_analysis_logic.analyze_data(self.laser_data,
                                                                                 norm_start, norm_end,
@@ -761,6 +891,12 @@ class PulsedMeasurementLogic(GenericLogic):
                 # set laser to show
                 self.set_laser_to_show(self.show_laser_index, self.show_raw_data)
 
+                # update the acquisition statistics
+                self.trace_latency = time.time() - acquisition_time
+                self._trace_latency_sum += self.trace_latency
+                self.traces_analyzed += 1
+                self.sigAcquisitionStatisticsUpdated.emit(self.get_acquisition_statistics())
+
             # recalculate time
             self.elapsed_time = time.time() - self.start_time
             self.elapsed_time_str = ''
@@ -776,6 +912,108 @@ class PulsedMeasurementLogic(GenericLogic):
                                            self.measuring_error_plot_y2)
             return
 
+    def _get_newest_trace(self):
+        """ Get the newest raw trace of the fast counter.
+
+        @return tuple(numpy.ndarray, float): the raw trace and the time it was acquired at. The
+                                             trace is None if streaming is enabled and no new
+                                             trace has been acquired since the last call.
+
+        Without streaming the fast counter is polled directly.
+        """
+        if self._trace_pull is None:
+            acquisition_time = time.time()
+            fc_data = self._read_fast_counter_trace()
+            self.traces_acquired += 1
+            return fc_data, acquisition_time
+
+        with self._trace_lock:
+            if len(self._trace_ring) == 0:
+                return None, None
+            fc_data, acquisition_time = self._trace_ring.pop()
+            # all older traces are never analyzed
+            self.dropped_traces += len(self._trace_ring)
+            while len(self._trace_ring) > 0:
+                self._free_trace_buffers.append(self._trace_ring.popleft()[0])
+        return fc_data, acquisition_time
+
+    def _read_fast_counter_trace(self):
+        """ Read the current raw trace of the fast counter into a free trace buffer.
+
+        @return numpy.ndarray: the raw trace, which belongs to the logic until it is passed to
+                               _release_trace_buffer
+        """
+        if is_netref(self._fast_counter_device):
+            # a remote fast counter would fill a local buffer element by element via the network
+            return netobtain(self._fast_counter_device.get_data_trace())
+        with self._trace_lock:
+            if len(self._free_trace_buffers) > 0:
+                buffer = self._free_trace_buffers.pop()
+            else:
+                buffer = None
+        return self._fast_counter_device.get_data_trace(buffer)
+
+    def _release_trace_buffer(self, buffer):
+        """ Make a trace buffer available for reading out the fast counter again.
+
+        @param numpy.ndarray buffer: raw trace which is not used anymore, None is ignored
+        """
+        if buffer is not None:
+            with self._trace_lock:
+                self._free_trace_buffers.append(buffer)
+        return
+
+    def _push_trace(self, fc_data, acquisition_time):
+        """ Put a raw trace into the trace ring. Called from the fast counter polling thread.
+
+        @param numpy.ndarray fc_data: raw trace of the fast counter
+        @param float acquisition_time: time the trace was acquired at
+        """
+        with self._trace_lock:
+            # a full ring drops its oldest trace
+            if len(self._trace_ring) == self._trace_ring.maxlen:
+                self.dropped_traces += 1
+                self._free_trace_buffers.append(self._trace_ring.popleft()[0])
+            self._trace_ring.append((fc_data, acquisition_time))
+            self.traces_acquired += 1
+        return
+
+    def _reset_trace_ring(self):
+        """ Clear the trace ring and reset the acquisition statistics. """
+        with self._trace_lock:
+            self._trace_ring.clear()
+            # buffers of a previous measurement may not fit the traces anymore
+            self._free_trace_buffers.clear()
+            self.traces_acquired = 0
+            self.traces_analyzed = 0
+            self.dropped_traces = 0
+            self.trace_latency = 0.0
+            self._trace_latency_sum = 0.0
+        return
+
+    def get_acquisition_statistics(self):
+        """ Get the statistics of the fast counter acquisition.
+
+        @return dict: with the keys
+                      'traces_acquired': number of raw traces pulled from the fast counter,
+                      'traces_analyzed': number of raw traces analyzed,
+                      'dropped_traces': number of raw traces which were never analyzed,
+                      'latency': time in s between the acquisition and the end of the analysis of
+                                 the last analyzed trace,
+                      'mean_latency': mean latency of all analyzed traces in s
+        """
+        with self._trace_lock:
+            stats = dict()
+            stats['traces_acquired'] = self.traces_acquired
+            stats['traces_analyzed'] = self.traces_analyzed
+            stats['dropped_traces'] = self.dropped_traces
+            stats['latency'] = self.trace_latency
+            if self.traces_analyzed > 0:
+                stats['mean_latency'] = self._trace_latency_sum / self.traces_analyzed
+            else:
+                stats['mean_latency'] = 0.0
+        return stats
+
     def set_laser_to_show(self, laser_index, show_raw_data):
         """
 
@@ -785,21 +1023,28 @@ class PulsedMeasurementLogic(GenericLogic):
         """
         self.show_raw_data = show_raw_data
         self.show_laser_index = laser_index
+        # the plot data is read by the GUI, so it must not refer to the raw trace, whose buffer is
+        # reused for reading out the fast counter
         if show_raw_data:
             if self.fast_counter_gated:
                 if laser_index > 0:
-                    self.laser_plot_y = self.raw_data[laser_index - 1]
+                    self.laser_plot_y = self.raw_data[laser_index - 1].copy()
                 else:
                     self.laser_plot_y = np.sum(self.raw_data, 0)
             else:
-                self.laser_plot_y = self.raw_data
+                self.laser_plot_y = self.raw_data.copy()
         else:
             if laser_index > 0:
                 self.laser_plot_y = self.laser_data[laser_index - 1]
             else:
                 self.laser_plot_y = np.sum(self.laser_data, 0)
 
-        self.laser_plot_x = np.arange(1, len(self.laser_plot_y) + 1)
+        if show_raw_data:
+            self.laser_plot_x = np.arange(1, len(self.laser_plot_y) + 1)
+        else:
+            # the laser pulses are extracted from the rebinned histogram
+            rebin_factor = self._histogram.rebin_factor
+            self.laser_plot_x = np.arange(len(self.laser_plot_y)) * rebin_factor + 1
 
         self.sigLaserToShowUpdated.emit(self.show_laser_index, self.show_raw_data)
         self.sigLaserDataUpdated.emit(self.laser_plot_x, self.laser_plot_y)
@@ -817,6 +1062,9 @@ class PulsedMeasurementLogic(GenericLogic):
                 self.analysis_timer.stop()
                 self.analysis_timer.timeout.disconnect()
                 self.analysis_timer = None
+                # stop polling the fast counter
+                if self._trace_pull is not None:
+                    self.sigHandleTracePull.emit(False)
 
                 self.fast_counter_off()
                 self.pulse_generator_off()
@@ -842,6 +1090,8 @@ class PulsedMeasurementLogic(GenericLogic):
             if self.getState() == 'locked':
                 #pausing the timer
                 self.analysis_timer.stop()
+                if self._trace_pull is not None:
+                    self.sigHandleTracePull.emit(False)
 
                 self.fast_counter_pause()
                 self.pulse_generator_off()
@@ -861,6 +1111,8 @@ class PulsedMeasurementLogic(GenericLogic):
                     self.microwave_on_off(True)
                 self.fast_counter_continue()
                 self.pulse_generator_on()
+                if self._trace_pull is not None:
+                    self.sigHandleTracePull.emit(True)
 
                 #unpausing the timer
                 self.analysis_timer.start()
@@ -918,6 +1170,54 @@ class PulsedMeasurementLogic(GenericLogic):
             self.sigAnalysisMethodUpdated.emit(self.conv_std_dev)
         return
 
+    def set_extraction_method(self, method):
+        """ Set the method to extract the laser pulses of an ungated fast counter.
+
+        @param str method: name of the method, one of get_extraction_methods()
+
+        @return str: the extraction method set
+        """
+        with self.threadlock:
+            if method in self._pulse_extraction_logic.ungated_extraction_methods:
+                self.extraction_method = method
+            else:
+                self.log.error('Unknown laser pulse extraction method "{0}". Available methods '
+                               'are: {1}'.format(method, self.get_extraction_methods()))
+            self.sigExtractionMethodUpdated.emit(self.extraction_method)
+        return self.extraction_method
+
+    def set_analysis_rebin_factor(self, factor):
+        """ Set the number of fast counter bins summed up for the extraction and analysis of the
+        laser pulses.
+
+        @param int factor: the rebin factor, 1 to analyze the full resolution
+
+        @return int: the rebin factor set
+
+        The analysis windows stay in bins of the fast counter. The raw data is kept at full
+        resolution.
+        """
+        with self.threadlock:
+            factor = self._histogram.set_rebin_factor(factor)
+        return factor
+
+    @property
+    def raw_data(self):
+        """ Full resolution raw data of the fast counter including recalled raw data.
+
+        The array may be a trace buffer, which is reused for reading out the fast counter after
+        the next analysis. Outside of the analysis loop it has to be copied with the threadlock
+        held.
+        """
+        return self._histogram.get_histogram()
+
+    def get_extraction_methods(self):
+        """ Get the names of all methods to extract the laser pulses of an ungated fast counter.
+
+        @return list: names of the extraction methods
+        """
+        return list(self._pulse_extraction_logic.ungated_extraction_methods)
+
     def _initialize_plots(self):
         """
         Initializing the signal, error and laser plot data.
@@ -937,6 +1237,16 @@ class PulsedMeasurementLogic(GenericLogic):
         return
 
     def save_measurement_data(self, tag=None):
+        # The data is saved in the background. Copy it while the analysis loop cannot replace it,
+        # the raw data buffer is reused for reading out the fast counter.
+        with self.threadlock:
+            raw_data = self.raw_data.copy()
+            laser_data = np.array(self.laser_data)
+            signal_plot_x = np.array(self.signal_plot_x)
+            signal_plot_y = np.array(self.signal_plot_y)
+            signal_plot_y2 = np.array(self.signal_plot_y2)
+            rebin_factor = self._histogram.rebin_factor
+
         #####################################################################
         ####                Save extracted laser pulses                  ####
         #####################################################################
@@ -949,14 +1259,16 @@ class PulsedMeasurementLogic(GenericLogic):
             filelabel = 'laser_pulses'
         # prepare the data in a dict or in an OrderedDict:
         data = OrderedDict()
-        data['Signal (counts)'] = self.laser_data.transpose()
+        data['Signal (counts)'] = laser_data.transpose()
         # write the parameters:
         parameters = OrderedDict()
-        parameters['Bin size (s)'] = self.fast_counter_binwidth
-        parameters['laser length (s)'] = self.fast_counter_binwidth * self.laser_plot_x.size
+        parameters['Bin size (s)'] = self.fast_counter_binwidth * rebin_factor
+        parameters['laser length (s)'] = (self.fast_counter_binwidth * rebin_factor
+                                          * laser_data.shape[1])
 
-        self._save_logic.save_data(data, filepath, parameters=parameters, filelabel=filelabel,
-                                   timestamp=timestamp, as_text=True, precision=':.6e')
+        self._save_logic.save_data_async(data, filepath, parameters=parameters,
+                                         filelabel=filelabel, timestamp=timestamp,
+                                         precision=':.6e')
 
         #####################################################################
         ####                Save measurement data                        ####
@@ -969,15 +1281,15 @@ class PulsedMeasurementLogic(GenericLogic):
         # prepare the data in a dict or in an OrderedDict:
         data = OrderedDict()
         if self.alternating:
-            data_array = np.zeros([3,len(self.signal_plot_x)], dtype=float)
-            data_array[0, :] = self.signal_plot_x
-            data_array[1, :] = self.signal_plot_y
-            data_array[2, :] = self.signal_plot_y2
+            data_array = np.zeros([3,len(signal_plot_x)], dtype=float)
+            data_array[0, :] = signal_plot_x
+            data_array[1, :] = signal_plot_y
+            data_array[2, :] = signal_plot_y2
             data['Tau (ns), Signal (norm.), Signal2 (norm.)'] = data_array.transpose()
         else:
-            data_array = np.zeros([2, len(self.signal_plot_x)], dtype=float)
-            data_array[0, :] = self.signal_plot_x
-            data_array[1, :] = self.signal_plot_y
+            data_array = np.zeros([2, len(signal_plot_x)], dtype=float)
+            data_array[0, :] = signal_plot_x
+            data_array[1, :] = signal_plot_y
             data['Tau (ns), Signal (norm.)'] = data_array.transpose()
 
         # write the parameters:
@@ -989,22 +1301,17 @@ class PulsedMeasurementLogic(GenericLogic):
         parameters['Normalization start (bin)'] = self.norm_start_bin
         parameters['Normalization width (bins)'] = self.norm_width_bin
         parameters['Standard deviation of gaussian convolution'] = self.conv_std_dev
-        # Prepare the figure to save as a "data thumbnail"
-        plt.style.use(self._save_logic.mpl_qd_style)
-        fig, ax1 = plt.subplots()
-        ax1.plot(self.signal_plot_x, self.signal_plot_y)
+        # The figure to save as a "data thumbnail" is drawn by the save logic
         if self.alternating:
-            ax1.plot(self.signal_plot_x, self.signal_plot_y2)
-        ax1.set_xlabel('x-axis')
-        ax1.set_ylabel('norm. sig (a.u.)')
-        # ax1.set_xlim(self.plot_domain)
-        # ax1.set_ylim(self.plot_range)
-        fig.tight_layout()
+            plotfig_args = (signal_plot_x, signal_plot_y, signal_plot_y2)
+        else:
+            plotfig_args = (signal_plot_x, signal_plot_y)
 
-        self._save_logic.save_data(data, filepath, parameters=parameters, filelabel=filelabel,
-                                   timestamp=timestamp, as_text=True, plotfig=fig,
-                                   precision=':.6e')
-        plt.close(fig)
+        self._save_logic.save_data_async(data, filepath, parameters=parameters,
+                                         filelabel=filelabel, timestamp=timestamp,
+                                         precision=':.6e',
+                                         plotfig_function=self.draw_measurement_figure,
+                                         plotfig_args=plotfig_args)
 
         #####################################################################
         ####                Save raw data timetrace                      ####
@@ -1016,23 +1323,46 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # prepare the data in a dict or in an OrderedDict:
         data = OrderedDict()
-        data['Signal (counts)'] = self.raw_data.transpose()
+        data['Signal (counts)'] = raw_data.transpose()
         # write the parameters:
         parameters = OrderedDict()
         parameters['Is counter gated?'] = self.fast_counter_gated
         parameters['Is alternating?'] = self.alternating
         parameters['Bin size (s)'] = self.fast_counter_binwidth
         parameters['Number of laser pulses'] = self.number_of_lasers
-        parameters['laser length (s)'] = self.fast_counter_binwidth * self.laser_plot_x.size
+        parameters['laser length (s)'] = (self.fast_counter_binwidth * rebin_factor
+                                          * laser_data.shape[1])
         parameters['Controlled variable start'] = self.controlled_vals[0]
         parameters['Controlled variable increment'] = (self.controlled_vals[-1] -
                                                      self.controlled_vals[0]) / (
                                                     len(self.controlled_vals) - 1)
 
-        self._save_logic.save_data(data, filepath, parameters=parameters, filelabel=filelabel,
-                                   timestamp=timestamp, as_text=True, precision=':.6e')
+        self._save_logic.save_data_async(data, filepath, parameters=parameters,
+                                         filelabel=filelabel, timestamp=timestamp,
+                                         precision=':.6e')
         return
 
+    def draw_measurement_figure(self, signal_x, signal_y, signal_y2=None):
+        """ Draw the figure of the measurement signal to save with the data.
+
+        @param numpy.ndarray signal_x: the values of the controlled variable
+        @param numpy.ndarray signal_y: the signal
+        @param numpy.ndarray signal_y2: optional, the second signal of an alternating sequence
+
+        @return matplotlib.figure.Figure: the figure
+        """
+        plt.style.use(self._save_logic.mpl_qd_style)
+        fig, ax1 = plt.subplots()
+        ax1.plot(signal_x, signal_y)
+        if signal_y2 is not None:
+            ax1.plot(signal_x, signal_y2)
+        ax1.set_xlabel('x-axis')
+        ax1.set_ylabel('norm. sig (a.u.)')
+        # ax1.set_xlim(self.plot_domain)
+        # ax1.set_ylim(self.plot_range)
+        fig.tight_layout()
+        return fig
+
     def compute_fft(self):
         """ Computing the fourier transform of the data.
 
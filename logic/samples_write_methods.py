@@ -22,6 +22,8 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import os
+import re
+import shutil
 import numpy as np
 from collections import OrderedDict
 from lxml import etree as ET
@@ -41,6 +43,28 @@ class SamplesWriteMethods():
         self._write_to_file['seq'] = self._write_seq
         self._write_to_file['seqx'] = self._write_seqx
         self._write_to_file['fpga'] = self._write_fpga
+
+        # Methods to overwrite a part of an already written waveform file in place. Used to
+        # resample only the changed parts of a waveform. The dictionary keys are the same as above.
+        self._patch_file = OrderedDict()
+        self._patch_file['wfm'] = self._patch_wfm
+        self._patch_file['wfmx'] = self._patch_wfmx
+        self._patch_file['fpga'] = self._patch_fpga
+
+        # Write methods which preallocate the final file on the first chunk and write all chunks
+        # directly into a memory map of it. Can replace the methods in _write_to_file with the
+        # same keys. The index of the next sample to write is kept for each file name.
+        self._write_to_file_memmap = OrderedDict()
+        self._write_to_file_memmap['wfm'] = self._write_wfm_memmap
+        self._write_to_file_memmap['wfmx'] = self._write_wfmx_memmap
+        self._write_to_file_memmap['fpga'] = self._write_fpga_memmap
+        self._memmap_write_position = dict()
+
+        # Write methods for purely digital formats which create the file directly from the
+        # run-length encoded states (digital word and length in bins of each state) without
+        # sampling each digital channel first.
+        self._write_states_to_file = OrderedDict()
+        self._write_states_to_file['fpga'] = self._write_fpga_states
         return
 
     def _write_wfmx(self, name, analog_samples, digital_samples, total_number_of_samples,
@@ -359,6 +383,448 @@ class SamplesWriteMethods():
 
         return created_files
 
+    def _write_wfmx_memmap(self, name, analog_samples, digital_samples, total_number_of_samples,
+                           is_first_chunk, is_last_chunk):
+        """
+        Writes a sampled chunk of a whole waveform to wfmx-files through a memory map. The files
+        are created with their final size on the first chunk. The resulting files are identical
+        to the ones created by _write_wfmx (the marker samples are only included if a marker of
+        the channel is active) but no temporary files are needed.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, contains the samples for the analog channels
+                               that are to be written by this function call.
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+                                        Has to be known it advance.
+        @param is_first_chunk: bool, indicates if the current chunk is the first write to this
+                               file.
+        @param is_last_chunk: bool, indicates if the current chunk is the last write to this file.
+
+        @return list: the list contains the string names of the created files for the passed
+                      presampled arrays
+        """
+        created_files = []
+        ana_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                            'a_ch' in chnl]
+
+        if is_first_chunk:
+            # create header
+            self._create_xml_file(total_number_of_samples, self.temp_dir)
+            # read back the header xml-file and delete it afterwards
+            temp_file = os.path.join(self.temp_dir, 'header.xml')
+            with open(temp_file, 'rb') as header:
+                header_bytes = header.read()
+            os.remove(temp_file)
+            for channel in ana_chnl_numbers:
+                filename = name + '_ch' + str(channel) + '.wfmx'
+                created_files.append(filename)
+                # The file consists of the xml header followed by all analog samples (float32)
+                # and all marker samples (uint8) if a marker of the channel is active.
+                if self._wfmx_markers_active(channel):
+                    data_length_bytes = 5 * total_number_of_samples
+                else:
+                    data_length_bytes = 4 * total_number_of_samples
+                self._preallocate_file(os.path.join(self.waveform_dir, filename), header_bytes,
+                                       data_length_bytes)
+            self._memmap_write_position[name] = 0
+
+        start_bin = self._memmap_write_position[name]
+        chunk_length_bins = analog_samples.shape[1]
+        for channel_index, channel in enumerate(ana_chnl_numbers):
+            if chunk_length_bins == 0:
+                break
+            filepath = os.path.join(self.waveform_dir, name + '_ch' + str(channel) + '.wfmx')
+            header_length = self._get_wfmx_header_length(filepath)
+            analog_map = np.memmap(filepath, dtype='float32', mode='r+', offset=header_length,
+                                   shape=(total_number_of_samples,))
+            analog_map[start_bin:start_bin + chunk_length_bins] = analog_samples[channel_index]
+            analog_map.flush()
+            del analog_map
+            if not self._wfmx_markers_active(channel):
+                continue
+            marker_map = np.memmap(filepath, dtype='uint8', mode='r+',
+                                   offset=header_length + 4 * total_number_of_samples,
+                                   shape=(total_number_of_samples,))
+            marker_map[start_bin:start_bin + chunk_length_bins] = self._encode_markers(
+                digital_samples, channel, 0, 1)
+            marker_map.flush()
+            del marker_map
+
+        self._memmap_write_position[name] = start_bin + chunk_length_bins
+        if is_last_chunk:
+            del self._memmap_write_position[name]
+        return created_files
+
+    def _write_wfm_memmap(self, name, analog_samples, digital_samples, total_number_of_samples,
+                          is_first_chunk, is_last_chunk):
+        """
+        Writes a sampled chunk of a whole waveform to wfm-files through a memory map. The files
+        are created with their final size (incl. header and footer) on the first chunk. The
+        resulting files are identical to the ones created by _write_wfm.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, contains the samples for the analog channels
+                               that are to be written by this function call.
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+                                        Has to be known it advance.
+        @param is_first_chunk: bool, indicates if the current chunk is the first write to this
+                               file.
+        @param is_last_chunk: bool, indicates if the current chunk is the last write to this file.
+
+        @return list: the list contains the string names of the created files for the passed
+                      presampled arrays
+        """
+        created_files = []
+        ana_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                            'a_ch' in chnl]
+
+        # see _write_wfm for the file format
+        num_bytes = str(int(total_number_of_samples * 5))
+        header = str.encode('MAGIC 1000\r\n#' + str(len(num_bytes)) + num_bytes)
+        footer = str.encode('CLOCK {0:16.10E}\r\n'.format(self.sample_rate))
+        if is_first_chunk:
+            self._memmap_write_position[name] = 0
+        start_bin = self._memmap_write_position[name]
+        chunk_length_bins = analog_samples.shape[1]
+
+        for channel_index, channel_number in enumerate(ana_chnl_numbers):
+            filename = name + '_ch' + str(channel_number) + '.wfm'
+            created_files.append(filename)
+            filepath = os.path.join(self.waveform_dir, filename)
+            if is_first_chunk:
+                self._preallocate_file(filepath, header, 5 * total_number_of_samples, footer)
+            if chunk_length_bins == 0:
+                continue
+            # One record consists of 4 bytes (float32) analog sample and 1 byte (uint8) markers.
+            record_map = np.memmap(filepath, dtype='float32, uint8', mode='r+',
+                                   offset=len(header), shape=(total_number_of_samples,))
+            record_map['f0'][start_bin:start_bin + chunk_length_bins] = \
+                analog_samples[channel_index]
+            record_map['f1'][start_bin:start_bin + chunk_length_bins] = self._encode_markers(
+                digital_samples, channel_number, 6, 7)
+            record_map.flush()
+            del record_map
+
+        self._memmap_write_position[name] = start_bin + chunk_length_bins
+        if is_last_chunk:
+            del self._memmap_write_position[name]
+        return created_files
+
+    def _write_fpga_memmap(self, name, analog_samples, digital_samples, total_number_of_samples,
+                           is_first_chunk, is_last_chunk):
+        """
+        Writes a sampled chunk of a whole waveform to a fpga-file through a memory map. The file
+        is created with its final size (padded with zero-samples to an integer multiple of 32
+        samples) on the first chunk.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, unused
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+                                        Has to be known it advance.
+        @param is_first_chunk: bool, indicates if the current chunk is the first write to this
+                               file.
+        @param is_last_chunk: bool, indicates if the current chunk is the last write to this file.
+
+        @return list: the list contains the string names of the created files for the passed
+                      presampled arrays
+        """
+        channel_number = digital_samples.shape[0]
+        # FIXME: Also allow for single channel to be specified. Set all others to zero.
+        if channel_number != 8:
+            self.log.error('FPGA pulse generator needs 8 digital channels. '
+                    '{0} is not allowed!'.format(channel_number))
+            return -1
+
+        filename = name + '.fpga'
+        filepath = os.path.join(self.waveform_dir, filename)
+        # check if the sequence length is an integer multiple of 32 bins
+        file_length_bins = total_number_of_samples
+        if total_number_of_samples % 32 != 0:
+            file_length_bins += 32 - (total_number_of_samples % 32)
+        if is_first_chunk:
+            if file_length_bins != total_number_of_samples:
+                self.log.warning('FPGA pulse sequence length is no integer '
+                        'multiple of 32 samples. Appending {0} zero-samples to '
+                        'the sequence.'.format(file_length_bins - total_number_of_samples))
+            # the zero-samples at the end are created by preallocating the file
+            self._preallocate_file(filepath, b'', file_length_bins)
+            self._memmap_write_position[name] = 0
+
+        start_bin = self._memmap_write_position[name]
+        chunk_length_bins = digital_samples.shape[1]
+        if chunk_length_bins > 0:
+            encoded_map = np.memmap(filepath, dtype='uint8', mode='r+',
+                                    shape=(file_length_bins,))
+            encoded_samples = encoded_map[start_bin:start_bin + chunk_length_bins]
+            # encode channels into FPGA samples (bytes)
+            for channel in range(channel_number):
+                encoded_samples += np.left_shift(digital_samples[channel].astype('uint8'),
+                                                 channel)
+            encoded_map.flush()
+            del encoded_samples, encoded_map
+
+        self._memmap_write_position[name] = start_bin + chunk_length_bins
+        if is_last_chunk:
+            del self._memmap_write_position[name]
+        return [filename]
+
+    def _write_fpga_states(self, name, digital_words, state_length_bins, total_number_of_samples,
+                           is_first_chunk, is_last_chunk):
+        """
+        Writes a chunk of run-length encoded states of a whole waveform to a fpga-file. Each state
+        is given by its digital word (bit i represents the i-th digital channel) and its length in
+        bins. The file is created with its final size (padded with zero-samples to an integer
+        multiple of 32 samples) on the first chunk. The resulting file is identical to the one
+        created by _write_fpga for the sampled states.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param digital_words: uint numpy ndarray, contains the digital word of each state
+        @param state_length_bins: int numpy ndarray, contains the length in bins of each state
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+                                        Has to be known it advance.
+        @param is_first_chunk: bool, indicates if the current chunk is the first write to this
+                               file.
+        @param is_last_chunk: bool, indicates if the current chunk is the last write to this file.
+
+        @return list: the list contains the string names of the created files
+        """
+        channel_number = len([chnl for chnl in self.activation_config if 'd_ch' in chnl])
+        # FIXME: Also allow for single channel to be specified. Set all others to zero.
+        if channel_number != 8:
+            self.log.error('FPGA pulse generator needs 8 digital channels. '
+                    '{0} is not allowed!'.format(channel_number))
+            return -1
+
+        filename = name + '.fpga'
+        filepath = os.path.join(self.waveform_dir, filename)
+        # check if the sequence length is an integer multiple of 32 bins
+        file_length_bins = total_number_of_samples
+        if total_number_of_samples % 32 != 0:
+            file_length_bins += 32 - (total_number_of_samples % 32)
+        if is_first_chunk:
+            if file_length_bins != total_number_of_samples:
+                self.log.warning('FPGA pulse sequence length is no integer '
+                        'multiple of 32 samples. Appending {0} zero-samples to '
+                        'the sequence.'.format(file_length_bins - total_number_of_samples))
+            # the zero-samples at the end are created by preallocating the file
+            self._preallocate_file(filepath, b'', file_length_bins)
+            self._memmap_write_position[name] = 0
+
+        start_bin = self._memmap_write_position[name]
+        chunk_length_bins = int(np.sum(state_length_bins))
+        if chunk_length_bins > 0:
+            # The 8 digital channels of a state are already encoded in its digital word. Just
+            # repeat the encoded byte of each state for the length of the state.
+            encoded_states = np.bitwise_and(digital_words, 0xFF).astype('uint8')
+            encoded_map = np.memmap(filepath, dtype='uint8', mode='r+',
+                                    shape=(file_length_bins,))
+            encoded_map[start_bin:start_bin + chunk_length_bins] = np.repeat(encoded_states,
+                                                                             state_length_bins)
+            encoded_map.flush()
+            del encoded_map
+
+        self._memmap_write_position[name] = start_bin + chunk_length_bins
+        if is_last_chunk:
+            del self._memmap_write_position[name]
+        return [filename]
+
+    @staticmethod
+    def _preallocate_file(filepath, header, data_length_bytes, footer=b''):
+        """
+        Creates a file with its final size consisting of a header, a zero-filled data region and
+        a footer. An already existing file is deleted first so hard links to it (e.g. in the
+        waveform cache) are not modified.
+
+        @param filepath: string, path of the file to create
+        @param header: bytes, written at the beginning of the file
+        @param data_length_bytes: int, size of the data region in bytes
+        @param footer: bytes, written after the data region
+        """
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        with open(filepath, 'wb') as outfile:
+            outfile.write(header)
+            if footer:
+                outfile.seek(len(header) + data_length_bytes)
+                outfile.write(footer)
+            else:
+                outfile.truncate(len(header) + data_length_bytes)
+        return
+
+    def _patch_wfmx(self, name, analog_samples, digital_samples, total_number_of_samples,
+                    start_bin):
+        """
+        Overwrites the samples starting at sample index start_bin in already existing wfmx-files.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, contains the samples for the analog channels
+                               that are to be written by this function call.
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+        @param start_bin: int, index of the first sample to overwrite
+
+        @return list: the list contains the string names of the patched files
+        """
+        patched_files = []
+        ana_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                            'a_ch' in chnl]
+        for channel_index, channel_number in enumerate(ana_chnl_numbers):
+            filename = name + '_ch' + str(channel_number) + '.wfmx'
+            filepath = os.path.join(self.waveform_dir, filename)
+            self._unshare_file(filepath)
+            # The file consists of the xml header followed by all analog samples (float32) and
+            # all marker samples (uint8). The marker samples are missing if no marker of the
+            # channel was active when the file was written.
+            header_length = self._get_wfmx_header_length(filepath)
+            has_markers = (os.path.getsize(filepath) - header_length
+                           == 5 * total_number_of_samples)
+            with open(filepath, 'r+b') as wfmxfile:
+                wfmxfile.seek(header_length + 4 * start_bin)
+                wfmxfile.write(analog_samples[channel_index])
+                if has_markers:
+                    wfmxfile.seek(header_length + 4 * total_number_of_samples + start_bin)
+                    wfmxfile.write(self._encode_markers(digital_samples, channel_number, 0, 1))
+            patched_files.append(filename)
+        return patched_files
+
+    def _patch_wfm(self, name, analog_samples, digital_samples, total_number_of_samples,
+                   start_bin):
+        """
+        Overwrites the samples starting at sample index start_bin in already existing wfm-files.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, contains the samples for the analog channels
+                               that are to be written by this function call.
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+        @param start_bin: int, index of the first sample to overwrite
+
+        @return list: the list contains the string names of the patched files
+        """
+        patched_files = []
+        ana_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                            'a_ch' in chnl]
+        num_bytes = str(int(total_number_of_samples * 5))
+        header_length = len('MAGIC 1000\r\n#' + str(len(num_bytes)) + num_bytes)
+        for channel_index, channel_number in enumerate(ana_chnl_numbers):
+            filename = name + '_ch' + str(channel_number) + '.wfm'
+            filepath = os.path.join(self.waveform_dir, filename)
+            self._unshare_file(filepath)
+            write_array = np.empty(digital_samples.shape[1], dtype='float32, uint8')
+            write_array['f0'] = analog_samples[channel_index]
+            write_array['f1'] = self._encode_markers(digital_samples, channel_number, 6, 7)
+            with open(filepath, 'r+b') as wfm_file:
+                wfm_file.seek(header_length + 5 * start_bin)
+                wfm_file.write(write_array)
+            patched_files.append(filename)
+        return patched_files
+
+    def _patch_fpga(self, name, analog_samples, digital_samples, total_number_of_samples,
+                    start_bin):
+        """
+        Overwrites the samples starting at sample index start_bin in an already existing fpga-file.
+
+        @param name: string, represents the name of the sampled ensemble
+        @param analog_samples: float32 numpy ndarray, unused
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+                                that are to be written by this function call.
+        @param total_number_of_samples: int, The total number of samples in the entire waveform.
+        @param start_bin: int, index of the first sample to overwrite
+
+        @return list: the list contains the string names of the patched files
+        """
+        channel_number = digital_samples.shape[0]
+        if channel_number != 8:
+            self.log.error('FPGA pulse generator needs 8 digital channels. '
+                    '{0} is not allowed!'.format(channel_number))
+            return -1
+        encoded_samples = np.zeros(digital_samples.shape[1], dtype='uint8')
+        for channel in range(channel_number):
+            encoded_samples += (2 ** channel) * np.uint8(digital_samples[channel])
+
+        filename = name + '.fpga'
+        filepath = os.path.join(self.waveform_dir, filename)
+        self._unshare_file(filepath)
+        with open(filepath, 'r+b') as fpgafile:
+            fpgafile.seek(start_bin)
+            fpgafile.write(encoded_samples)
+        return [filename]
+
+    def _encode_markers(self, digital_samples, channel_number, marker1_bit, marker2_bit):
+        """
+        Encodes the two marker channels belonging to an analog channel into one uint8 per sample.
+
+        @param digital_samples: bool numpy ndarray, contains the samples for the digital channels
+        @param channel_number: int, number of the analog channel
+        @param marker1_bit: int, bit position of the first marker
+        @param marker2_bit: int, bit position of the second marker
+
+        @return numpy.ndarray: uint8 array with the encoded marker states
+        """
+        digi_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                             'd_ch' in chnl]
+        markers = np.zeros(digital_samples.shape[1], dtype='uint8')
+        if (channel_number * 2) - 1 in digi_chnl_numbers:
+            digi_index = digi_chnl_numbers.index((channel_number * 2) - 1)
+            markers += np.left_shift(digital_samples[digi_index].astype('uint8'), marker1_bit)
+        if channel_number * 2 in digi_chnl_numbers:
+            digi_index = digi_chnl_numbers.index(channel_number * 2)
+            markers += np.left_shift(digital_samples[digi_index].astype('uint8'), marker2_bit)
+        return markers
+
+    def _wfmx_markers_active(self, channel_number):
+        """
+        Checks if a marker of an analog channel is active. Otherwise the wfmx-file of the channel
+        contains no marker samples.
+
+        @param channel_number: int, number of the analog channel
+
+        @return bool: True if at least one of the two markers is active
+        """
+        digi_chnl_numbers = [int(chnl.split('ch')[-1]) for chnl in self.activation_config if
+                             'd_ch' in chnl]
+        return ((channel_number * 2) - 1 in digi_chnl_numbers
+                or channel_number * 2 in digi_chnl_numbers)
+
+    @staticmethod
+    def _get_wfmx_header_length(filepath):
+        """
+        Reads the length of the xml header of a wfmx-file from the offset attribute of its
+        DataFile element (see _create_xml_file).
+
+        @param filepath: string, path of the wfmx-file
+
+        @return int: length of the header in bytes
+        """
+        with open(filepath, 'rb') as wfmxfile:
+            header_start = wfmxfile.read(256)
+        match = re.search(b'offset="([0-9]+)"', header_start)
+        if match is None:
+            raise ValueError('No header length found in wfmx-file {0}.'.format(filepath))
+        return int(match.group(1))
+
+    @staticmethod
+    def _unshare_file(filepath):
+        """
+        Makes sure a file can be modified in place without changing other hard links to the same
+        data (e.g. in the waveform cache) by replacing it with a private copy.
+
+        @param filepath: string, path of the file
+        """
+        if os.stat(filepath).st_nlink > 1:
+            tmp_path = filepath + '.tmp'
+            shutil.copyfile(filepath, tmp_path)
+            os.replace(tmp_path, filepath)
+        return
+
     def _write_seq(self, name, sequence_param):
         """
         Write a sequence to a seq-file.
@@ -514,7 +980,7 @@ class SamplesWriteMethods():
         # The header length is written into the file
         # The first line is not included since it is redundant
         # Also the last endline (\n) is excluded
-        text = open(filepath, "U").read()
+        text = open(filepath, "r").read()
         text = text.replace("xxxxxxxxx", length_of_header)
         text = bytes(text, 'UTF-8')
         f = open(filepath, "wb")
@@ -44,6 +44,27 @@ class SamplingFunctions():
         self._math_func['DoubleSinGauss']   = self._doublesingauss
         self._math_func['TripleSinGauss']   = self._triplesingauss
 
+        # Variants of the functions above which can sample many PulseBlockElements with one call.
+        # Instead of scalars, the parameters dict holds one array entry per sample (same length as
+        # time_arr). Functions, which depend on the element boundaries (e.g. the Gaussian
+        # envelopes), additionally receive the per-sample arrays 'mu' and 'sigma' in the
+        # parameters dict. Add those functions to _math_func_windowed.
+        # Functions without a batch variant are sampled element by element using _math_func.
+        self._math_func_batch = OrderedDict()
+        self._math_func_batch['Idle']           = self._idle
+        self._math_func_batch['DC']             = self._dc
+        self._math_func_batch['Sin']            = self._sin
+        self._math_func_batch['Cos']            = self._cos
+        self._math_func_batch['DoubleSin']      = self._doublesin
+        self._math_func_batch['TripleSin']      = self._triplesin
+
+        self._math_func_batch['SinGauss']       = self._singauss_batch
+        self._math_func_batch['CosGauss']       = self._cosgauss_batch
+        self._math_func_batch['DoubleSinGauss'] = self._doublesingauss_batch
+        self._math_func_batch['TripleSinGauss'] = self._triplesingauss_batch
+
+        self._math_func_windowed = ['SinGauss', 'CosGauss', 'DoubleSinGauss', 'TripleSinGauss']
+
         # Definition of constraints for the parameters
         # --------------------------------------------
         # Mathematical parameters may be subjected to certain constraints
@@ -137,6 +158,15 @@ class SamplingFunctions():
         self.func_config['TripleSin']['phase2']     = phase_def
         self.func_config['TripleSin']['phase3']     = phase_def
 
+        # The ordered parameter names of each function in _math_func. Used to store the
+        # parameters of many PulseBlockElements as a numeric table for batched sampling.
+        self._func_param_names = OrderedDict()
+        for func_name in self.func_config:
+            self._func_param_names[func_name] = list(self.func_config[func_name])
+        self._func_param_names['SinGauss'] = list(self.func_config['Sin'])
+        self._func_param_names['CosGauss'] = list(self.func_config['Cos'])
+        self._func_param_names['DoubleSinGauss'] = list(self.func_config['DoubleSin'])
+        self._func_param_names['TripleSinGauss'] = list(self.func_config['TripleSin'])
 
     def _idle(self, time_arr, parameters=None):
         result_arr = np.zeros(len(time_arr))
@@ -236,6 +266,177 @@ class SamplingFunctions():
         result_arr = (amp1 * np.sin(2*np.pi * freq1 * time_arr + phase1) + amp2 * np.sin(2*np.pi * freq2 * time_arr + phase2) + amp3 * np.sin(2*np.pi * freq3 * time_arr + phase3)) * np.exp(-(((time_arr-mu)/sigma)**2)/2)
         return result_arr
 
+    def _singauss_batch(self, time_arr, parameters):
+        sigma = parameters['sigma']
+        mu = parameters['mu']
+        result_arr = self._sin(time_arr, parameters) * np.exp(-(((time_arr-mu)/sigma)**2)/2)
+        return result_arr
 
+    def _cosgauss_batch(self, time_arr, parameters):
+        sigma = parameters['sigma']
+        mu = parameters['mu']
+        result_arr = self._cos(time_arr, parameters) * np.exp(-(((time_arr-mu)/sigma)**2)/2)
+        return result_arr
 
+    def _doublesingauss_batch(self, time_arr, parameters):
+        sigma = parameters['sigma']
+        mu = parameters['mu']
+        result_arr = self._doublesin(time_arr, parameters) * np.exp(-(((time_arr-mu)/sigma)**2)/2)
+        return result_arr
 
+    def _triplesingauss_batch(self, time_arr, parameters):
+        sigma = parameters['sigma']
+        mu = parameters['mu']
+        result_arr = self._triplesin(time_arr, parameters) * np.exp(-(((time_arr-mu)/sigma)**2)/2)
+        return result_arr
+
+    def _sample_state_table(self, state_table, analog_samples, digital_samples):
+        """ Fills the passed sample arrays with the samples of all states in a state table.
+
+        @param numpy.ndarray state_table: contiguous (part of a) state table as created by
+                                          _build_state_table
+        @param numpy.ndarray analog_samples: float32 array of shape
+                                             (analog channels, number of samples in state_table)
+        @param numpy.ndarray digital_samples: bool array of shape
+                                              (digital channels, number of samples in state_table)
+
+        Constant states (digital channels, 'Idle' and 'DC') are expanded with np.repeat. All short
+        states using the same time dependent function are calculated together with a single call
+        to the according function in self._math_func_batch. Long states are sampled one by one
+        since the batch overhead would exceed the function call overhead. The result is identical
+        to sampling each element on its own with self._math_func.
+
+        The attributes sample_rate, activation_config and amplitude_dict need to be set (see
+        SequenceGeneratorLogic).
+        """
+        if state_table.size == 0:
+            return
+        func_names = list(self._math_func)
+        ana_chnl_names = [chnl for chnl in self.activation_config if 'a_ch' in chnl]
+        lengths = state_table['length_bins']
+        # sample index of the first state in the passed sample arrays
+        first_bin = state_table['start_bin'][0]
+        # states longer than this are not batched but sampled one by one
+        batch_length_limit = 4096
+
+        # digital channels: expand the digital word of each state
+        for i in range(digital_samples.shape[0]):
+            chnl_states = (state_table['digital_word'] >> np.uint64(i)) & np.uint64(1)
+            digital_samples[i] = np.repeat(chnl_states.astype(bool), lengths)
+
+        for i in range(analog_samples.shape[0]):
+            # constant functions: expand the value of each state. All other states are
+            # overwritten below.
+            func_ids = state_table['func_id'][:, i]
+            const_values = np.zeros(state_table.size, dtype='float32')
+            if 'DC' in func_names:
+                dc_states = func_ids == func_names.index('DC')
+                const_values[dc_states] = np.float32(state_table['params'][dc_states, i, 0] /
+                                                     self.amplitude_dict[ana_chnl_names[i]])
+            analog_samples[i] = np.repeat(const_values, lengths)
+
+            # time dependent functions
+            for func_id in np.unique(func_ids):
+                func_name = func_names[func_id]
+                if func_name in ('Idle', 'DC'):
+                    continue
+                param_names = self._func_param_names.get(func_name, [])
+                states = state_table[(func_ids == func_id) & (lengths > 0)]
+                if func_name in self._math_func_batch:
+                    long_states = states[states['length_bins'] > batch_length_limit]
+                    states = states[states['length_bins'] <= batch_length_limit]
+                else:
+                    long_states = states
+                    states = states[:0]
+
+                for state in long_states:
+                    time_arr = (state['offset_bin'] + np.arange(state['length_bins'],
+                                                                 dtype='float64')) / self.sample_rate
+                    parameters = dict(zip(param_names, state['params'][i]))
+                    start = state['start_bin'] - first_bin
+                    analog_samples[i, start:start+state['length_bins']] = np.float32(
+                        self._math_func[func_name](time_arr, parameters) /
+                        self.amplitude_dict[ana_chnl_names[i]])
+
+                if states.size == 0:
+                    continue
+                state_lengths = states['length_bins']
+                # index within the sample arrays and time bin of each sample of the states
+                cum_lengths = np.cumsum(state_lengths) - state_lengths
+                sample_ind = np.arange(np.sum(state_lengths), dtype='int64')
+                time_bins = sample_ind + np.repeat(states['offset_bin'] - cum_lengths,
+                                                   state_lengths)
+                sample_ind += np.repeat(states['start_bin'] - first_bin - cum_lengths,
+                                        state_lengths)
+                time_arr = time_bins.astype('float64') / self.sample_rate
+                del time_bins
+
+                parameters = dict()
+                for j, param in enumerate(param_names):
+                    parameters[param] = np.repeat(states['params'][:, i, j], state_lengths)
+                if func_name in self._math_func_windowed:
+                    # element window of each sample, calculated as in the element-wise functions
+                    first_time = states['offset_bin'].astype('float64') / self.sample_rate
+                    last_time = (states['offset_bin'] + state_lengths - 1).astype(
+                        'float64') / self.sample_rate
+                    mu = (states['offset_bin'] + state_lengths // 2).astype(
+                        'float64') / self.sample_rate
+                    parameters['sigma'] = np.repeat((last_time - first_time) / 6, state_lengths)
+                    parameters['mu'] = np.repeat(mu, state_lengths)
+
+                analog_samples[i, sample_ind] = np.float32(
+                    self._math_func_batch[func_name](time_arr, parameters) /
+                    self.amplitude_dict[ana_chnl_names[i]])
+        return
+
+
+def _sample_state_table_worker(shared_path, shape, state_table, settings):
+    """ Samples a contiguous part of a state table in a worker process.
+
+    @param str shared_path: path of the memory mapped file shared by all workers. It contains the
+                            float32 analog samples of all channels followed by the bool digital
+                            samples of all channels.
+    @param tuple shape: (analog channels, digital channels, number of samples in the shared file,
+                         start_bin of the first sample in the shared file)
+    @param numpy.ndarray state_table: the part of the state table to sample
+    @param tuple settings: (sample_rate, activation_config, amplitude_dict, func_param_names,
+                           func_names). func_names are the names of the functions in the order of
+                           the 'func_id' indices of the state table.
+
+    @return int: number of samples written
+    """
+    ana_channels, dig_channels, number_of_samples, first_bin = shape
+    sampler = SamplingFunctions()
+    sampler.sample_rate, sampler.activation_config, sampler.amplitude_dict, func_param_names, \
+        func_names = settings
+    sampler._func_param_names.update(func_param_names)
+    # the functions are looked up by name, the caller might know more functions than this sampler
+    own_func_names = list(sampler._math_func)
+    if func_names != own_func_names:
+        id_map = np.array([own_func_names.index(func_name) if func_name in own_func_names else -1
+                           for func_name in func_names], dtype='int32')
+        state_table = state_table.copy()
+        state_table['func_id'] = id_map[state_table['func_id']]
+        if np.any(state_table['func_id'] < 0):
+            raise KeyError('Sampling function not available in the worker process.')
+
+    start = int(state_table['start_bin'][0] - first_bin)
+    stop = start + int(np.sum(state_table['length_bins']))
+    if ana_channels > 0:
+        analog_samples = np.memmap(shared_path, dtype='float32', mode='r+',
+                                   shape=(ana_channels, number_of_samples))
+    else:
+        analog_samples = np.empty((0, number_of_samples), dtype='float32')
+    if dig_channels > 0:
+        digital_samples = np.memmap(shared_path, dtype=bool, mode='r+',
+                                    offset=4 * ana_channels * number_of_samples,
+                                    shape=(dig_channels, number_of_samples))
+    else:
+        digital_samples = np.empty((0, number_of_samples), dtype=bool)
+    sampler._sample_state_table(state_table, analog_samples[:, start:stop],
+                                digital_samples[:, start:stop])
+    if isinstance(analog_samples, np.memmap):
+        analog_samples.flush()
+    if isinstance(digital_samples, np.memmap):
+        digital_samples.flush()
+    return stop - start
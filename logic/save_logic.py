@@ -20,13 +20,24 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from cycler import cycler
+from qtpy import QtCore
+import datetime
+import io
+import json
 import logging
+import matplotlib.pyplot as plt
 import os
 import sys
 import inspect
+import threading
 import time
 import numpy as np
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
@@ -120,6 +131,9 @@ class SaveLogic(GenericLogic):
     # declare connectors
     _out = {'savelogic': 'SaveLogic'}
 
+    # emitted with the job number and the success of a job of save_data_async when it is done
+    sigSaveJobFinished = QtCore.Signal(int, bool)
+
     # Matplotlib style definition for saving plots
     mpl_qd_style = {'axes.prop_cycle': cycler('color', ['#1f17f4',
                                                         '#ffa40e',
@@ -194,6 +208,43 @@ class SaveLogic(GenericLogic):
             self.log_into_daily_directory = False
         self._daily_loghandler = None
 
+        # binary file formats supported by save_data and the methods writing them
+        self._binary_save_methods = OrderedDict()
+        self._binary_save_methods['npz'] = self._save_data_as_npz
+        self._binary_save_methods['npz_compressed'] = self._save_data_as_compressed_npz
+        self._binary_save_methods['hdf5'] = self._save_data_as_hdf5
+        self._binary_save_methods['raw'] = self._save_data_as_raw
+        # file format used by save_data if no format is passed to it
+        if 'default_file_format' in config.keys():
+            self.default_file_format = config['default_file_format']
+        else:
+            self.default_file_format = 'text'
+        if self.default_file_format not in self.get_file_formats():
+            self.log.warning('File format "{0}" in configuration is not supported. Falling '
+                             'back to default setting: text.'.format(self.default_file_format))
+            self.default_file_format = 'text'
+        if 'hdf5_compression' in config.keys():
+            self.hdf5_compression = config['hdf5_compression']
+        else:
+            self.hdf5_compression = None
+
+        # worker threads for save_data_async and the maximum number of jobs waiting for them
+        if 'save_workers' in config.keys():
+            self.save_workers = max(int(config['save_workers']), 1)
+        else:
+            self.save_workers = 2
+        if 'max_pending_save_jobs' in config.keys():
+            self.max_pending_save_jobs = max(int(config['max_pending_save_jobs']), 1)
+        else:
+            self.max_pending_save_jobs = 8
+        self._save_executor = None
+        self._save_job_slots = threading.BoundedSemaphore(self.max_pending_save_jobs)
+        self._save_jobs = dict()
+        self._save_job_counter = 0
+        self._save_job_lock = Mutex()
+        # pyplot is not thread safe, so only one worker draws a figure at a time
+        self._figure_lock = Mutex()
+
         # checking for the right configuration
         for key in config.keys():
             self.log.info('{0}: {1}'.format(key, config[key]))
@@ -220,8 +271,14 @@ class SaveLogic(GenericLogic):
             logging.getLogger().addHandler(self._daily_loghandler)
         else:
             self._daily_loghandler = None
+        self._save_executor = ThreadPoolExecutor(max_workers=self.save_workers)
 
     def on_deactivate(self, e=None):
+        # write all data handed over to save_data_async before shutting down
+        if self._save_executor is not None:
+            self.flush_save_jobs()
+            self._save_executor.shutdown(wait=True)
+            self._save_executor = None
         if self._daily_loghandler is not None:
             # removes the log handler logging into the daily directory
             logging.getLogger().removeHandler(self._daily_loghandler)
@@ -243,7 +300,7 @@ class SaveLogic(GenericLogic):
 
     def save_data(self, data, filepath, parameters=None, filename=None,
                   filelabel=None, timestamp=None, as_text=True, as_xml=False,
-                  precision=':.3f', delimiter='\t', plotfig=None):
+                  precision=':.3f', delimiter='\t', plotfig=None, fileformat=None):
         """ General save routine for data.
 
         @param dict or OrderedDict data:
@@ -311,6 +368,24 @@ class SaveLogic(GenericLogic):
         @param string delimiter: optional, insert here the delimiter, like
                                  \n for new line,  \t for tab, , for a
                                  comma, ect.
+        @param str fileformat: optional, the file format of the data file, one of
+                               get_file_formats(). If None, the format given by
+                               'default_file_format' in the config is used
+                               ('text' if not configured):
+
+                                   text: text file <filename>, see below
+                                   npz, npz_compressed: numpy archive
+                                                        <filename>.npz
+                                   hdf5: HDF5 file <filename>.h5 (needs h5py)
+                                   raw: raw binary file <filename>.raw with
+                                        a JSON description <filename>.json,
+                                        see load_raw_data
+
+                               <filename> is the file name without extension.
+                               The binary formats contain the same parameter
+                               header as the text format. Data, which can not
+                               be converted to numeric arrays, is always
+                               saved as text.
 
         This method should be called from the modules and it will call all
         the needed methods for the saving routine. This module guarentees
@@ -355,10 +430,137 @@ class SaveLogic(GenericLogic):
 
         YOU ARE RESPONSIBLE FOR THE IDENTIFIER! DO NOT FORGET THE UNITS FOR THE
         SAVED TIME TRACE/MATRIX.
+
+        @return str: path of the saved data file without extension
+        """
+
+        module_name = self._get_caller_module_name()
+        return self._save_data(data, filepath, module_name, parameters=parameters,
+                               filename=filename, filelabel=filelabel, timestamp=timestamp,
+                               precision=precision, delimiter=delimiter, plotfig=plotfig,
+                               fileformat=fileformat)
+
+    def save_data_async(self, data, filepath, parameters=None, plotfig_function=None,
+                        plotfig_args=(), plotfig_kwargs=None, **kwargs):
+        """ Save data like save_data, but draw the figure and write the files in a worker thread.
+
+        Copies of data, parameters and the arguments of plotfig_function are taken before this
+        method returns, so the caller can go on changing its own data. If max_pending_save_jobs
+        jobs are waiting already, this method blocks until one of them is done.
+
+        @param dict data: the data to save, see save_data
+        @param str filepath: the directory to save the data in, see save_data
+        @param dict parameters: optional, the parameters to save, see save_data
+        @param callable plotfig_function: optional, function returning a matplotlib figure,
+                                          which is saved as thumbnail with the data and closed
+                                          afterwards. It is called in a worker thread with
+                                          plotfig_args and plotfig_kwargs and must not use any
+                                          other data which might change meanwhile.
+        @param tuple plotfig_args: optional, positional arguments of plotfig_function
+        @param dict plotfig_kwargs: optional, keyword arguments of plotfig_function
+        @param kwargs: optional, filename, filelabel, timestamp, precision, delimiter and
+                       fileformat, see save_data
+
+        @return int: number of the job, sigSaveJobFinished is emitted with it when it is done
         """
+        module_name = self._get_caller_module_name()
+        # the file name is based on the time of the call, not of the writing
+        if kwargs.get('timestamp') is None:
+            kwargs['timestamp'] = datetime.datetime.now()
+        kwargs['parameters'] = self._get_snapshot(parameters)
+        kwargs['active_poi_name'] = self.active_poi_name
+        job = (self._get_snapshot(data), filepath, module_name, kwargs, plotfig_function,
+               self._get_snapshot(plotfig_args), self._get_snapshot(plotfig_kwargs))
+
+        # back-pressure: wait for a free slot
+        self._save_job_slots.acquire()
+        with self._save_job_lock:
+            self._save_job_counter += 1
+            job_number = self._save_job_counter
+            if self._save_executor is not None:
+                self._save_jobs[job_number] = self._save_executor.submit(self._run_save_job,
+                                                                         job_number, *job)
+                return job_number
+        # not activated, save in the calling thread
+        self._run_save_job(job_number, *job)
+        return job_number
+
+    def flush_save_jobs(self, timeout=None):
+        """ Wait until all jobs of save_data_async are done.
+
+        @param float timeout: optional, maximum time to wait in seconds
+
+        @return bool: True if all jobs are done, False if the timeout expired
+        """
+        with self._save_job_lock:
+            jobs = list(self._save_jobs.values())
+        not_done = wait(jobs, timeout=timeout).not_done
+        return len(not_done) == 0
+
+    def get_number_of_pending_save_jobs(self):
+        """ Get the number of jobs of save_data_async which are not done yet.
 
+        @return int: number of jobs waiting or being written
+        """
+        with self._save_job_lock:
+            return len(self._save_jobs)
+
+    def _run_save_job(self, job_number, data, filepath, module_name, save_kwargs,
+                      plotfig_function, plotfig_args, plotfig_kwargs):
+        """ Save the data of a job of save_data_async. Runs in a worker thread. """
+        success = False
         try:
-            frm = inspect.stack()[1]    # try to trace back the functioncall to
+            data_basepath = self._save_data(data, filepath, module_name, **save_kwargs)
+            if plotfig_function is not None:
+                if plotfig_kwargs is None:
+                    plotfig_kwargs = dict()
+                with self._figure_lock:
+                    fig = plotfig_function(*plotfig_args, **plotfig_kwargs)
+                    try:
+                        self._save_figure(fig, data_basepath)
+                    finally:
+                        plt.close(fig)
+            success = True
+        except:
+            self.log.exception('Saving the data of job {0} failed.'.format(job_number))
+        finally:
+            with self._save_job_lock:
+                self._save_jobs.pop(job_number, None)
+            self._save_job_slots.release()
+            self.sigSaveJobFinished.emit(job_number, success)
+        return
+
+    @classmethod
+    def _get_snapshot(cls, data):
+        """ Copy data, so it can not be changed by the caller any more.
+
+        @param data: numpy array, dict, list or tuple of those or any immutable object
+
+        @return: the copy, numpy arrays in it are read-only
+        """
+        if isinstance(data, np.ndarray):
+            snapshot = data.copy()
+            snapshot.flags.writeable = False
+            return snapshot
+        if isinstance(data, dict):
+            snapshot = type(data)()
+            for key, value in data.items():
+                snapshot[key] = cls._get_snapshot(value)
+            return snapshot
+        if isinstance(data, list):
+            return [cls._get_snapshot(value) for value in data]
+        if isinstance(data, tuple):
+            return tuple(cls._get_snapshot(value) for value in data)
+        return data
+
+    @staticmethod
+    def _get_caller_module_name():
+        """ Get the name of the module which called the method calling this method.
+
+        @return str: name of the module, 'NaN' if it can not be determined
+        """
+        try:
+            frm = inspect.stack()[2]    # try to trace back the functioncall to
                                         # the class which was calling it.
             mod = inspect.getmodule(frm[0])  # this will get the object, which
                                              # called the save_data function.
@@ -367,21 +569,38 @@ class SaveLogic(GenericLogic):
         except:
             # Sometimes it is not possible to get the object which called the save_data function (such as when calling this from the console).
             module_name = 'NaN'
+        return module_name
+
+    def _save_data(self, data, filepath, module_name, parameters=None, filename=None,
+                   filelabel=None, timestamp=None, precision=':.3f', delimiter='\t',
+                   plotfig=None, fileformat=None, active_poi_name=None):
+        """ Save the data like save_data on behalf of the module module_name.
+
+        @param str module_name: name of the module which saves the data
+        @param str active_poi_name: optional, name of the POI the data was measured at. If None,
+                                    the currently active POI is used.
+
+        For the other parameters see save_data.
+
+        @return str: path of the data file without extension
+        """
+        if active_poi_name is None:
+            active_poi_name = self.active_poi_name
 
         # check whether the given directory path does exist. If not, the
         # file will be saved anyway in the unspecified directory.
 
         if not os.path.exists(filepath):
-            filepath = self.get_daily_directory('UNSPECIFIED_' + str(module_name))
+            filepath = self.get_path_for_module('UNSPECIFIED_' + str(module_name))
             self.log.warning('No Module name specified! Please correct this! '
                     'Data are saved in the \'UNSPECIFIED_<module_name>\' '
                     'folder.')
 
         # Produce a filename tag from the active POI name
-        if self.active_poi_name == '':
+        if active_poi_name == '':
             poi_tag = ''
         else:
-            poi_tag = '_' + self.active_poi_name.replace(" ", "_")
+            poi_tag = '_' + active_poi_name.replace(" ", "_")
 
         # create a unique name for the file, if no name was passed:
         if filename is None:
@@ -399,28 +618,97 @@ class SaveLogic(GenericLogic):
                 else:
                     filename = time.strftime('%Y%m%d-%H%M-%S' + poi_tag + '_' + filelabel + '.dat')
 
-        # open the file
-        textfile = open(os.path.join(filepath, filename), 'w')
+        if fileformat is None:
+            fileformat = self.default_file_format
+        if fileformat != 'text':
+            data_arrays = self._get_data_arrays(data)
+            if fileformat not in self._binary_save_methods:
+                self.log.error('File format "{0}" is not supported by the SaveLogic. The data '
+                               'is saved as text.'.format(fileformat))
+                fileformat = 'text'
+            elif fileformat == 'hdf5' and h5py is None:
+                self.log.warning('Saving data as hdf5 needs the python package h5py, which is '
+                                 'not installed. The data is saved as text.')
+                fileformat = 'text'
+            elif data_arrays is None:
+                self.log.warning('The data can not be converted to numeric arrays and can not '
+                                 'be saved as {0}. The data is saved as text.'.format(fileformat))
+                fileformat = 'text'
+
+        header = self._get_parameter_header(module_name, parameters, delimiter, active_poi_name)
+
+        if fileformat != 'text':
+            self._binary_save_methods[fileformat](data_arrays=data_arrays,
+                                                  filepath=filepath,
+                                                  basename=os.path.splitext(filename)[0],
+                                                  header=header,
+                                                  parameters=parameters,
+                                                  module_name=module_name)
+        else:
+            self._save_data_as_text(data=data, filepath=filepath, filename=filename,
+                                    header=header, parameters=parameters,
+                                    precision=precision, delimiter=delimiter,
+                                    module_name=module_name, active_poi_name=active_poi_name)
+
+        data_basepath = os.path.join(filepath, os.path.splitext(filename)[0])
+
+        # Save thumbnail figure of plot
+        if plotfig is not None:
+            self._save_figure(plotfig, data_basepath)
+        return data_basepath
+
+    @staticmethod
+    def _save_figure(plotfig, data_basepath):
+        """ Save a thumbnail figure of the data as png and pdf file next to the data file.
+
+        @param matplotlib.figure.Figure plotfig: the figure
+        @param str data_basepath: path of the data file without extension
+        """
+        fig_fname_image = data_basepath + '_fig.png'
+        fig_fname_vector = data_basepath + '_fig.pdf'
+        plotfig.savefig(fig_fname_image, bbox_inches='tight', pad_inches=0.05)
+        plotfig.savefig(fig_fname_vector, bbox_inches='tight', pad_inches=0.05)
+        return
+
+    def get_file_formats(self):
+        """ Get the file formats supported by save_data.
+
+        @return list: names of the file formats
+        """
+        return ['text'] + list(self._binary_save_methods)
+
+    def _get_parameter_header(self, module_name, parameters, delimiter, active_poi_name):
+        """ Create the commented header with the parameters, which precedes the data in a text
+        file. For binary file formats it is stored as meta data.
+
+        @param str module_name: name of the module which saves the data
+        @param dict parameters: the parameters to save, can be None
+        @param str delimiter: delimiter between the parameter names and values
+        @param str active_poi_name: name of the POI the data was measured at, can be empty
+
+        @return str: the header, every line starts with '#'
+        """
+        header_lines = []
 
         # write the paramters if specified:
-        textfile.write('# Saved Data from the class ' + module_name + ' on '
-                       + time.strftime('%d.%m.%Y at %Hh%Mm%Ss.\n')
-                       )
-        textfile.write('#\n')
-        textfile.write('# Parameters:\n')
-        textfile.write('# ===========\n')
-        textfile.write('#\n')
+        header_lines.append('# Saved Data from the class ' + module_name + ' on '
+                            + time.strftime('%d.%m.%Y at %Hh%Mm%Ss.\n')
+                            )
+        header_lines.append('#\n')
+        header_lines.append('# Parameters:\n')
+        header_lines.append('# ===========\n')
+        header_lines.append('#\n')
 
         # Include the active POI name (if not empty) as a parameter in the header
-        if self.active_poi_name != '':
-            textfile.write('# Measured at POI: ' + self.active_poi_name + '\n')
+        if active_poi_name != '':
+            header_lines.append('# Measured at POI: ' + active_poi_name + '\n')
 
         if parameters is not None:
 
             # check whether the format for the parameters have a dict type:
-            if type(parameters) is dict or OrderedDict:
+            if isinstance(parameters, dict):
                 for entry in parameters:
-                    textfile.write('# ' + str(entry) + ':' + delimiter + str(parameters[entry]) + '\n')
+                    header_lines.append('# ' + str(entry) + ':' + delimiter + str(parameters[entry]) + '\n')
 
             # make a hardcore string convertion and try to save the
             # parameters directly:
@@ -428,9 +716,53 @@ class SaveLogic(GenericLogic):
                 self.log.error('The parameters are not passed as a dictionary! '
                         'The SaveLogic will try to save the parameters '
                         'directly.')
-                textfile.write('# not specified parameters: ' + str(parameters) + '\n')
+                header_lines.append('# not specified parameters: ' + str(parameters) + '\n')
+
+        header_lines.append('#\n')
+        return ''.join(header_lines)
 
-        textfile.write('#\n')
+    @staticmethod
+    def _get_data_arrays(data):
+        """ Convert the data passed to save_data to numeric numpy arrays.
+
+        @param dict data: the data passed to save_data
+
+        @return OrderedDict: the data as numpy arrays or None if an entry is not numeric
+        """
+        data_arrays = OrderedDict()
+        for key in data:
+            try:
+                array = np.asarray(data[key])
+            except ValueError:
+                return None
+            if array.dtype.kind not in 'biufc':
+                return None
+            data_arrays[str(key)] = array
+        return data_arrays
+
+    @staticmethod
+    def _to_json(parameters):
+        """ Convert parameters to a JSON string. Values unknown to JSON (e.g. numpy types) are
+        converted to lists or strings.
+
+        @param dict parameters: the parameters, can be None
+
+        @return str: the JSON representation
+        """
+        def _convert(value):
+            if hasattr(value, 'tolist'):
+                return value.tolist()
+            return str(value)
+        if parameters is not None and not isinstance(parameters, dict):
+            parameters = str(parameters)
+        return json.dumps(parameters, default=_convert, indent=1)
+
+    def _save_data_as_text(self, data, filepath, filename, header, parameters, precision,
+                           delimiter, module_name, active_poi_name):
+        """ Save the data as text file <filename> with the parameter header. """
+        # open the file
+        textfile = open(os.path.join(filepath, filename), 'w')
+        textfile.write(header)
         textfile.write('# Data:\n')
         textfile.write('# =====\n')
         # check the input data:
@@ -469,7 +801,7 @@ class SaveLogic(GenericLogic):
                 self.log.warning('Savelogic has no implementation for 4 '
                         'dimensional arrays. The data is saved in a '
                         'raw fashion.')
-                textfile.write(+str(data[key_name]))
+                textfile.write(str(data[key_name]))
 
         else:
             key_list = list(data)
@@ -495,21 +827,151 @@ class SaveLogic(GenericLogic):
                 # That is an recursive procedure:
 
                 for entry in key_list:
-                    self.save_data(data={entry: data[entry]},
-                                   filepath=filepath,
-                                   parameters=parameters,
-                                   filename=filename[:-4] + '_' + entry + '.dat',
-                                   as_text=True, as_xml=False,
-                                   precision=precision, delimiter=delimiter)
+                    self._save_data(data={entry: data[entry]},
+                                    filepath=filepath,
+                                    module_name=module_name,
+                                    parameters=parameters,
+                                    filename=filename[:-4] + '_' + entry + '.dat',
+                                    fileformat='text',
+                                    precision=precision, delimiter=delimiter,
+                                    active_poi_name=active_poi_name)
 
         textfile.close()
 
-        # Save thumbnail figure of plot
-        if plotfig is not None:
-            fig_fname_image = os.path.join(filepath, filename)[:-4] + '_fig.png'
-            fig_fname_vector = os.path.join(filepath, filename)[:-4] + '_fig.pdf'
-            plotfig.savefig(fig_fname_image, bbox_inches='tight', pad_inches=0.05)
-            plotfig.savefig(fig_fname_vector, bbox_inches='tight', pad_inches=0.05)
+    def _save_data_as_npz(self, data_arrays, filepath, basename, header, parameters,
+                          module_name, compressed=False):
+        """ Save the data arrays as numpy archive <basename>.npz.
+
+        The archive contains every data array under its name as well as the text header under
+        '_header' and the parameters as JSON string under '_parameters'. Load it with numpy.load.
+        """
+        archive = OrderedDict()
+        archive['_header'] = np.array(header)
+        archive['_parameters'] = np.array(self._to_json(parameters))
+        archive.update(data_arrays)
+        save_method = np.savez_compressed if compressed else np.savez
+        with open(os.path.join(filepath, basename + '.npz'), 'wb') as npzfile:
+            save_method(npzfile, **archive)
+        return
+
+    def _save_data_as_compressed_npz(self, **kwargs):
+        """ Save the data arrays as compressed numpy archive <basename>.npz. """
+        return self._save_data_as_npz(compressed=True, **kwargs)
+
+    def _save_data_as_hdf5(self, data_arrays, filepath, basename, header, parameters,
+                           module_name):
+        """ Save the data arrays as datasets of the HDF5 file <basename>.h5.
+
+        The text header and the parameters are stored as attributes of the root group.
+        Parameters which can not be stored as attribute are converted to strings.
+        """
+        with h5py.File(os.path.join(filepath, basename + '.h5'), 'w') as h5file:
+            h5file.attrs['header'] = header
+            h5file.attrs['module'] = module_name
+            if isinstance(parameters, dict):
+                for key, value in parameters.items():
+                    try:
+                        h5file.attrs[str(key)] = value
+                    except (TypeError, ValueError):
+                        h5file.attrs[str(key)] = str(value)
+            for key, array in data_arrays.items():
+                # '/' would create a subgroup
+                h5file.create_dataset(key.replace('/', '|'), data=array,
+                                      compression=self.hdf5_compression)
+        return
+
+    def _save_data_as_raw(self, data_arrays, filepath, basename, header, parameters,
+                          module_name):
+        """ Save the data arrays as raw binary file <basename>.raw with the JSON file
+        <basename>.json next to it.
+
+        The arrays are written one after the other in C order, each starting at a multiple of
+        64 bytes. The JSON file contains the header, the parameters and the name, data type,
+        shape and byte offset of every array, so the arrays can be memory mapped
+        (see load_raw_data).
+        """
+        arrays_info = []
+        with open(os.path.join(filepath, basename + '.raw'), 'wb') as rawfile:
+            for key, array in data_arrays.items():
+                offset = -(-rawfile.tell() // 64) * 64
+                rawfile.write(b'\x00' * (offset - rawfile.tell()))
+                rawfile.write(np.ascontiguousarray(array).tobytes())
+                arrays_info.append(OrderedDict([('name', key),
+                                                ('dtype', array.dtype.str),
+                                                ('shape', list(array.shape)),
+                                                ('offset', offset)]))
+        sidecar = OrderedDict()
+        sidecar['module'] = module_name
+        sidecar['header'] = header
+        sidecar['parameters'] = json.loads(self._to_json(parameters), object_pairs_hook=OrderedDict)
+        sidecar['data_file'] = basename + '.raw'
+        sidecar['arrays'] = arrays_info
+        with open(os.path.join(filepath, basename + '.json'), 'w') as jsonfile:
+            json.dump(sidecar, jsonfile, indent=1)
+        return
+
+    @staticmethod
+    def load_raw_data(filepath):
+        """ Load data saved in the raw file format.
+
+        @param str filepath: path of the .json or the .raw file
+
+        @return (OrderedDict, OrderedDict): the data arrays (read-only memory maps) by name and
+                                            the content of the JSON file
+        """
+        with open(os.path.splitext(filepath)[0] + '.json', 'r') as jsonfile:
+            sidecar = json.load(jsonfile, object_pairs_hook=OrderedDict)
+        rawpath = os.path.join(os.path.dirname(filepath), sidecar['data_file'])
+        data = OrderedDict()
+        for info in sidecar['arrays']:
+            if np.prod(info['shape']) == 0:
+                data[info['name']] = np.empty(info['shape'], dtype=info['dtype'])
+            else:
+                data[info['name']] = np.memmap(rawpath, dtype=info['dtype'], mode='r',
+                                               offset=info['offset'],
+                                               shape=tuple(info['shape']))
+        return data, sidecar
+
+    @staticmethod
+    def _get_numeric_array(trace_data, precision):
+        """ Check whether data can be written with the vectorized text writer.
+
+        @param trace_data: the data to write
+        @param str precision: format specification like ':.3f'
+
+        @return (numpy.ndarray, str): the data as numeric array and the printf-style format
+                                      equivalent to precision. (None, None) if the data is not
+                                      numeric or the format has no printf-style equivalent.
+        """
+        try:
+            array = np.asarray(trace_data)
+        except ValueError:
+            return None, None
+        if array.dtype.kind not in 'biuf' or array.size == 0:
+            return None, None
+        number_format = '%' + precision.lstrip(':')
+        # make sure the printf-style format gives exactly the same result
+        sample = array.flat[0]
+        try:
+            if number_format % sample != str('{0' + precision + '}').format(sample):
+                return None, None
+        except (ValueError, TypeError):
+            return None, None
+        return array, number_format
+
+    @staticmethod
+    def _write_array_as_text(opened_file, array, row_format):
+        """ Write a 1D or 2D numeric array to an opened text file, one row per line.
+
+        @param file opened_file: file opened in text mode
+        @param numpy.ndarray array: the data
+        @param str row_format: printf-style format of a whole row (without newline)
+        """
+        # numpy.savetxt writes bytes in older numpy versions, so it writes to a buffer first
+        buffer = io.BytesIO()
+        np.savetxt(buffer, array, fmt=row_format, newline='\n')
+        opened_file.write(buffer.getvalue().decode('utf-8'))
+        return
 
     def save_1d_trace_as_text(self, trace_data, trace_name, opened_file=None,
                               filepath=None, filename=None, precision=':.3f'):
@@ -521,18 +983,22 @@ class SaveLogic(GenericLogic):
         close_file_flag = False
 
         if opened_file is None:
-            opened_file = open(os.path.join(filepath, filename + '.dat'), 'wb')
+            opened_file = open(os.path.join(filepath, filename + '.dat'), 'w')
             close_file_flag = True
 
         opened_file.write('# ' + str(trace_name) + '\n')
 
-        for entry in trace_data:
-            # If entry is a string, then print directly
-            if isinstance(entry, str):
-                opened_file.write(entry + '\n')
-            # Otherwise, format number to requested precision
-            else:
-                opened_file.write(str('{0' + precision + '}\n').format(entry))
+        array, number_format = self._get_numeric_array(trace_data, precision)
+        if array is not None and array.ndim == 1:
+            self._write_array_as_text(opened_file, array, number_format)
+        else:
+            for entry in trace_data:
+                # If entry is a string, then print directly
+                if isinstance(entry, str):
+                    opened_file.write(entry + '\n')
+                # Otherwise, format number to requested precision
+                else:
+                    opened_file.write(str('{0' + precision + '}\n').format(entry))
 
         if close_file_flag:
             opened_file.close()
@@ -548,7 +1014,7 @@ class SaveLogic(GenericLogic):
         close_file_flag = False
 
         if opened_file is None:
-            opened_file = open(os.path.join(filepath, filename + '.dat'), 'wb')
+            opened_file = open(os.path.join(filepath, filename + '.dat'), 'w')
             close_file_flag = True
 
         if trace_name is not None:
@@ -557,23 +1023,29 @@ class SaveLogic(GenericLogic):
                 opened_file.write(name + delimiter)
             opened_file.write('\n')
 
-        max_trace_length = max(np.shape(trace_data))
-
-        for row in range(max_trace_length):
-            for column in trace_data:
-                try:
-                    # TODO: Lachlan has inserted the if-else in here,
-                    # but it should be properly integrated with the try
-
-                    # If entry is a string, then print directly
-                    if isinstance(column[row], str):
-                        opened_file.write(str('{0}' + delimiter).format(column[row]))
-                    # Otherwise, format number to requested precision
-                    else:
-                        opened_file.write(str('{0' + precision + '}' + delimiter).format(column[row]))
-                except:
-                    opened_file.write(str('{0}' + delimiter).format('NaN'))
-            opened_file.write('\n')
+        # traces of equal length can be written at once, one trace per column
+        array, number_format = self._get_numeric_array(trace_data, precision)
+        if array is not None and array.ndim == 2 and '%' not in delimiter:
+            self._write_array_as_text(opened_file, array.transpose(),
+                                      (number_format + delimiter) * array.shape[0])
+        else:
+            max_trace_length = max(len(trace) for trace in trace_data)
+
+            for row in range(max_trace_length):
+                for column in trace_data:
+                    try:
+                        # TODO: Lachlan has inserted the if-else in here,
+                        # but it should be properly integrated with the try
+
+                        # If entry is a string, then print directly
+                        if isinstance(column[row], str):
+                            opened_file.write(str('{0}' + delimiter).format(column[row]))
+                        # Otherwise, format number to requested precision
+                        else:
+                            opened_file.write(str('{0' + precision + '}' + delimiter).format(column[row]))
+                    except:
+                        opened_file.write(str('{0}' + delimiter).format('NaN'))
+                opened_file.write('\n')
 
         if close_file_flag:
             opened_file.close()
@@ -589,7 +1061,7 @@ class SaveLogic(GenericLogic):
         close_file_flag = False
 
         if opened_file is None:
-            opened_file = open(os.path.join(filepath, filename + '.dat'), 'wb')
+            opened_file = open(os.path.join(filepath, filename + '.dat'), 'w')
             close_file_flag = True
 
         # write the trace names:
@@ -599,13 +1071,18 @@ class SaveLogic(GenericLogic):
                 opened_file.write(name + delimiter)
             opened_file.write('\n')
 
-        for row in trace_data:
-            for entry in row:
-                if units.is_number(entry):
-                    opened_file.write(str('{0' + precision + '}' + delimiter).format(entry))
-                else:
-                    opened_file.write(str(entry).encode('utf-8'))
-            opened_file.write('\n')
+        array, number_format = self._get_numeric_array(trace_data, precision)
+        if array is not None and array.ndim == 2 and '%' not in delimiter:
+            self._write_array_as_text(opened_file, array,
+                                      (number_format + delimiter) * array.shape[1])
+        else:
+            for row in trace_data:
+                for entry in row:
+                    if units.is_number(entry):
+                        opened_file.write(str('{0' + precision + '}' + delimiter).format(entry))
+                    else:
+                        opened_file.write(str(entry))
+                opened_file.write('\n')
 
         if close_file_flag:
             opened_file.close()
@@ -28,6 +28,12 @@ from qtpy import QtCore
 from collections import OrderedDict
 import inspect
 import importlib
+import multiprocessing
+try:
+    from math import gcd
+except ImportError:
+    # Python < 3.5
+    from fractions import gcd
 
 from logic.pulse_objects import PulseBlockElement
 from logic.pulse_objects import PulseBlock
@@ -35,7 +41,9 @@ from logic.pulse_objects import PulseBlockEnsemble
 from logic.pulse_objects import PulseSequence
 from logic.generic_logic import GenericLogic
 from logic.sampling_functions import SamplingFunctions
+from logic.sampling_functions import _sample_state_table_worker
 from logic.samples_write_methods import SamplesWriteMethods
+from logic.waveform_cache import WaveformCache
 
 
 class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethods):
@@ -69,6 +77,7 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
     sigSequenceDictUpdated = QtCore.Signal(dict)
     sigSampleEnsembleComplete = QtCore.Signal(str)
     sigSampleSequenceComplete = QtCore.Signal(str)
+    sigSampledFilesWritten = QtCore.Signal(list)
     sigCurrentBlockUpdated = QtCore.Signal(object)
     sigCurrentEnsembleUpdated = QtCore.Signal(object)
     sigCurrentSequenceUpdated = QtCore.Signal(object)
@@ -129,6 +138,48 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
         self.waveform_dir = self._get_dir_for_name('sampled_hardware_files')
         self.temp_dir = self._get_dir_for_name('temporary_files')
 
+        # Number of worker processes for parallel sampling. Values < 2 disable parallel sampling.
+        # Only ensembles (or chunks) with at least parallel_sampling_min_bins samples are sampled
+        # in parallel.
+        if 'sampling_workers' in config.keys():
+            self.sampling_workers = int(config['sampling_workers'])
+        else:
+            self.sampling_workers = 0
+        self.parallel_sampling_min_bins = 2**20
+        self._sampling_pool = None
+
+        # The block segments of the last sampled files for each ensemble name (incl. name tag).
+        # Used to resample only the changed blocks of an ensemble.
+        self._sampled_segments = dict()
+
+        # Maximum number of samples per chunk if an ensemble is written chunkwise to file
+        if 'chunk_length_bins' in config.keys():
+            self.chunk_length_bins = int(config['chunk_length_bins'])
+        else:
+            self.chunk_length_bins = 2**24
+
+        # Write the wfm, wfmx and fpga files through memory maps of the preallocated files
+        # instead of appending each chunk to the files. Can be disabled with the config option
+        # 'memmap_writers'.
+        if 'memmap_writers' in config.keys():
+            self.use_memmap_writers = bool(config['memmap_writers'])
+        else:
+            self.use_memmap_writers = True
+        if self.use_memmap_writers:
+            self._write_to_file.update(self._write_to_file_memmap)
+
+        # On-disk cache for sampled waveform files. Set the maximum cache size in bytes with the
+        # config option 'waveform_cache_size'. A size of 0 disables the cache.
+        if 'waveform_cache_size' in config.keys():
+            waveform_cache_size = int(config['waveform_cache_size'])
+        else:
+            waveform_cache_size = 2*1024**3
+        if waveform_cache_size > 0:
+            self.waveform_cache = WaveformCache(self._get_dir_for_name('waveform_cache'),
+                                                waveform_cache_size)
+        else:
+            self.waveform_cache = None
+
         # Information on used channel configuration for sequence generation
         # IMPORTANT: THIS CONFIG DOES NOT REPRESENT THE ACTUAL SETTINGS ON THE HARDWARE
         self.analog_channels = 2
@@ -192,6 +243,7 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
         self._statusVariables['sample_rate'] = self.sample_rate
         self._statusVariables['waveform_format'] = self.waveform_format
         self._statusVariables['sequence_format'] = self.sequence_format
+        self._close_sampling_pool()
 
     def _attach_predefined_methods(self):
         """
@@ -662,6 +714,362 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
         number_of_states = len(state_length_bins_arr)
         return number_of_samples, number_of_elements, number_of_states, state_length_bins_arr
 
+    def _build_state_table(self, ensemble, offset_bin=0):
+        """ Creates a compact table of all states (elements including all repetitions) of a
+        PulseBlockEnsemble.
+
+        @param PulseBlockEnsemble ensemble: the ensemble to analyze
+        @param int offset_bin: time bin offset of the first state (rotating frame)
+
+        @return tuple: (state_table, offset_bin)
+                        state_table:
+                            numpy structured array with one entry per state and the fields
+                            'start_bin' (index of the first sample within the ensemble),
+                            'length_bins', 'offset_bin' (time bin offset of the first sample),
+                            'func_id' (index in self._math_func for each analog channel),
+                            'params' (parameter vector for each analog channel in the order of
+                            self._func_param_names) and 'digital_word' (bit i represents the i-th
+                            digital channel).
+                        offset_bin:
+                            integer, which is used for maintaining the rotation frame.
+        """
+        func_names = list(self._math_func)
+        # register the parameter names of functions without a known parameter set
+        for block, reps in ensemble.block_list:
+            for block_element in block.element_list:
+                for i, func_name in enumerate(block_element.pulse_function):
+                    if func_name not in self._func_param_names:
+                        self._func_param_names[func_name] = sorted(block_element.parameters[i])
+        max_params = max([len(self._func_param_names.get(func, [])) for func in func_names])
+        ana_channels = ensemble.analog_channels
+
+        table_list = []
+        for block, reps in ensemble.block_list:
+            num_elements = len(block.element_list)
+            if num_elements == 0:
+                continue
+            # gather the properties of all elements of the block once
+            init_length_s = np.zeros(num_elements, dtype='float64')
+            increment_s = np.zeros(num_elements, dtype='float64')
+            func_id = np.zeros((num_elements, ana_channels), dtype='int32')
+            params = np.zeros((num_elements, ana_channels, max_params), dtype='float64')
+            digital_word = np.zeros(num_elements, dtype='uint64')
+            for elem_ind, block_element in enumerate(block.element_list):
+                init_length_s[elem_ind] = block_element.init_length_s
+                increment_s[elem_ind] = block_element.increment_s
+                for i, func_name in enumerate(block_element.pulse_function):
+                    func_id[elem_ind, i] = func_names.index(func_name)
+                    for j, param in enumerate(self._func_param_names[func_name]):
+                        params[elem_ind, i, j] = block_element.parameters[i][param]
+                for i, state in enumerate(block_element.digital_high):
+                    if state:
+                        digital_word[elem_ind] |= np.uint64(1 << i)
+
+            # expand the elements for all repetitions of the block
+            block_table = np.zeros((reps + 1) * num_elements, dtype=self._state_table_dtype(
+                ana_channels, max_params))
+            rep_no = np.arange(reps + 1)
+            element_length_s = init_length_s + (rep_no[:, np.newaxis] * increment_s)
+            block_table['length_bins'] = np.rint(element_length_s * self.sample_rate).ravel()
+            block_table['func_id'] = np.tile(func_id, (reps + 1, 1))
+            block_table['params'] = np.tile(params, (reps + 1, 1, 1))
+            block_table['digital_word'] = np.tile(digital_word, reps + 1)
+            table_list.append(block_table)
+
+        if len(table_list) == 0:
+            state_table = np.zeros(0, dtype=self._state_table_dtype(ana_channels, max_params))
+        else:
+            state_table = np.concatenate(table_list)
+        # absolute sample index and the time bin offset (rotating frame) of each state
+        end_bins = np.cumsum(state_table['length_bins'])
+        state_table['start_bin'] = end_bins - state_table['length_bins']
+        if ensemble.rotating_frame:
+            state_table['offset_bin'] = state_table['start_bin'] + offset_bin
+            if state_table.size > 0:
+                offset_bin += int(end_bins[-1])
+        else:
+            state_table['offset_bin'] = offset_bin
+        return state_table, offset_bin
+
+    @staticmethod
+    def _state_table_dtype(ana_channels, max_params):
+        """ The numpy dtype of the state table created by _build_state_table. """
+        return np.dtype([('start_bin', 'int64'),
+                         ('length_bins', 'int64'),
+                         ('offset_bin', 'int64'),
+                         ('func_id', 'int32', (ana_channels,)),
+                         ('params', 'float64', (ana_channels, max_params)),
+                         ('digital_word', 'uint64')])
+
+    def _get_waveform_cache_key(self, state_table):
+        """ Calculates the key of the sampled files in the waveform cache.
+
+        @param numpy.ndarray state_table: state table as created by _build_state_table
+
+        @return str: hash of the state table and all generator settings affecting the files
+        """
+        return WaveformCache.get_key(state_table, self._get_sampling_settings())
+
+    def _get_sampling_settings(self):
+        """ All generator settings which affect the content of sampled files.
+
+        @return tuple: (sampling function names, waveform format, sample rate, activation config,
+                        amplitudes of the active analog channels)
+        """
+        ana_chnl_names = [chnl for chnl in self.activation_config if 'a_ch' in chnl]
+        amplitudes = [float(self.amplitude_dict[chnl]) for chnl in ana_chnl_names]
+        return (list(self._math_func), self.waveform_format, float(self.sample_rate),
+                list(self.activation_config), amplitudes)
+
+    def _get_segment_keys(self, ensemble, state_table):
+        """ Splits a state table into one segment per block (incl. repetitions) of the ensemble.
+
+        @param PulseBlockEnsemble ensemble: the ensemble the state table was built from
+        @param numpy.ndarray state_table: state table as created by _build_state_table
+
+        @return list: list of tuples (start_row, stop_row, key) for each block of the ensemble.
+                      The key is a hash of the segment states including their position and, if
+                      any time dependent function is used, their rotating frame time offset.
+        """
+        func_names = list(self._math_func)
+        const_func_ids = [func_names.index(func) for func in ('Idle', 'DC') if func in func_names]
+        segment_keys = []
+        start_row = 0
+        for block, reps in ensemble.block_list:
+            stop_row = start_row + (reps + 1) * len(block.element_list)
+            segment = state_table[start_row:stop_row].copy()
+            if all(func_id in const_func_ids for func_id in np.unique(segment['func_id'])):
+                segment['offset_bin'] = 0
+            segment_keys.append((start_row, stop_row, WaveformCache.get_key(segment)))
+            start_row = stop_row
+        return segment_keys
+
+    def _record_sampled_segments(self, ensemble, name_tag, state_table, created_files):
+        """ Remember the block segments of sampled files to allow resampling only changed blocks.
+
+        @param PulseBlockEnsemble ensemble: the sampled ensemble
+        @param str name_tag: name tag the files were sampled with
+        @param numpy.ndarray state_table: state table the files were sampled from
+        @param list created_files: names of the sampled files
+
+        The files are complete at this point, so they are announced by sigSampledFilesWritten
+        to allow their upload while the sampling of a sequence goes on.
+        """
+        if not isinstance(created_files, list) or len(created_files) == 0:
+            self._sampled_segments.pop(ensemble.name + name_tag, None)
+            return
+        self.sigSampledFilesWritten.emit(list(created_files))
+        record = dict()
+        record['settings'] = self._get_sampling_settings()
+        record['number_of_samples'] = int(np.sum(state_table['length_bins']))
+        record['files'] = list(created_files)
+        record['segments'] = self._get_segment_keys(ensemble, state_table)
+        self._sampled_segments[ensemble.name + name_tag] = record
+        return
+
+    def _patch_sampled_ensemble(self, ensemble, name_tag, state_table):
+        """ Resample only the blocks which have changed since the last sampling of an ensemble
+        and overwrite them in the existing files.
+
+        @param PulseBlockEnsemble ensemble: the ensemble to sample
+        @param str name_tag: name tag to sample the files with
+        @param numpy.ndarray state_table: state table as created by _build_state_table
+
+        @return list: names of the patched files or None if the files need to be sampled as a
+                      whole (no previous sampling, changed settings or waveform length, ...)
+
+        Blocks are resampled if their definition changed or if their position or rotating frame
+        phase shifted due to changes in preceding blocks.
+        """
+        name = ensemble.name + name_tag
+        record = self._sampled_segments.get(name)
+        number_of_samples = int(np.sum(state_table['length_bins']))
+        if record is None or self.waveform_format not in self._patch_file:
+            return None
+        if record['settings'] != self._get_sampling_settings():
+            return None
+        if record['number_of_samples'] != number_of_samples:
+            return None
+        if not all(os.path.isfile(os.path.join(self.waveform_dir, f)) for f in record['files']):
+            return None
+        segment_keys = self._get_segment_keys(ensemble, state_table)
+        if len(segment_keys) != len(record['segments']):
+            return None
+        changed_segments = [new for new, old in zip(segment_keys, record['segments'])
+                            if new != old]
+        if len(changed_segments) == len(segment_keys) and len(segment_keys) > 1:
+            # nothing to gain, sample as a whole
+            return None
+
+        for start_row, stop_row, key in changed_segments:
+            segment_table = state_table[start_row:stop_row]
+            segment_length_bins = int(np.sum(segment_table['length_bins']))
+            if segment_length_bins == 0:
+                continue
+            analog_samples = np.empty([ensemble.analog_channels, segment_length_bins],
+                                      dtype='float32')
+            digital_samples = np.empty([ensemble.digital_channels, segment_length_bins],
+                                       dtype=bool)
+            self._sample_state_table_parallel(segment_table, analog_samples, digital_samples)
+            patched_files = self._patch_file[self.waveform_format](
+                name, analog_samples, digital_samples, number_of_samples,
+                int(segment_table['start_bin'][0]))
+            if not isinstance(patched_files, list):
+                self._sampled_segments.pop(name, None)
+                return None
+        self.log.info('Resampled {0:d} of {1:d} blocks of PulseBlockEnsemble "{2}".'
+                      ''.format(len(changed_segments), len(segment_keys), name))
+        return list(record['files'])
+
+    def get_waveform_cache_statistics(self):
+        """ Get the hit/miss statistics of the waveform cache.
+
+        @return dict: cache statistics (see WaveformCache.get_statistics) or empty dict if the
+                      cache is disabled
+        """
+        if self.waveform_cache is None:
+            return dict()
+        return self.waveform_cache.get_statistics()
+
+    def clear_waveform_cache(self):
+        """ Delete all files from the waveform cache. """
+        if self.waveform_cache is not None:
+            self.waveform_cache.clear()
+        return
+
+    def _functions_known_to_workers(self, state_table):
+        """ Checks if the worker processes sample all functions used in a state table like this
+        module. The workers only know the built-in functions of SamplingFunctions, while
+        _math_func of this module might be extended or modified at runtime.
+
+        @param numpy.ndarray state_table: state table as created by _build_state_table
+
+        @return bool: True if all used functions are built-in sampling functions
+        """
+        func_names = list(self._math_func)
+        builtin = SamplingFunctions()
+        for func_id in np.unique(state_table['func_id']):
+            func_name = func_names[func_id]
+            for own_funcs, builtin_funcs in ((self._math_func, builtin._math_func),
+                                             (self._math_func_batch, builtin._math_func_batch)):
+                if (func_name in own_funcs) != (func_name in builtin_funcs):
+                    return False
+                if func_name in own_funcs and (getattr(own_funcs[func_name], '__func__', None)
+                                               is not getattr(builtin_funcs[func_name],
+                                                              '__func__', None)):
+                    return False
+        return True
+
+    def _sample_state_table_parallel(self, state_table, analog_samples, digital_samples):
+        """ Fills the passed sample arrays with the samples of all states in a state table using
+        a pool of worker processes.
+
+        @param numpy.ndarray state_table: contiguous (part of a) state table as created by
+                                          _build_state_table
+        @param numpy.ndarray analog_samples: float32 array of shape
+                                             (analog channels, number of samples in state_table)
+        @param numpy.ndarray digital_samples: bool array of shape
+                                              (digital channels, number of samples in state_table)
+
+        The state table is split into contiguous ranges of states, which are sampled by the
+        workers into a memory mapped file in temp_dir shared by all processes. Since every state
+        carries its own time bin offset, the rotating frame is preserved exactly.
+        Falls back to sampling in this process if parallel sampling is disabled
+        (sampling_workers < 2), the number of samples is too small to benefit from it or the
+        state table uses sampling functions unknown to the workers.
+        """
+        number_of_samples = int(np.sum(state_table['length_bins']))
+        if (self.sampling_workers < 2 or number_of_samples < self.parallel_sampling_min_bins
+                or not self._functions_known_to_workers(state_table)):
+            self._sample_state_table(state_table, analog_samples, digital_samples)
+            return
+
+        ana_channels = analog_samples.shape[0]
+        dig_channels = digital_samples.shape[0]
+        shared_path = os.path.join(self.temp_dir, 'shared_samples_{0}.tmp'.format(os.getpid()))
+        with open(shared_path, 'wb') as shared_file:
+            shared_file.truncate((4 * ana_channels + dig_channels) * number_of_samples)
+
+        # split the table into contiguous ranges of states, several per worker to balance the load
+        chunk_length_bins = max(number_of_samples // (4 * self.sampling_workers), 1)
+        chunk_list = self._get_state_chunks(state_table, chunk_length_bins)
+        shape = (ana_channels, dig_channels, number_of_samples, int(state_table['start_bin'][0]))
+        settings = (self.sample_rate, list(self.activation_config), dict(self.amplitude_dict),
+                    dict(self._func_param_names), list(self._math_func))
+        task_list = [(shared_path, shape, state_table[chunk], settings) for chunk in chunk_list]
+        try:
+            if self._sampling_pool is None:
+                self._sampling_pool = multiprocessing.get_context('spawn').Pool(
+                    processes=self.sampling_workers)
+            self._sampling_pool.starmap(_sample_state_table_worker, task_list)
+        except Exception as e:
+            self.log.error('Parallel sampling failed. Sampling in a single process instead.\n'
+                           '{0}'.format(e))
+            self._close_sampling_pool()
+            os.remove(shared_path)
+            self._sample_state_table(state_table, analog_samples, digital_samples)
+            return
+
+        # assemble the results from the shared file
+        if ana_channels > 0:
+            shared_samples = np.memmap(shared_path, dtype='float32', mode='r',
+                                       shape=(ana_channels, number_of_samples))
+            analog_samples[:] = shared_samples
+            del shared_samples
+        if dig_channels > 0:
+            shared_samples = np.memmap(shared_path, dtype=bool, mode='r',
+                                       offset=4 * ana_channels * number_of_samples,
+                                       shape=(dig_channels, number_of_samples))
+            digital_samples[:] = shared_samples
+            del shared_samples
+        os.remove(shared_path)
+        return
+
+    def set_sampling_workers(self, workers):
+        """ Set the number of worker processes used for parallel sampling.
+
+        @param int workers: number of worker processes. Values < 2 disable parallel sampling.
+
+        @return int: the number of worker processes set
+        """
+        if workers != self.sampling_workers:
+            self._close_sampling_pool()
+            self.sampling_workers = max(int(workers), 0)
+        return self.sampling_workers
+
+    def _close_sampling_pool(self):
+        """ Shut down the worker processes used for parallel sampling. """
+        if self._sampling_pool is not None:
+            self._sampling_pool.terminate()
+            self._sampling_pool.join()
+            self._sampling_pool = None
+        return
+
+    def _get_state_chunks(self, state_table, chunk_length_bins=None):
+        """ Splits a state table into contiguous chunks of states for chunkwise writing.
+
+        @param numpy.ndarray state_table: state table as created by _build_state_table
+        @param int chunk_length_bins: optional, maximum number of samples per chunk. Defaults to
+                                      self.chunk_length_bins.
+
+        @return list: list of slice objects. Each chunk contains at least one state and not more
+                      than chunk_length_bins samples unless a single state is longer.
+        """
+        if chunk_length_bins is None:
+            chunk_length_bins = self.chunk_length_bins
+        if state_table.size == 0:
+            return [slice(0, 0)]
+        end_bins = state_table['start_bin'] + state_table['length_bins']
+        chunk_list = []
+        start_ind = 0
+        while start_ind < state_table.size:
+            chunk_limit = state_table['start_bin'][start_ind] + chunk_length_bins
+            stop_ind = np.searchsorted(end_bins, chunk_limit, side='right')
+            stop_ind = max(stop_ind, start_ind + 1)
+            chunk_list.append(slice(start_ind, stop_ind))
+            start_ind = stop_ind
+        return chunk_list
+
     def sample_pulse_block_ensemble(self, ensemble_name, write_to_file=True, chunkwise=True,
                                     offset_bin=0, name_tag=''):
         """ General sampling of a PulseBlockEnsemble object, which serves as the construction plan.
@@ -694,22 +1102,31 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
 
         This method is creating the actual samples (voltages and logic states) for each time step
         of the analog and digital channels specified in the PulseBlockEnsemble.
-        Therefore it iterates through all blocks, repetitions and elements of the ensemble and
-        calculates the exact voltages (float64) according to the specified math_function. The
-        samples are later on stored inside a float32 array.
-        So each element is calculated with high precision (float64) and then down-converted to
-        float32 to be stored.
+        Therefore it first builds a table of all states (elements incl. repetitions) of the
+        ensemble in one pass (see _build_state_table). Afterwards all states using the same
+        math_function are sampled together with batched numpy operations (see
+        _sample_state_table). With parallel sampling enabled (config option 'sampling_workers'),
+        contiguous ranges of states are sampled by a pool of worker processes (see
+        _sample_state_table_parallel). The voltages are calculated with high precision (float64) and then
+        down-converted to float32 to be stored.
 
         To preserve the rotating frame, an offset counter is used to indicate the absolute time
         within the ensemble. All calculations are done with time bins (dtype=int) to avoid rounding
-        errors. Only in the last step when a single PulseBlockElement object is sampled  these
-        integer bin values are translated into a floating point time.
-
-        The chunkwise write mode is used to save memory usage at the expense of time. Here for each
-        PulseBlockElement the write_to_file method in the HW module is called to avoid large
-        arrays inside the memory. In other words: The whole sample arrays are never created at any
-        time. This results in more function calls and general overhead causing the much longer time
+        errors. Only in the last step when the states are sampled these integer bin values are
+        translated into a floating point time.
+
+        The chunkwise write mode is used to save memory usage at the expense of time. Here the
+        states are split into contiguous chunks of at most self.chunk_length_bins samples and the
+        write_to_file method is called for each chunk to avoid large arrays inside the memory. In
+        other words: The whole sample arrays are never created at any time. This results in more
+        function calls and general overhead causing the longer time
         to complete.
+
+        When writing to file, previously sampled files are reused if possible: Files sampled
+        before with identical settings are restored from the waveform cache. If an ensemble with
+        the same name and length was sampled before, only the blocks which have changed (or whose
+        position or rotating frame phase shifted) are resampled and patched into the existing
+        files.
         """
         # lock module if it's not already locked (sequence sampling in progress)
         if self.getState() == 'idle':
@@ -717,26 +1134,12 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
             sequence_sampling_in_progress = False
         else:
             sequence_sampling_in_progress = True
-        # check for old files associated with the new ensemble and delete them from host PC
-        if write_to_file:
-            # get sampled filenames on host PC referring to the same ensemble
-            filename_list = [f for f in os.listdir(self.waveform_dir) if
-                             f.startswith(ensemble_name + '_ch')]
-            # delete all filenames in the list
-            for file in filename_list:
-                os.remove(os.path.join(self.waveform_dir, file))
-
-            if len(filename_list) != 0:
-                self.log.info('Found old sampled ensembles for name "{0}". Files deleted before '
-                              'sampling: {1}'.format(ensemble_name, filename_list))
-
         start_time = time.time()
         # get ensemble
         ensemble = self.saved_pulse_block_ensembles[ensemble_name]
         # Ensemble parameters to determine the shape of sample arrays
         ana_channels = ensemble.analog_channels
         dig_channels = ensemble.digital_channels
-        ana_chnl_names = [chnl for chnl in self.activation_config if 'a_ch' in chnl]
         if self.digital_channels != dig_channels or self.analog_channels != ana_channels:
             self.log.error('Sampling of PulseBlockEnsemble "{0}" failed!\nMismatch in number of '
                            'analog and digital channels between logic ({1}, {2}) and '
@@ -745,76 +1148,114 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
                                      ana_channels, dig_channels))
             return [], [], [''], 0
 
-        number_of_samples, number_of_elements, number_of_states, state_length_bins_arr = self._analyze_block_ensemble(ensemble)
-        # The time bin offset for each element to be sampled to preserve rotating frame.
+        # Create the table of all states (elements incl. repetitions) to sample. The offset_bin
+        # returned is the time bin offset after the last element to preserve the rotating frame.
+        state_table, offset_bin = self._build_state_table(ensemble, offset_bin)
+        number_of_samples = int(np.sum(state_table['length_bins']))
+
+        # Reuse the files from the waveform cache if the same ensemble was sampled before with
+        # identical settings.
+        if write_to_file and self.waveform_cache is not None:
+            cache_key = self._get_waveform_cache_key(state_table)
+            created_files = self.waveform_cache.restore(cache_key, ensemble.name + name_tag,
+                                                        self.waveform_dir)
+            if created_files is not None:
+                self.log.info('PulseBlockEnsemble "{0}" restored from waveform cache: {1}\n'
+                              'Cache statistics: {2}'
+                              ''.format(ensemble.name + name_tag, created_files,
+                                        self.waveform_cache.get_statistics()))
+                # announce the files before the completion like after sampling them
+                self._record_sampled_segments(ensemble, name_tag, state_table, created_files)
+                if not sequence_sampling_in_progress:
+                    self.unlock()
+                    self.sigSampleEnsembleComplete.emit(ensemble_name)
+                return [], [], created_files, offset_bin
+
+        # If the ensemble was sampled before under the same name, only resample the blocks which
+        # have changed and patch the existing files in place.
+        if write_to_file:
+            created_files = self._patch_sampled_ensemble(ensemble, name_tag, state_table)
+            if created_files is not None:
+                self.log.info('Time needed for resampling the changed blocks of '
+                              'PulseBlockEnsemble "{0}": {1} sec'
+                              ''.format(ensemble.name + name_tag,
+                                        int(np.rint(time.time() - start_time))))
+                if self.waveform_cache is not None:
+                    self.waveform_cache.store(cache_key, ensemble.name + name_tag, created_files,
+                                              self.waveform_dir)
+                self._record_sampled_segments(ensemble, name_tag, state_table, created_files)
+                if not sequence_sampling_in_progress:
+                    self.unlock()
+                    self.sigSampleEnsembleComplete.emit(ensemble_name)
+                return [], [], created_files, offset_bin
+
+        # check for old files associated with the new ensemble and delete them from host PC
+        if write_to_file:
+            # get sampled filenames on host PC referring to the same ensemble. Files are always
+            # deleted before sampling since they might be hard linked into the waveform cache.
+            filename_list = [f for f in os.listdir(self.waveform_dir) if
+                             f.startswith(ensemble.name + name_tag + '_ch') or
+                             f == ensemble.name + name_tag + '.fpga']
+            # delete all filenames in the list
+            for file in filename_list:
+                os.remove(os.path.join(self.waveform_dir, file))
+
+            if len(filename_list) != 0:
+                self.log.info('Found old sampled ensembles for name "{0}". Files deleted before '
+                              'sampling: {1}'.format(ensemble.name + name_tag, filename_list))
+
+        # Purely digital formats are written directly from the run-length encoded states in the
+        # state table. The digital channels are never sampled.
+        if (write_to_file and ana_channels == 0 and
+                self.waveform_format in self._write_states_to_file):
+            if chunkwise:
+                chunk_list = self._get_state_chunks(state_table)
+            else:
+                chunk_list = [slice(0, state_table.size)]
+            created_files = []
+            for chunk_index, chunk in enumerate(chunk_list):
+                chunk_files = self._write_states_to_file[self.waveform_format](
+                    ensemble.name + name_tag, state_table['digital_word'][chunk],
+                    state_table['length_bins'][chunk], number_of_samples, chunk_index == 0,
+                    chunk_index == len(chunk_list) - 1)
+                if isinstance(chunk_files, list):
+                    created_files.extend([f for f in chunk_files if f not in created_files])
+            self.log.info('Time needed for writing PulseBlockEnsemble to file from its states: '
+                          '{0} sec'.format(int(np.rint(time.time() - start_time))))
+            if self.waveform_cache is not None:
+                self.waveform_cache.store(cache_key, ensemble.name + name_tag, created_files,
+                                          self.waveform_dir)
+            self._record_sampled_segments(ensemble, name_tag, state_table, created_files)
+            if not sequence_sampling_in_progress:
+                self.unlock()
+                self.sigSampleEnsembleComplete.emit(ensemble_name)
+            return [], [], created_files, offset_bin
+
         if chunkwise and write_to_file:
-            # Flags and counter for chunkwise writing
-            is_first_chunk = True
-            is_last_chunk = False
-            element_count = 0
+            # Sample and write contiguous chunks of states to reduce memory usage.
+            chunk_list = self._get_state_chunks(state_table)
+            created_files = []
+            for chunk_index, chunk in enumerate(chunk_list):
+                chunk_table = state_table[chunk]
+                chunk_length_bins = int(np.sum(chunk_table['length_bins']))
+                # allocate temporary sample arrays to contain the current chunk
+                analog_samples = np.empty([ana_channels, chunk_length_bins], dtype='float32')
+                digital_samples = np.empty([dig_channels, chunk_length_bins], dtype=bool)
+                # actually fill the allocated sample arrays with values.
+                self._sample_state_table_parallel(chunk_table, analog_samples, digital_samples)
+                # write temporary sample array to file
+                chunk_files = self._write_to_file[self.waveform_format](
+                    ensemble.name + name_tag, analog_samples, digital_samples,
+                    number_of_samples, chunk_index == 0, chunk_index == len(chunk_list) - 1)
+                # some formats report the created files only for the first chunk
+                if isinstance(chunk_files, list):
+                    created_files.extend([f for f in chunk_files if f not in created_files])
         else:
             # Allocate huge sample arrays if chunkwise writing is disabled.
-            analog_samples = np.empty([ana_channels, number_of_samples], dtype = 'float32')
-            digital_samples = np.empty([dig_channels, number_of_samples], dtype = bool)
-            # Starting index for the sample array entrys
-            entry_ind = 0
-
-        # Iterate over all blocks within the PulseBlockEnsemble object
-        for block, reps in ensemble.block_list:
-            # Iterate over all repertitions of the current block
-            for rep_no in range(reps+1):
-                # Iterate over the Block_Elements inside the current block
-                for elem_ind, block_element in enumerate(block.element_list):
-                    parameters = block_element.parameters
-                    init_length_s = block_element.init_length_s
-                    increment_s = block_element.increment_s
-                    digital_high = block_element.digital_high
-                    pulse_function = block_element.pulse_function
-                    element_length_s = init_length_s + (rep_no*increment_s)
-                    element_length_bins = int(np.rint(element_length_s * self.sample_rate))
-
-                    # create floating point time array for the current element inside rotating frame
-                    time_arr = (offset_bin + np.arange(element_length_bins, dtype='float64')) / self.sample_rate
-
-                    if chunkwise and write_to_file:
-                        # determine it the current element is the last one to be sampled.
-                        # Toggle the is_last_chunk flag accordingly.
-                        element_count += 1
-                        if element_count == number_of_elements:
-                            is_last_chunk = True
-
-                        # allocate temporary sample arrays to contain the current element
-                        analog_samples = np.empty([ana_channels, element_length_bins], dtype='float32')
-                        digital_samples = np.empty([dig_channels, element_length_bins], dtype=bool)
-
-                        # actually fill the allocated sample arrays with values.
-                        for i, state in enumerate(digital_high):
-                            digital_samples[i] = np.full(element_length_bins, state, dtype=bool)
-                        for i, func_name in enumerate(pulse_function):
-                            analog_samples[i] = np.float32(self._math_func[func_name](time_arr, parameters[i])/self.amplitude_dict[ana_chnl_names[i]])
-
-                        # write temporary sample array to file
-                        created_files = self._write_to_file[self.waveform_format](
-                            ensemble.name + name_tag, analog_samples, digital_samples,
-                            number_of_samples, is_first_chunk, is_last_chunk)
-                        # set flag to FALSE after first write
-                        is_first_chunk = False
-                    else:
-                        # if the ensemble should be sampled as a whole (chunkwise = False) fill the
-                        # entries in the huge sample arrays
-                        for i, state in enumerate(digital_high):
-                            digital_samples[i, entry_ind:entry_ind+element_length_bins] = np.full(element_length_bins, state, dtype=bool)
-                        for i, func_name in enumerate(pulse_function):
-                            analog_samples[i, entry_ind:entry_ind+element_length_bins] = np.float32(self._math_func[func_name](time_arr, parameters[i])/self.amplitude_dict[ana_chnl_names[i]])
-
-                        # increment the index offset of the overall sample array for the next
-                        # element
-                        entry_ind += element_length_bins
-
-                    # if the rotating frame should be preserved (default) increment the offset
-                    # counter for the time array.
-                    if ensemble.rotating_frame:
-                        offset_bin += element_length_bins
+            analog_samples = np.empty([ana_channels, number_of_samples], dtype='float32')
+            digital_samples = np.empty([dig_channels, number_of_samples], dtype=bool)
+            self._sample_state_table_parallel(state_table, analog_samples, digital_samples)
+            created_files = []
 
         if not write_to_file:
             # return a status message with the time needed for sampling the entire ensemble as a
@@ -831,6 +1272,10 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
             # chunkwise.
             self.log.info('Time needed for sampling and writing to file chunkwise: {0} sec'
                           ''.format(int(np.rint(time.time()-start_time))))
+            if self.waveform_cache is not None:
+                self.waveform_cache.store(cache_key, ensemble.name + name_tag, created_files,
+                                          self.waveform_dir)
+            self._record_sampled_segments(ensemble, name_tag, state_table, created_files)
             if not sequence_sampling_in_progress:
                 self.unlock()
                 self.sigSampleEnsembleComplete.emit(ensemble_name)
@@ -849,11 +1294,47 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
             # a whole.
             self.log.info('Time needed for sampling and writing PulseBlockEnsemble to file as a '
                           'whole: {0} sec'.format(int(np.rint(time.time()-start_time))))
+            if self.waveform_cache is not None:
+                self.waveform_cache.store(cache_key, ensemble.name + name_tag, created_files,
+                                          self.waveform_dir)
+            self._record_sampled_segments(ensemble, name_tag, state_table, created_files)
             if not sequence_sampling_in_progress:
                 self.unlock()
                 self.sigSampleEnsembleComplete.emit(ensemble_name)
             return [], [], created_files, offset_bin
 
+    def _get_common_period_bins(self, sequence_obj):
+        """ Calculates the common period in bins of all analog frequencies used in a sequence.
+
+        @param PulseSequence sequence_obj: the sequence to analyze
+
+        @return int: smallest number of bins after which all analog waveforms of the sequence have
+                     the same phase again. None if there is no such period, i.e. if a frequency
+                     or the sample rate is no integer number of Hz.
+
+        Shifting the time axis of a waveform by a multiple of this period does not change it.
+        Waveforms without any frequency (Idle, DC) have a period of 1 bin.
+        """
+        sample_rate = int(np.rint(self.sample_rate))
+        if abs(self.sample_rate - sample_rate) > 1e-6:
+            return None
+        period_bins = 1
+        for ensemble_obj, seq_param in sequence_obj.ensemble_param_list:
+            for block, reps in ensemble_obj.block_list:
+                for element in block.element_list:
+                    for parameters in element.parameters:
+                        for param_name, value in parameters.items():
+                            if not param_name.startswith('frequency'):
+                                continue
+                            frequency = int(np.rint(value))
+                            if abs(value - frequency) > 1e-6:
+                                return None
+                            # frequency * period / sample_rate must be an integer
+                            element_period = sample_rate // gcd(frequency, sample_rate)
+                            period_bins = period_bins * element_period // gcd(period_bins,
+                                                                              element_period)
+        return period_bins
+
     def sample_pulse_sequence(self, sequence_name, write_to_file=True, chunkwise=True):
         """ Samples the PulseSequence object, which serves as the construction plan.
 
@@ -876,6 +1357,10 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
         staying in the rotating frame) and the other which samples without keep a phase
         relationship between the different entries of the PulseSequence object.
 
+        In the rotating frame an entry reuses the sampled files of a previous entry of the same
+        ensemble if their offset_bin differs by a multiple of the common period of all analog
+        frequencies (see _get_common_period_bins), i.e. if both have the same phase.
+
         More sophisticated sequence sampling method can be implemented here.
         """
         # lock module
@@ -909,29 +1394,42 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
         # will be created in general with a different offset_bin. Therefore, in order to keep track
         # of the sampled Pulse_Block_Ensembles one has to introduce a running number as an
         # additional name tag, so keep the sampled files separate.
+        # Entries of the same ensemble whose offset_bin differs by a multiple of the common period
+        # of all analog frequencies have the same phase and can reuse the sampled file(s).
         if sequence_obj.rotating_frame:
             ensemble_index = 0  # that will indicate the ensemble index
             offset_bin = 0      # that will be used for phase preserving
+            period_bins = self._get_common_period_bins(sequence_obj)
+            # The sampled files and the offset_bin increment for each ensemble name and phase
+            phase_dict = dict()
             for ensemble_obj, seq_param in sequence_obj.ensemble_param_list:
                 # to make something like 001
                 name_tag = '_' + str(ensemble_index).zfill(3)
 
-                dummy1, \
-                dummy2, \
-                created_files, \
-                offset_bin_return = self.sample_pulse_block_ensemble(ensemble_obj.name,
-                                                                     write_to_file,
-                                                                     chunkwise,
-                                                                     offset_bin=offset_bin,
-                                                                     name_tag=name_tag)
+                if period_bins is not None:
+                    phase_key = (ensemble_obj.name, offset_bin % period_bins)
+                else:
+                    phase_key = (ensemble_obj.name, offset_bin)
+                if phase_key in phase_dict:
+                    created_files, offset_increment = phase_dict[phase_key]
+                    offset_bin_return = offset_bin + offset_increment
+                else:
+                    dummy1, \
+                    dummy2, \
+                    created_files, \
+                    offset_bin_return = self.sample_pulse_block_ensemble(ensemble_obj.name,
+                                                                         write_to_file,
+                                                                         chunkwise,
+                                                                         offset_bin=offset_bin,
+                                                                         name_tag=name_tag)
+                    phase_dict[phase_key] = (created_files, offset_bin_return - offset_bin)
+                    # relate the created_files to a name identifier. Maybe this information will
+                    # be needed later on about that sequence object
+                    sampled_ensembles[ensemble_obj.name + name_tag] = created_files
 
                 # the temp_dict is a format how the sequence parameter will be saved
                 temp_dict = dict()
                 temp_dict['name'] = created_files
-
-                # relate the created_files to a name identifier. Maybe this information will be
-                # needed later on about that sequence object
-                sampled_ensembles[ensemble_obj.name + name_tag] = created_files
                 # update the sequence parameter to the temp dict:
                 temp_dict.update(seq_param)
                 # add the whole dict to the list of dicts, containing information about how to
@@ -942,6 +1440,11 @@ class SequenceGeneratorLogic(GenericLogic, SamplingFunctions, SamplesWriteMethod
                 # phase preserving.
                 offset_bin = offset_bin_return
                 ensemble_index += 1
+            self.log.info('Sampled {0} of {1} entries of PulseSequence "{2}" in the rotating '
+                          'frame. All other entries reuse the sampled files of an entry with the '
+                          'same phase.'.format(len(sampled_ensembles),
+                                               len(sequence_obj.ensemble_param_list),
+                                               sequence_name))
         else:
             # if phase prevervation between the sequence entries is not needed, then only the
             # different ensembles will be sampled, since the offset_bin does not matter for them:
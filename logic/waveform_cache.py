@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains the Qudi on-disk cache for sampled hardware waveform files.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WaveformCache:
+    """
+    Content-addressed cache of sampled waveform files (e.g. *.wfmx, *.wfm, *.fpga).
+
+    Each cache entry is addressed by a key which is a stable hash of everything the sampled files
+    depend on (see get_key). The files of an entry are stored in the cache directory as
+    <key><suffix>, where the suffix is the file name without the asset name (e.g. '_ch1.wfmx').
+    Files are hard linked into and out of the cache whenever possible, so a cache hit does not
+    copy any data. Therefore sampled files must never be modified in place but always be deleted
+    before they are written again.
+
+    If the total size of all cached files exceeds max_size_bytes, the least recently used entries
+    are evicted.
+    """
+    def __init__(self, cache_dir, max_size_bytes=2*1024**3):
+        """
+        @param str cache_dir: directory to store the cached files in
+        @param int max_size_bytes: maximum total size of all cached files in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The cache entries in least recently used order (oldest first). The keys are the cache
+        # keys and the items are dicts with the file suffixes and the total size of the entry.
+        self._index = OrderedDict()
+        self._index_path = os.path.join(self.cache_dir, 'cache_index.pkl')
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(os.path.abspath(self.cache_dir))
+        self._load_index()
+
+    @staticmethod
+    def get_key(*args):
+        """ Calculate a stable hash of the passed arguments.
+
+        @param args: numpy arrays, bytes or objects with a stable repr (str, int, float, list, ...)
+
+        @return str: hexadecimal SHA-1 digest of all arguments
+        """
+        hasher = hashlib.sha1()
+        for arg in args:
+            if hasattr(arg, 'tobytes'):
+                hasher.update(arg.tobytes())
+            elif isinstance(arg, bytes):
+                hasher.update(arg)
+            else:
+                hasher.update(repr(arg).encode('UTF-8'))
+            # separator to avoid ambiguous concatenations
+            hasher.update(b'\x00')
+        return hasher.hexdigest()
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def restore(self, key, name, target_dir):
+        """ Recreate the cached files for key in target_dir with the asset name "name".
+
+        @param str key: cache key
+        @param str name: asset name, the file names are <name><suffix>
+        @param str target_dir: directory to create the files in
+
+        @return list: names of the created files or None if there is no valid cache entry
+        """
+        if key not in self._index:
+            self.misses += 1
+            return None
+        entry = self._index[key]
+        cached_paths = [os.path.join(self.cache_dir, key + suffix) for suffix in entry['files']]
+        if not all(os.path.isfile(path) for path in cached_paths):
+            # entry got corrupted (e.g. files deleted by hand)
+            self._remove_entry(key)
+            self._save_index()
+            self.misses += 1
+            return None
+
+        created_files = []
+        for suffix, cached_path in zip(entry['files'], cached_paths):
+            filename = name + suffix
+            target_path = os.path.join(target_dir, filename)
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            self._link_or_copy(cached_path, target_path)
+            created_files.append(filename)
+        # mark entry as most recently used
+        self._index.move_to_end(key)
+        self._save_index()
+        self.hits += 1
+        return created_files
+
+    def store(self, key, name, created_files, source_dir):
+        """ Add sampled files to the cache.
+
+        @param str key: cache key
+        @param str name: asset name the files were created with
+        @param list created_files: names of the files created by sampling
+        @param str source_dir: directory containing the created files
+        """
+        if not isinstance(created_files, list) or len(created_files) == 0:
+            return
+        if not all(f.startswith(name) for f in created_files):
+            return
+        if key in self._index:
+            self._remove_entry(key)
+        suffixes = [f[len(name):] for f in created_files]
+        size = 0
+        for filename, suffix in zip(created_files, suffixes):
+            cached_path = os.path.join(self.cache_dir, key + suffix)
+            self._link_or_copy(os.path.join(source_dir, filename), cached_path)
+            size += os.path.getsize(cached_path)
+        self._index[key] = {'files': suffixes, 'size': size}
+        self._evict()
+        self._save_index()
+        return
+
+    def clear(self):
+        """ Remove all entries from the cache and reset the statistics. """
+        for key in list(self._index):
+            self._remove_entry(key)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._save_index()
+        return
+
+    def get_size(self):
+        """ Total size of all cached files in bytes. """
+        return sum(entry['size'] for entry in self._index.values())
+
+    def get_statistics(self):
+        """ Get the hit/miss statistics of the cache.
+
+        @return dict: with the keys 'hits', 'misses', 'evictions', 'hit_rate', 'entries',
+                      'size_bytes' and 'max_size_bytes'
+        """
+        requests = self.hits + self.misses
+        stats = dict()
+        stats['hits'] = self.hits
+        stats['misses'] = self.misses
+        stats['evictions'] = self.evictions
+        stats['hit_rate'] = self.hits / requests if requests > 0 else 0.0
+        stats['entries'] = len(self._index)
+        stats['size_bytes'] = self.get_size()
+        stats['max_size_bytes'] = self.max_size_bytes
+        return stats
+
+    def _evict(self):
+        """ Remove least recently used entries until the cache size is within limits. """
+        size = self.get_size()
+        while size > self.max_size_bytes and len(self._index) > 0:
+            key = next(iter(self._index))
+            size -= self._index[key]['size']
+            self._remove_entry(key)
+            self.evictions += 1
+        return
+
+    def _remove_entry(self, key):
+        entry = self._index.pop(key)
+        for suffix in entry['files']:
+            path = os.path.join(self.cache_dir, key + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        return
+
+    @staticmethod
+    def _link_or_copy(source_path, target_path):
+        """ Hard link a file if the file system supports it. Copy it otherwise. """
+        try:
+            os.link(source_path, target_path)
+        except (OSError, AttributeError):
+            shutil.copyfile(source_path, target_path)
+        return
+
+    def _load_index(self):
+        if not os.path.isfile(self._index_path):
+            return
+        try:
+            with open(self._index_path, 'rb') as infile:
+                self._index = pickle.load(infile)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning('Index of the waveform cache in "{0}" could not be read, the cache '
+                           'starts empty: {1}'.format(self.cache_dir, e))
+            self._index = OrderedDict()
+        return
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            pickle.dump(self._index, outfile)
+        # os.replace also overwrites an existing file on Windows
+        os.replace(tmp_path, self._index_path)
+        return
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains tests of the FTP transfer manager with a stand-in for the FTP connections.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from core.util.ftp_transfer import FtpTransferManager
+
+
+class StandInServer:
+    """ Records the files stored over the stand-in connections. """
+
+    def __init__(self, failures=0):
+        """
+        @param int failures: number of stored files failing before the first success
+        """
+        self.lock = threading.Lock()
+        self.failures = failures
+        self.connections = 0
+        self.stored = []
+        # cleared to stall the transfers
+        self.running = threading.Event()
+        self.running.set()
+
+    def connect(self):
+        with self.lock:
+            self.connections += 1
+        return StandInConnection(self)
+
+
+class StandInConnection:
+    """ Offers the methods of ftplib.FTP used by the transfer manager. """
+
+    def __init__(self, server):
+        self.server = server
+
+    def storbinary(self, command, upload_file, blocksize):
+        self.server.running.wait()
+        with self.server.lock:
+            if self.server.failures > 0:
+                self.server.failures -= 1
+                raise EOFError('Connection lost.')
+            self.server.stored.append((command[len('STOR '):], upload_file.read()))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestFtpTransferManager(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        filepath = os.path.join(self.directory, name)
+        with open(filepath, 'wb') as file:
+            file.write(content)
+        return filepath
+
+    def test_same_version_is_transferred_once(self):
+        server = StandInServer()
+        manager = FtpTransferManager('awg', connect=server.connect)
+        filepath = self.write_file('wave_ch1.wfmx', b'abc')
+        names = manager.upload([filepath])
+        self.assertEqual(manager.wait(names, timeout=5), dict())
+        manager.upload([filepath])
+        self.assertEqual(manager.wait(names, timeout=5), dict())
+        self.assertEqual(server.stored, [('wave_ch1.wfmx', b'abc')])
+
+        # a forgotten file is transferred again
+        manager.forget(names)
+        manager.upload([filepath])
+        self.assertEqual(manager.wait(names, timeout=5), dict())
+        self.assertTrue(manager.close(timeout=5))
+        self.assertEqual(len(server.stored), 2)
+        self.assertEqual(manager.get_statistics()['files'], 2)
+
+    def test_failed_transfer_is_retried_over_new_connection(self):
+        server = StandInServer(failures=1)
+        manager = FtpTransferManager('awg', number_of_connections=1, connect=server.connect)
+        names = manager.upload([self.write_file('wave_ch1.wfmx', b'abc')])
+        self.assertEqual(manager.wait(names, timeout=5), dict())
+        self.assertTrue(manager.close(timeout=5))
+        self.assertEqual(server.stored, [('wave_ch1.wfmx', b'abc')])
+        self.assertEqual(server.connections, 2)
+
+    def test_errors_are_reported_by_wait(self):
+        server = StandInServer(failures=2)
+        manager = FtpTransferManager('awg', number_of_connections=1, connect=server.connect)
+        names = manager.upload([self.write_file('wave_ch1.wfmx', b'abc'),
+                                os.path.join(self.directory, 'missing.wfmx')])
+        errors = manager.wait(names, timeout=5)
+        self.assertTrue(manager.close(timeout=5))
+        self.assertEqual(sorted(errors), ['missing.wfmx', 'wave_ch1.wfmx'])
+        self.assertIsInstance(errors['wave_ch1.wfmx'], EOFError)
+        self.assertIsInstance(errors['missing.wfmx'], FileNotFoundError)
+        self.assertEqual(server.stored, [])
+
+    def test_wait_and_close_time_out_on_stalled_transfer(self):
+        server = StandInServer()
+        server.running.clear()
+        manager = FtpTransferManager('awg', number_of_connections=1, connect=server.connect)
+        names = manager.upload([self.write_file('wave_ch1.wfmx', b'abc')])
+        errors = manager.wait(names, timeout=0.1)
+        self.assertIsInstance(errors['wave_ch1.wfmx'], TimeoutError)
+        self.assertFalse(manager.close(timeout=0.1))
+
+        # the transfer finishes as soon as the server continues
+        server.running.set()
+        self.assertEqual(manager.wait(names, timeout=5), dict())
+        self.assertEqual(server.stored, [('wave_ch1.wfmx', b'abc')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains tests of the laser pulse extraction from ungated timetraces.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import unittest
+
+import numpy as np
+
+from logic.pulse_extraction_logic import PulseExtractionLogic
+
+
+class TestEdgeDetectionExtraction(unittest.TestCase):
+
+    number_of_lasers = 20
+    period = 3000
+    laser_length = 1000
+
+    def setUp(self):
+        self.extraction = PulseExtractionLogic(manager=None, name='pulse_extraction', config={})
+
+    def make_timetrace(self, weak_amplitude):
+        """ Poisson distributed timetrace with every second laser pulse scaled by weak_amplitude.
+        The mean counts are 1 between the pulses and 20 in a strong pulse. """
+        random = np.random.RandomState(0)
+        rate = np.full(self.number_of_lasers * self.period, 1.0)
+        for laser_index in range(self.number_of_lasers):
+            start = laser_index * self.period + self.period // 5
+            amplitude = weak_amplitude if laser_index % 2 else 1.0
+            rate[start:start + self.laser_length] = 20 * amplitude
+        return random.poisson(rate)
+
+    def check_pulses(self, weak_amplitude):
+        laser_arr = self.extraction.ungated_extraction_edge_detection(
+            self.make_timetrace(weak_amplitude), 10, self.number_of_lasers)
+        self.assertEqual(laser_arr.shape[0], self.number_of_lasers)
+        # every extracted pulse starts at a laser pulse, so its counts are those of the pulse
+        pulse_means = np.mean(laser_arr[:, :self.laser_length // 2], axis=1)
+        np.testing.assert_allclose(pulse_means[0::2], 20, rtol=0.1)
+        np.testing.assert_allclose(pulse_means[1::2], 20 * weak_amplitude, rtol=0.2)
+
+    def test_equal_pulses(self):
+        self.check_pulses(1.0)
+
+    def test_weak_pulses_next_to_strong_ones(self):
+        self.check_pulses(0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
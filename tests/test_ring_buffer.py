@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains tests of the ring buffer and the running median.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import unittest
+
+import numpy as np
+
+from core.util.ring_buffer import RingBuffer, RunningMedian
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_trace_is_copied_once_per_change(self):
+        ring_buffer = RingBuffer(4)
+        ring_buffer.extend([1., 2., 3.])
+        trace = ring_buffer.get_trace()
+        np.testing.assert_array_equal(trace, [0., 1., 2., 3.])
+        self.assertIs(ring_buffer.get_trace(), trace)
+        self.assertFalse(trace.flags.writeable)
+
+        ring_buffer.append(4.)
+        np.testing.assert_array_equal(ring_buffer.get_trace(), [1., 2., 3., 4.])
+        np.testing.assert_array_equal(trace, [0., 1., 2., 3.])
+        ring_buffer.set_last(2, 0.)
+        np.testing.assert_array_equal(ring_buffer.get_trace(), [1., 2., 0., 0.])
+
+
+class TestRunningMedian(unittest.TestCase):
+
+    def test_median_equals_numpy_median(self):
+        random = np.random.RandomState(0)
+        values = random.normal(size=200)
+        for window_length in (1, 4, 7):
+            running_median = RunningMedian(window_length)
+            for index, value in enumerate(values):
+                window = np.concatenate((np.zeros(window_length), values[:index + 1]))
+                self.assertEqual(running_median.update(value),
+                                 np.median(window[-window_length:]))
+
+    def test_non_finite_values_are_ignored(self):
+        running_median = RunningMedian(3)
+        for value in (1., 2., 3.):
+            running_median.update(value)
+        self.assertEqual(running_median.update(np.nan), 2.)
+        self.assertEqual(running_median.update(np.inf), 2.)
+        self.assertEqual(running_median.update(4.), 3.)
+        self.assertEqual(running_median.update(5.), 4.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains tests of the wfmx-file write methods for pulse generator waveforms.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from logic.samples_write_methods import SamplesWriteMethods
+
+
+class TestWfmxWriteMethods(unittest.TestCase):
+
+    number_of_samples = 1000
+    chunk_length = 300
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = SamplesWriteMethods()
+        self.writer.waveform_dir = os.path.join(self.directory, 'waveforms')
+        self.writer.temp_dir = os.path.join(self.directory, 'temp')
+        os.mkdir(self.writer.waveform_dir)
+        os.mkdir(self.writer.temp_dir)
+        self.writer.sample_rate = 25e9
+
+        random = np.random.RandomState(0)
+        self.analog_samples = random.uniform(-1, 1, (2, self.number_of_samples)).astype('float32')
+        self.digital_samples = random.uniform(0, 1, (4, self.number_of_samples)) > 0.5
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, write_method, name, analog_samples, digital_samples):
+        """ Write the samples in chunks and return the contents of the files by name. """
+        created_files = []
+        for start in range(0, self.number_of_samples, self.chunk_length):
+            stop = min(start + self.chunk_length, self.number_of_samples)
+            created_files += write_method(name, analog_samples[:, start:stop],
+                                          digital_samples[:, start:stop],
+                                          self.number_of_samples, start == 0,
+                                          stop == self.number_of_samples)
+        contents = dict()
+        for filename in created_files:
+            with open(os.path.join(self.writer.waveform_dir, filename), 'rb') as file:
+                contents[filename[len(name):]] = file.read()
+        return contents
+
+    def digital_samples_of(self, activation_config):
+        digi_indices = [int(chnl.split('ch')[-1]) - 1 for chnl in activation_config
+                        if 'd_ch' in chnl]
+        return self.digital_samples[digi_indices]
+
+    def test_memmap_files_equal_stock_files(self):
+        for activation_config in (['a_ch1', 'a_ch2'],
+                                  ['a_ch1', 'd_ch1', 'd_ch2', 'a_ch2'],
+                                  ['a_ch1', 'd_ch2', 'a_ch2']):
+            self.writer.activation_config = activation_config
+            digital_samples = self.digital_samples_of(activation_config)
+            stock = self.write(self.writer._write_wfmx, 'stock', self.analog_samples,
+                               digital_samples)
+            memmap = self.write(self.writer._write_wfmx_memmap, 'memmap', self.analog_samples,
+                                digital_samples)
+            self.assertEqual(stock, memmap)
+
+    def check_patch(self, activation_config):
+        self.writer.activation_config = activation_config
+        digital_samples = self.digital_samples_of(activation_config)
+        self.write(self.writer._write_wfmx, 'patched', self.analog_samples, digital_samples)
+
+        changed_analog = self.analog_samples.copy()
+        changed_digital = digital_samples.copy()
+        changed_analog[:, 400:500] = 0.25
+        changed_digital[:, 400:500] = ~changed_digital[:, 400:500]
+        self.writer._patch_wfmx('patched', changed_analog[:, 400:500],
+                                changed_digital[:, 400:500], self.number_of_samples, 400)
+
+        expected = self.write(self.writer._write_wfmx, 'expected', changed_analog,
+                              changed_digital)
+        for suffix in expected:
+            with open(os.path.join(self.writer.waveform_dir, 'patched' + suffix), 'rb') as file:
+                self.assertEqual(file.read(), expected[suffix])
+
+    def test_patch_file_with_markers(self):
+        self.check_patch(['a_ch1', 'd_ch1', 'd_ch2', 'a_ch2', 'd_ch3'])
+
+    def test_patch_file_without_markers(self):
+        self.check_patch(['a_ch1', 'a_ch2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
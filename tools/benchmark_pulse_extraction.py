@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the run time and the result of the ungated laser pulse extraction methods on synthetic
+timetraces. Run it from the qudi directory: python tools/benchmark_pulse_extraction.py
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from logic.pulse_extraction_logic import PulseExtractionLogic
+
+
+def make_timetrace(number_of_bins, number_of_lasers, weak_amplitude=1.0, seed=0):
+    """ Create a Poisson distributed timetrace of equally spaced laser pulses with a fluorescence
+    decay at the beginning of each pulse. Every second pulse is scaled by weak_amplitude.
+
+    @return tuple: (timetrace, bin indices of the rising edges)
+    """
+    random = np.random.RandomState(seed)
+    period = number_of_bins // number_of_lasers
+    laser_length = period // 3
+    rate = np.full(number_of_bins, 0.05)
+    rising_edges = np.arange(number_of_lasers) * period + period // 5
+    for laser_index, start in enumerate(rising_edges):
+        amplitude = weak_amplitude if laser_index % 2 else 1.0
+        rate[start:start + laser_length] = amplitude * (
+            1.0 + 0.3 * np.exp(-np.arange(laser_length) / 50))
+    return random.poisson(rate * 20), rising_edges
+
+
+def match_offset(timetrace, edge, pulse_start, max_offset):
+    """ Find the offset of the first bins of an extracted pulse from a true rising edge.
+
+    @return int: the offset in bins, None if the pulse does not start near the edge
+    """
+    for offset in range(-max_offset, max_offset + 1):
+        window = timetrace[edge + offset:edge + offset + pulse_start.size]
+        if window.size == pulse_start.size and np.array_equal(window, pulse_start):
+            return offset
+    return None
+
+
+def main():
+    extraction = PulseExtractionLogic(manager=None, name='pulse_extraction', config={})
+    conv_std_dev = 10
+    print('bins      lasers  weak  method          time (s)  lasers found  max edge error (bins)')
+    for number_of_bins, number_of_lasers in ((10**5, 10), (10**6, 100), (10**7, 1000)):
+        for weak_amplitude in (1.0, 0.2):
+            timetrace, rising_edges = make_timetrace(number_of_bins, number_of_lasers,
+                                                     weak_amplitude)
+            for method_name, method in extraction.ungated_extraction_methods.items():
+                start_time = time.perf_counter()
+                laser_arr = method(timetrace, conv_std_dev, number_of_lasers)
+                run_time = time.perf_counter() - start_time
+                # Match the first bins of each extracted pulse with the timetrace around the true
+                # rising edges. The pulses are sorted, so missed pulses are skipped in order.
+                found = 0
+                edge_error = 0
+                edge_index = 0
+                for pulse in laser_arr:
+                    pulse_start = pulse[:2 * conv_std_dev]
+                    if pulse_start.size == 0 or not np.any(pulse):
+                        continue
+                    for candidate in range(edge_index, min(edge_index + 10, rising_edges.size)):
+                        offset = match_offset(timetrace, rising_edges[candidate], pulse_start,
+                                              5 * conv_std_dev)
+                        if offset is not None:
+                            found += 1
+                            edge_error = max(edge_error, abs(offset))
+                            edge_index = candidate + 1
+                            break
+                print('{0:<9d} {1:<7d} {2:<5.1f} {3:<15s} {4:<9.3f} {5:<13d} {6:d}'
+                      ''.format(number_of_bins, number_of_lasers, weak_amplitude, method_name,
+                                run_time, found, edge_error))
+
+
+if __name__ == '__main__':
+    main()